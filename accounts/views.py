@@ -374,14 +374,15 @@ def profile_view(request):
     staff_metrics = None
     if _is_staff_user(request.user):
         from django.db.models import Sum
-        from sales.models import Sale
+        from sales.models import DailyShopSales, Sale
 
-        sales_queryset = Sale.objects.filter(cashier=request.user, is_cancelled=False)
-        sales_total = sales_queryset.aggregate(total=Sum('total'))
-        last_sale = sales_queryset.order_by('-sale_date').first()
+        sales_totals = DailyShopSales.objects.filter(cashier=request.user).aggregate(
+            count=Sum('sale_count'), total=Sum('revenue'),
+        )
+        last_sale = Sale.objects.filter(cashier=request.user, is_cancelled=False).order_by('-sale_date').first()
         staff_metrics = {
-            'sales_count': sales_queryset.count(),
-            'sales_total': sales_total.get('total') or 0,
+            'sales_count': sales_totals['count'] or 0,
+            'sales_total': sales_totals['total'] or 0,
             'last_sale': last_sale,
         }
 
@@ -404,27 +405,29 @@ def cashier_dashboard_view(request, cashier_id):
     if not cashier.groups.filter(name='Cashier').exists() and not cashier.is_staff:
         messages.warning(request, "Cet utilisateur n'est pas un caissier.")
 
-    from sales.models import Sale
+    from django.db.models import Q, Sum
+    from sales.models import DailyShopSales, Sale
     from .models import UserActivity
 
-    today = timezone.now().date()
+    today = timezone.localdate()
     start_of_week = today - timedelta(days=today.weekday())
     start_of_month = today.replace(day=1)
 
-    sales_today = Sale.objects.filter(cashier=cashier, sale_date__date=today)
-    sales_week = Sale.objects.filter(cashier=cashier, sale_date__date__gte=start_of_week)
-    sales_month = Sale.objects.filter(cashier=cashier, sale_date__date__gte=start_of_month)
-
-    total_today = sum(s.total for s in sales_today)
-    total_week = sum(s.total for s in sales_week)
-    total_month = sum(s.total for s in sales_month)
+    # Une requête sur les agrégats journaliers pour les trois périodes
+    periods = {'today': today, 'week': start_of_week, 'month': start_of_month}
+    aggregates = {}
+    for name, start in periods.items():
+        aggregates[f'{name}_count'] = Sum('sale_count', filter=Q(date__gte=start))
+        aggregates[f'{name}_total'] = Sum('revenue', filter=Q(date__gte=start))
+    totals = DailyShopSales.objects.filter(
+        cashier=cashier, date__gte=min(periods.values()), date__lte=today,
+    ).aggregate(**aggregates)
 
     context = {
         'cashier': cashier,
         'stats': {
-            'today': {'count': sales_today.count(), 'total': total_today},
-            'week': {'count': sales_week.count(), 'total': total_week},
-            'month': {'count': sales_month.count(), 'total': total_month},
+            name: {'count': totals[f'{name}_count'] or 0, 'total': totals[f'{name}_total'] or 0}
+            for name in periods
         },
         'activities': UserActivity.objects.filter(user=cashier)[:50],
         'recent_sales': Sale.objects.filter(cashier=cashier).order_by('-sale_date')[:10],
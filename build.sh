@@ -22,6 +22,8 @@ python manage.py showmigrations
 # Run migrations with verbose output (BEFORE collectstatic)
 echo "🔄 Running database migrations..."
 python manage.py migrate --verbosity 2
+python manage.py createcachetable
+python manage.py rebuild_effective_prices
 
 # Collect static files (AFTER migrations)
 echo "📁 Collecting static files..."
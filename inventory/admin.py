@@ -1,3 +1,23 @@
+# inventory/admin.py
+
 from django.contrib import admin
+from .models import StockMovement
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    """Journal en lecture seule : une correction passe par un ajustement."""
+    list_display = ['created_at', 'product', 'quantity', 'reason', 'reference', 'shop']
+    list_filter = ['reason', 'shop', 'created_at']
+    search_fields = ['product__name', 'reference']
+    list_select_related = ['product', 'shop']
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
-# Register your models here.
+    def has_delete_permission(self, request, obj=None):
+        return False
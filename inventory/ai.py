@@ -1,66 +1,132 @@
 from datetime import timedelta
 from django.utils import timezone
-from django.db.models import Sum, F
-from sales.models import SaleItem, Sale
+from django.db.models import Sum
+from sales.models import DailyProductSales
 
 class StockBrain:
     """
     Le Cerveau : Système de prédiction de stock
     Analyse les ventes passées pour prédire les ruptures futures.
+
+    Les ventes de toute la boutique sont lues en une seule requête groupée
+    par produit sur les agrégats journaliers ; l'analyse d'un produit n'est
+    qu'une lecture de ce résultat.
+
+    La vitesse de vente vient du moteur de prévision (inventory/forecasting.py,
+    saisonnalité par jour de la semaine) ; sans NumPy, ou avec forecast=False,
+    c'est la moyenne plate de la période. Avec la prévision, les jours restants
+    consomment le stock jour par jour (un week-end chargé rapproche la
+    rupture) au lieu de le diviser par la vitesse moyenne.
     """
-    
-    def __init__(self, shop, analysis_period_days=30):
+
+    NO_STOCKOUT = 999  # Infini par défaut (aucune vente sur la période)
+
+    def __init__(self, shop, analysis_period_days=30, forecast=True, model=None):
         self.shop = shop
         self.days = analysis_period_days
         self.now = timezone.now()
-        
+        self.use_forecast = forecast
+        self.model = model
+        self._sold = None
+
+    def sold_quantities(self):
+        """
+        {product_id: quantité vendue sur la période} pour toute la boutique,
+        calculé une fois (une requête) puis gardé sur l'instance.
+        """
+        if self._sold is None:
+            # Les `days` derniers jours, aujourd'hui compris (agrégats journaliers)
+            start_date = timezone.localdate(self.now) - timedelta(days=self.days - 1)
+            self._sold = dict(
+                DailyProductSales.objects.filter(
+                    shop=self.shop,
+                    date__gte=start_date,
+                )
+                .values('product_id')
+                .annotate(total=Sum('quantity'))
+                .values_list('product_id', 'total')
+            )
+        return self._sold
+
+    def analyze_products(self, products):
+        """
+        Analyse une liste de produits en une passe sur les colonnes
+        (vélocité, jours restants, rupture, risque).
+        """
+        products = list(products)
+        forecast = self._demand_forecast(products)
+        if forecast is not None:
+            plans = [forecast.for_product(product.id) for product in products]
+            velocities = [plan['daily_velocity'] for plan in plans]
+        else:
+            sold = self.sold_quantities()
+            plans = [{} for _ in products]
+            velocities = [(sold.get(product.id) or 0) / self.days for product in products]
+
+        stocks = [product.current_stock for product in products]
+        if forecast is not None:
+            cover = forecast.days_of_cover({product.id: stock for product, stock in zip(products, stocks)})
+            days_left = [
+                cover[product.id] if cover[product.id] != float('inf') else self.NO_STOCKOUT
+                for product in products
+            ]
+        else:
+            days_left = [
+                stock / velocity if velocity > 0 else self.NO_STOCKOUT
+                for stock, velocity in zip(stocks, velocities)
+            ]
+        stockout_dates = [
+            self.now + timedelta(days=days) if days != self.NO_STOCKOUT else None
+            for days in days_left
+        ]
+        risks = [self._risk_level(stock, days) for stock, days in zip(stocks, days_left)]
+
+        return [
+            {
+                'product': product,
+                'current_stock': stock,
+                'velocity': round(velocity, 2),
+                'days_left': round(days, 1) if days != self.NO_STOCKOUT else "∞",
+                'stockout_date': stockout_date,
+                'risk_level': risk_level,
+                'recommendation': self._get_recommendation(risk_level, velocity),
+                'safety_stock': round(plan['safety_stock'], 1) if plan else None,
+                'reorder_point': round(plan['reorder_point'], 1) if plan else None,
+            }
+            for product, stock, velocity, days, stockout_date, risk_level, plan
+            in zip(products, stocks, velocities, days_left, stockout_dates, risks, plans)
+        ]
+
+    def _demand_forecast(self, products):
+        if not self.use_forecast or not products:
+            return None
+        try:
+            from .forecasting import DemandForecast
+        except ImportError:
+            return None
+        return DemandForecast(self.shop, model=self.model, history_days=self.days).fit(
+            products, end_date=timezone.localdate(self.now) + timedelta(days=1),
+        )
+
     def analyze_product(self, product):
         """
         Analyse un produit unique et retourne ses métriques prédictives.
         """
-        # 1. Calculer les ventes sur la période (ex: 30 derniers jours)
-        start_date = self.now - timedelta(days=self.days)
-        
-        # NOTE: product is already shop-filtered by caller, so we implicitly trust it.
-        # But SaleItem query ensures we only look at relevant sales data.
-        total_sold = SaleItem.objects.filter(
-            product=product,
-            sale__sale_date__gte=start_date
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-        
-        # 2. Calculer la vélocité (Vitesse de vente par jour)
-        daily_velocity = total_sold / self.days
-        
-        # 3. Prédire la date de rupture
-        current_stock = product.current_stock
-        days_left = 999  # Infini par défaut
-        stockout_date = None
-        
-        if daily_velocity > 0:
-            days_left = current_stock / daily_velocity
-            stockout_date = self.now + timedelta(days=days_left)
-            
-        # 4. Statut de risque
-        risk_level = 'LOW' # LOW, MEDIUM, HIGH, CRITICAL
+        return self.analyze_products([product])[0]
+
+    @staticmethod
+    def _risk_level(current_stock, days_left):
+        # LOW, MEDIUM, HIGH, CRITICAL
         if current_stock <= 0:
-            risk_level = 'OUT_OF_STOCK'
+            return 'OUT_OF_STOCK'
         elif days_left < 3:
-            risk_level = 'CRITICAL'
+            return 'CRITICAL'
         elif days_left < 7:
-            risk_level = 'HIGH'
+            return 'HIGH'
         elif days_left < 14:
-            risk_level = 'MEDIUM'
-            
-        return {
-            'product': product,
-            'current_stock': current_stock,
-            'velocity': round(daily_velocity, 2),
-            'days_left': round(days_left, 1) if days_left != 999 else "∞",
-            'stockout_date': stockout_date,
-            'risk_level': risk_level,
-            'recommendation': self._get_recommendation(risk_level, daily_velocity)
-        }
-    
+            return 'MEDIUM'
+        return 'LOW'
+
     def _get_recommendation(self, risk_level, velocity):
         if risk_level == 'OUT_OF_STOCK':
             return "Commander URGEMMENT"
@@ -79,18 +145,17 @@ class StockBrain:
         from products.models import Product
         # Filter by shop
         products = Product.objects.filter(shop=self.shop, is_active=True)
-        analysis = []
-        
-        for p in products:
-            data = self.analyze_product(p)
-            # On ne garde que ceux qui ont une activité ou un stock critique
-            if data['velocity'] > 0 or data['current_stock'] < 5:
-                analysis.append(data)
-                
+
+        # On ne garde que ceux qui ont une activité ou un stock critique
+        analysis = [
+            data for data in self.analyze_products(products)
+            if data['velocity'] > 0 or data['current_stock'] < 5
+        ]
+
         # Trier par urgence (jours restants croissant)
         # On gère le cas "∞" pour le tri
         def sort_key(x):
             val = x['days_left']
             return 999999 if val == "∞" else val
-            
+
         return sorted(analysis, key=sort_key)
@@ -0,0 +1,264 @@
+"""
+Prévision de la demande (moteur du Cerveau).
+
+Les ventes sont chargées en une matrice NumPy produits × jours (une lecture
+des agrégats DailyProductSales), puis chaque modèle est ajusté pour tous les
+produits à la fois : la boucle ne porte que sur les jours, chaque pas est une
+opération sur le vecteur des produits.
+
+Modèles disponibles (interface commune `fit(matrice)` / `forecast(horizon)`) :
+- MovingAverage : moyenne plate de la période (ancien calcul du Cerveau) ;
+- SimpleExponentialSmoothing : lissage exponentiel simple ;
+- HoltWinters : niveau + tendance (optionnelle) + saisonnalité additive par
+  jour de la semaine.
+
+DemandForecast en déduit, par produit, la prévision, le stock de sécurité et
+le point de commande.
+"""
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.utils import timezone
+
+from sales.models import DailyProductSales
+
+
+WEEK = 7
+
+
+def daily_sales_matrix(shop, product_ids, end_date, days):
+    """
+    Matrice float (len(product_ids) × days) des quantités vendues par jour,
+    jusqu'à `end_date` exclu. Une seule lecture des agrégats journaliers.
+    """
+    start_date = end_date - timedelta(days=days)
+    matrix = np.zeros((len(product_ids), days))
+    rows = {product_id: row for row, product_id in enumerate(product_ids)}
+
+    sales = DailyProductSales.objects.filter(
+        shop=shop,
+        date__gte=start_date,
+        date__lt=end_date,
+    ).values_list('product_id', 'date', 'quantity')
+    for product_id, day, total in sales:
+        row = rows.get(product_id)
+        if row is not None:
+            matrix[row, (day - start_date).days] = total
+    return matrix
+
+
+class Forecaster(ABC):
+    """
+    Modèle de prévision vectorisé.
+    `fit` reçoit la matrice produits × jours ; `residual_std` contient ensuite
+    l'écart type des erreurs de prévision à un jour, par produit.
+    """
+
+    @abstractmethod
+    def fit(self, history):
+        """Ajuste le modèle sur la matrice produits × jours ; retourne self."""
+
+    @abstractmethod
+    def forecast(self, horizon):
+        """Matrice produits × horizon des ventes prévues (jamais négatives)."""
+
+    @staticmethod
+    def _residual_std(errors, skip=0):
+        errors = errors[:, skip:]
+        if errors.shape[1] < 2:
+            return np.zeros(errors.shape[0])
+        return errors.std(axis=1, ddof=1)
+
+
+class MovingAverage(Forecaster):
+    """Moyenne plate sur tout l'historique."""
+
+    def fit(self, history):
+        self.mean = history.mean(axis=1) if history.shape[1] else np.zeros(history.shape[0])
+        self.residual_std = self._residual_std(history - self.mean[:, None])
+        return self
+
+    def forecast(self, horizon):
+        return np.repeat(self.mean[:, None], horizon, axis=1)
+
+
+class SimpleExponentialSmoothing(Forecaster):
+    """Lissage exponentiel simple : les ventes récentes pèsent plus (alpha)."""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+
+    def fit(self, history):
+        n_products, n_days = history.shape
+        level = history[:, :WEEK].mean(axis=1) if n_days else np.zeros(n_products)
+        errors = np.zeros((n_products, n_days))
+        for day in range(n_days):
+            errors[:, day] = history[:, day] - level
+            level = level + self.alpha * errors[:, day]
+        self.level = level
+        self.residual_std = self._residual_std(errors, skip=min(WEEK, n_days))
+        return self
+
+    def forecast(self, horizon):
+        return np.repeat(np.maximum(self.level, 0)[:, None], horizon, axis=1)
+
+
+class HoltWinters(Forecaster):
+    """
+    Holt-Winters additif, saison de 7 jours alignée sur le calendrier :
+    le samedi de l'historique et le samedi prévu partagent le même coefficient.
+    beta=0 désactive la tendance (lissage exponentiel saisonnier).
+    """
+
+    def __init__(self, alpha=0.1, beta=0.0, gamma=0.1, damping=0.9):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.damping = damping
+
+    def fit(self, history, start_weekday=0):
+        """`start_weekday` : jour de la semaine (0 = lundi) de la première colonne."""
+        n_products, n_days = history.shape
+        self.start_weekday = start_weekday
+        self.n_days = n_days
+
+        # Initialisation sur les semaines complètes disponibles (4 au plus)
+        weeks = max(min(n_days // WEEK, 4), 1)
+        warmup = history[:, :weeks * WEEK]
+        level = warmup.mean(axis=1) if warmup.shape[1] else np.zeros(n_products)
+        seasonal = np.zeros((n_products, WEEK))
+        for position in range(min(WEEK, warmup.shape[1])):
+            weekday = (start_weekday + position) % WEEK
+            seasonal[:, weekday] = warmup[:, position::WEEK].mean(axis=1) - level
+        trend = np.zeros(n_products)
+
+        errors = np.zeros((n_products, n_days))
+        for day in range(n_days):
+            weekday = (start_weekday + day) % WEEK
+            season = seasonal[:, weekday]
+            predicted = level + self.damping * trend + season
+            errors[:, day] = history[:, day] - predicted
+            previous_level = level
+            level = level + self.damping * trend + self.alpha * errors[:, day]
+            trend = self.damping * trend + self.beta * (level - previous_level - self.damping * trend)
+            seasonal[:, weekday] = season + self.gamma * (history[:, day] - level - season)
+
+        self.level, self.trend, self.seasonal = level, trend, seasonal
+        self.residual_std = self._residual_std(errors, skip=min(WEEK, n_days))
+        return self
+
+    def forecast(self, horizon):
+        steps = np.arange(1, horizon + 1)
+        # Tendance amortie : somme des damping^k, k = 1..h
+        damped = np.cumsum(self.damping ** steps)
+        weekdays = (self.start_weekday + self.n_days + steps - 1) % WEEK
+        forecast = self.level[:, None] + self.trend[:, None] * damped[None, :] + self.seasonal[:, weekdays]
+        return np.maximum(forecast, 0)
+
+
+def fit_model(model, history, start_date):
+    """Ajuste le modèle ; seuls les modèles saisonniers utilisent le calendrier."""
+    if isinstance(model, HoltWinters):
+        return model.fit(history, start_weekday=start_date.weekday())
+    return model.fit(history)
+
+
+def _crossing_day(forecast, target):
+    """
+    Jours (fractionnaires) avant que la demande cumulée de chaque ligne de
+    `forecast` atteigne `target` ; les lignes doivent l'atteindre.
+    """
+    cumulative = forecast.cumsum(axis=1)
+    day = np.argmax(cumulative >= target[:, None] - 1e-9, axis=1)
+    rows = np.arange(forecast.shape[0])
+    before = np.where(day > 0, cumulative[rows, np.maximum(day - 1, 0)], 0.0)
+    demand = forecast[rows, day]
+    return day + np.divide(target - before, demand, out=np.ones_like(target), where=demand > 0)
+
+
+def days_of_cover(stock, forecast, period=WEEK):
+    """
+    Jours avant rupture : le stock est consommé jour par jour par la
+    prévision (un samedi chargé compte plus qu'un mardi calme), puis, au-delà
+    de l'horizon, par la répétition de sa dernière semaine. Infini sans
+    demande prévue, 0 sans stock.
+    """
+    stock = np.asarray(stock, dtype=float)
+    forecast = np.clip(np.asarray(forecast, dtype=float), 0, None)
+    days = np.full(stock.shape, np.inf)
+    days[stock <= 0] = 0.0
+
+    horizon_total = forecast.sum(axis=1)
+    within = (stock > 0) & (horizon_total >= stock)
+    if within.any():
+        days[within] = _crossing_day(forecast[within], stock[within])
+
+    cycle = forecast[:, -period:]
+    cycle_total = cycle.sum(axis=1)
+    beyond = (stock > 0) & ~within & (cycle_total > 0)
+    if beyond.any():
+        remaining = stock[beyond] - horizon_total[beyond]
+        cycles = np.floor(remaining / cycle_total[beyond])
+        rest = remaining - cycles * cycle_total[beyond]
+        days[beyond] = forecast.shape[1] + cycles * cycle.shape[1]
+        partial = rest > 1e-9
+        if partial.any():
+            days[np.flatnonzero(beyond)[partial]] += _crossing_day(cycle[beyond][partial], rest[partial])
+    return days
+
+
+class DemandForecast:
+    """
+    Prévision, stock de sécurité et point de commande de tous les produits
+    d'une boutique.
+
+    Usage:
+        forecast = DemandForecast(shop).fit(products)
+        forecast.for_product(product.id)['reorder_point']
+
+    Stock de sécurité = z(niveau de service) × σ(erreur à un jour) × √délai.
+    Point de commande = demande prévue pendant le délai + stock de sécurité.
+    """
+
+    def __init__(self, shop, model=None, history_days=56, lead_time_days=7, service_level=0.95, horizon_days=14):
+        self.shop = shop
+        self.model = model or HoltWinters()
+        self.history_days = history_days
+        self.lead_time_days = lead_time_days
+        self.service_level = service_level
+        self.horizon_days = max(horizon_days, lead_time_days)
+        self.rows = {}
+
+    def fit(self, products, end_date=None):
+        product_ids = [product.id if hasattr(product, 'id') else product for product in products]
+        end_date = end_date or timezone.localdate() + timedelta(days=1)
+        start_date = end_date - timedelta(days=self.history_days)
+        history = daily_sales_matrix(self.shop, product_ids, end_date, self.history_days)
+
+        fit_model(self.model, history, start_date)
+        self.forecast = self.model.forecast(self.horizon_days)
+        z = NormalDist().inv_cdf(self.service_level)
+        self.lead_time_demand = self.forecast[:, :self.lead_time_days].sum(axis=1)
+        self.safety_stock = z * self.model.residual_std * np.sqrt(self.lead_time_days)
+        self.reorder_point = self.lead_time_demand + self.safety_stock
+        self.rows = {product_id: row for row, product_id in enumerate(product_ids)}
+        return self
+
+    def days_of_cover(self, stocks):
+        """Jours avant rupture de chaque produit : stocks = {product_id: stock}."""
+        product_ids = list(stocks)
+        rows = [self.rows[product_id] for product_id in product_ids]
+        days = days_of_cover([stocks[product_id] for product_id in product_ids], self.forecast[rows])
+        return dict(zip(product_ids, days.tolist()))
+
+    def for_product(self, product_id):
+        row = self.rows[product_id]
+        return {
+            'forecast': [round(float(value), 2) for value in self.forecast[row]],
+            'daily_velocity': float(self.forecast[row].mean()),
+            'lead_time_demand': float(self.lead_time_demand[row]),
+            'safety_stock': float(self.safety_stock[row]),
+            'reorder_point': float(self.reorder_point[row]),
+        }
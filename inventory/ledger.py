@@ -0,0 +1,199 @@
+"""
+Journal de stock (StockMovement) et instantanés (StockSnapshot).
+
+Chaque écriture de StockService ajoute ses mouvements au journal en un
+`bulk_create`, dans la même transaction que l'UPDATE du stock :
+Product.current_stock n'est qu'un cache de la somme du journal.
+
+Stock à une date = dernier instantané antérieur + mouvements suivants.
+`take_snapshots` (commande `snapshot_stock`, à lancer chaque nuit) borne
+ainsi la lecture à quelques mouvements par produit ; `reconcile_stock`
+compare le cache au journal.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from products.models import Product
+from .models import StockMovement, StockSnapshot
+
+
+# Un instantané ne couvre que les mouvements plus anciens que ce délai :
+# un mouvement encore dans une transaction ouverte (id attribué, pas encore
+# visible) ne doit pas passer sous le dernier id d'un instantané.
+SNAPSHOT_SETTLE_DELAY = timedelta(minutes=5)
+
+
+def record_movements(deltas, shops, reason, reference='', moment=None):
+    """
+    Ajoute au journal les variations {product_id: delta}.
+    `shops` : {product_id: shop_id}. À appeler dans la transaction qui
+    modifie current_stock.
+    """
+    moment = moment or timezone.now()
+    movements = [
+        StockMovement(
+            shop_id=shops.get(product_id),
+            product_id=product_id,
+            quantity=delta,
+            reason=reason,
+            reference=reference[:100],
+            created_at=moment,
+        )
+        for product_id, delta in deltas.items()
+        if delta
+    ]
+    return StockMovement.objects.bulk_create(movements)
+
+
+def _latest_snapshots(product_ids, before=None):
+    """{product_id: dernier StockSnapshot (antérieur à `before`)} en deux requêtes."""
+    snapshots = StockSnapshot.objects.filter(product=OuterRef('pk'))
+    if before is not None:
+        snapshots = snapshots.filter(taken_at__lt=before)
+    latest = (
+        Product.objects.filter(id__in=product_ids)
+        .annotate(snapshot_id=Subquery(snapshots.order_by('-taken_at', '-id').values('id')[:1]))
+        .exclude(snapshot_id=None)
+        .values_list('snapshot_id', flat=True)
+    )
+    return {snapshot.product_id: snapshot for snapshot in StockSnapshot.objects.filter(id__in=list(latest))}
+
+
+def _fold(product_ids, snapshots, before=None, last_ids=None):
+    """
+    Stock par produit = instantané + mouvements d'id supérieur à son
+    dernier mouvement inclus (et antérieurs à `before` / d'id au plus
+    `last_ids[product_id]`). Une lecture des mouvements depuis le plus
+    ancien instantané du lot.
+    """
+    balances = {product_id: 0 for product_id in product_ids}
+    floors = {product_id: 0 for product_id in product_ids}
+    for product_id, snapshot in snapshots.items():
+        balances[product_id] = snapshot.stock
+        floors[product_id] = snapshot.last_movement_id
+
+    movements = StockMovement.objects.filter(product_id__in=product_ids, id__gt=min(floors.values(), default=0))
+    if before is not None:
+        movements = movements.filter(created_at__lt=before)
+    if last_ids:
+        movements = movements.filter(id__lte=max(last_ids.values()))
+    for product_id, movement_id, quantity in movements.values_list('product_id', 'id', 'quantity'):
+        if movement_id <= floors[product_id]:
+            continue
+        if last_ids is not None and movement_id > last_ids.get(product_id, 0):
+            continue
+        balances[product_id] += quantity
+    return balances
+
+
+def stock_at(product_ids, moment=None):
+    """
+    {product_id: stock} d'après le journal, juste avant `moment`
+    (maintenant par défaut).
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    return _fold(product_ids, _latest_snapshots(product_ids, before=moment), before=moment)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def daily_stock(product, start_date, end_date):
+    """
+    [(jour, stock en fin de journée), ...] de start_date à end_date inclus :
+    le stock d'ouverture puis un parcours des mouvements de la période.
+    """
+    start = day_start(start_date)
+    end = day_start(end_date + timedelta(days=1))
+    stock = stock_at([product.id], moment=start)[product.id]
+
+    changes = defaultdict(int)
+    movements = StockMovement.objects.filter(
+        product=product, created_at__gte=start, created_at__lt=end,
+    ).values_list('created_at', 'quantity')
+    for created_at, quantity in movements:
+        changes[timezone.localdate(created_at)] += quantity
+
+    levels = []
+    day = start_date
+    while day <= end_date:
+        stock += changes.get(day, 0)
+        levels.append((day, stock))
+        day += timedelta(days=1)
+    return levels
+
+
+@transaction.atomic
+def take_snapshots(shop=None, moment=None):
+    """
+    Arrête le stock des produits qui ont bougé depuis leur dernier
+    instantané. Retourne le nombre d'instantanés créés.
+    """
+    moment = moment or timezone.now() - SNAPSHOT_SETTLE_DELAY
+    movements = StockMovement.objects.filter(created_at__lt=moment)
+    if shop is not None:
+        movements = movements.filter(product__shop=shop)
+    last_ids = dict(
+        movements.values('product_id').annotate(last_id=Max('id')).values_list('product_id', 'last_id')
+    )
+    snapshots = _latest_snapshots(list(last_ids))
+    last_ids = {
+        product_id: last_id
+        for product_id, last_id in last_ids.items()
+        if product_id not in snapshots or snapshots[product_id].last_movement_id < last_id
+    }
+    if not last_ids:
+        return 0
+
+    snapshots = {product_id: snapshots[product_id] for product_id in last_ids if product_id in snapshots}
+    balances = _fold(list(last_ids), snapshots, last_ids=last_ids)
+    shops = dict(Product.objects.filter(id__in=list(last_ids)).values_list('id', 'shop_id'))
+    StockSnapshot.objects.bulk_create(
+        [
+            StockSnapshot(
+                shop_id=shops.get(product_id),
+                product_id=product_id,
+                stock=balances[product_id],
+                last_movement_id=last_id,
+                taken_at=moment,
+            )
+            for product_id, last_id in last_ids.items()
+        ],
+        batch_size=1000,
+    )
+    return len(last_ids)
+
+
+@transaction.atomic
+def find_drift(shop=None, fix=False):
+    """
+    [(product, stock en cache, stock du journal), ...] des produits dont
+    current_stock ne correspond pas au journal. Les produits sont
+    verrouillés le temps de la comparaison (aucune vente ne s'intercale).
+    Avec fix=True, current_stock est recalculé depuis le journal.
+    """
+    products = Product.objects.select_for_update().only('id', 'name', 'shop', 'current_stock').order_by('id')
+    if shop is not None:
+        products = products.filter(shop=shop)
+    products = list(products)
+    balances = stock_at([product.id for product in products])
+
+    drift = [
+        (product, product.current_stock, balances[product.id])
+        for product in products
+        if product.current_stock != balances[product.id]
+    ]
+    if fix:
+        for product, _, balance in drift:
+            Product.objects.filter(pk=product.pk).update(current_stock=balance)
+        if drift:
+            from .services import StockService
+            StockService._invalidate_catalog_stock()
+    return drift
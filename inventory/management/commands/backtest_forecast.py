@@ -0,0 +1,96 @@
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import Shop
+from inventory.forecasting import (
+    HoltWinters,
+    MovingAverage,
+    SimpleExponentialSmoothing,
+    daily_sales_matrix,
+    fit_model,
+)
+from products.models import Product
+
+
+MODELS = {
+    'moyenne': MovingAverage,
+    'lissage': SimpleExponentialSmoothing,
+    'holt-winters': HoltWinters,
+}
+
+
+def mape(actual, predicted):
+    """
+    MAPE (%) jour par jour : un total de l'horizon juste peut cacher un samedi
+    sous-estimé et un mardi surestimé, c'est l'erreur que le Cerveau subit.
+    Les jours sans vente sont exclus (erreur relative non définie).
+    """
+    sold = actual > 0
+    if not sold.any():
+        return None
+    return float(np.mean(np.abs(actual[sold] - predicted[sold]) / actual[sold]) * 100)
+
+
+def mae(actual, predicted):
+    """Erreur absolue moyenne par produit et par jour (en unités)."""
+    if not actual.size:
+        return None
+    return float(np.mean(np.abs(actual - predicted)))
+
+
+def synthetic_history(products, days, seed=42):
+    """Ventes factices : demande de Poisson avec un motif hebdomadaire par produit."""
+    rng = np.random.default_rng(seed)
+    base = rng.gamma(shape=1.5, scale=2.0, size=(products, 1))
+    weekly = 1 + rng.uniform(0, 0.8, size=(products, 7)) * (np.arange(7) >= 4)
+    pattern = np.tile(weekly, days // 7 + 1)[:, :days]
+    return rng.poisson(base * pattern).astype(float)
+
+
+class Command(BaseCommand):
+    help = "Évalue les modèles de prévision (MAPE et MAE journaliers sur les derniers jours de l'historique) et leur durée"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help='Boutique à évaluer (id)')
+        parser.add_argument('--history', type=int, default=56, help="Jours d'historique pour l'ajustement")
+        parser.add_argument('--horizon', type=int, default=7, help='Jours prévus puis comparés aux ventes réelles')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Nombre de produits factices (ex. 10000) au lieu des ventes réelles')
+
+    def handle(self, *args, **options):
+        history_days, horizon = options['history'], options['horizon']
+        days = history_days + horizon
+
+        if options['synthetic']:
+            matrix = synthetic_history(options['synthetic'], days)
+            start_date = timezone.localdate() - timedelta(days=days)
+            source = f"{options['synthetic']} produits factices"
+        else:
+            if not options['shop']:
+                raise CommandError("Indiquer --shop ou --synthetic")
+            try:
+                shop = Shop.objects.get(pk=options['shop'])
+            except Shop.DoesNotExist:
+                raise CommandError(f"Boutique {options['shop']} introuvable")
+            product_ids = list(Product.objects.filter(shop=shop, is_active=True).values_list('id', flat=True))
+            end_date = timezone.localdate()
+            start_date = end_date - timedelta(days=days)
+            matrix = daily_sales_matrix(shop, product_ids, end_date, days)
+            source = f"{len(product_ids)} produits de « {shop.name} »"
+
+        train, actual = matrix[:, :history_days], matrix[:, history_days:]
+        self.stdout.write(f"{source} · {history_days} j d'historique · horizon {horizon} j")
+        self.stdout.write(f"{'modèle':<16}{'MAPE (%)':>10}{'MAE':>8}{'durée (ms)':>12}")
+        for name, model_class in MODELS.items():
+            start = time.perf_counter()
+            model = fit_model(model_class(), train, start_date)
+            predicted = model.forecast(horizon)
+            elapsed = (time.perf_counter() - start) * 1000
+            error, absolute = mape(actual, predicted), mae(actual, predicted)
+            error_display = f"{error:>10.1f}" if error is not None else f"{'-':>10}"
+            absolute_display = f"{absolute:>8.2f}" if absolute is not None else f"{'-':>8}"
+            self.stdout.write(f"{name:<16}{error_display}{absolute_display}{elapsed:>12.1f}")
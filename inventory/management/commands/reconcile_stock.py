@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Shop
+from inventory.ledger import find_drift
+
+
+class Command(BaseCommand):
+    help = "Compare Product.current_stock au journal des mouvements et signale les écarts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help='Limiter à une boutique (id)')
+        parser.add_argument('--fix', action='store_true',
+                            help='Recalculer current_stock depuis le journal pour les produits en écart')
+
+    def handle(self, *args, **options):
+        shop = None
+        if options['shop']:
+            try:
+                shop = Shop.objects.get(pk=options['shop'])
+            except Shop.DoesNotExist:
+                raise CommandError(f"Boutique {options['shop']} introuvable")
+
+        drift = find_drift(shop=shop, fix=options['fix'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("✅ Stock conforme au journal"))
+            return
+
+        for product, cached, ledger in drift:
+            self.stdout.write(
+                f"#{product.id} {product.name} : stock {cached}, journal {ledger} (écart {cached - ledger:+d})"
+            )
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(drift)} produit(s) recalé(s) sur le journal"))
+        else:
+            self.stdout.write(self.style.WARNING(f"⚠️ {len(drift)} produit(s) en écart (--fix pour corriger)"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Shop
+from inventory.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Arrête le stock des produits qui ont bougé depuis leur dernier instantané (à lancer chaque nuit)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help='Limiter à une boutique (id)')
+
+    def handle(self, *args, **options):
+        shop = None
+        if options['shop']:
+            try:
+                shop = Shop.objects.get(pk=options['shop'])
+            except Shop.DoesNotExist:
+                raise CommandError(f"Boutique {options['shop']} introuvable")
+        count = take_snapshots(shop=shop)
+        self.stdout.write(self.style.SUCCESS(f"✅ {count} instantané(s) de stock créé(s)"))
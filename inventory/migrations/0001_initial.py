@@ -0,0 +1,84 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    """Stock existant = mouvement « stock initial » + premier instantané."""
+    Product = apps.get_model('products', 'Product')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    StockSnapshot = apps.get_model('inventory', 'StockSnapshot')
+    now = django.utils.timezone.now()
+
+    products = Product.objects.exclude(current_stock=0).values_list('id', 'shop_id', 'current_stock')
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(
+                product_id=product_id, shop_id=shop_id, quantity=stock,
+                reason='opening', reference='Reprise du stock existant', created_at=now,
+            )
+            for product_id, shop_id, stock in products.iterator()
+        ],
+        batch_size=1000,
+    )
+    StockSnapshot.objects.bulk_create(
+        [
+            StockSnapshot(
+                product_id=product_id, shop_id=shop_id, stock=stock, last_movement_id=movement_id, taken_at=now,
+            )
+            for product_id, shop_id, stock, movement_id in StockMovement.objects.values_list(
+                'product_id', 'shop_id', 'quantity', 'id',
+            ).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0009_userprofile_address_and_more'),
+        ('products', '0018_product_search_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Variation')),
+                ('reason', models.CharField(choices=[('opening', 'Stock initial'), ('sale', 'Vente'), ('purchase', 'Réception achat'), ('cancellation', 'Annulation'), ('web_order', 'Commande en ligne'), ('adjustment', 'Ajustement manuel')], max_length=20, verbose_name='Motif')),
+                ('reference', models.CharField(blank=True, max_length=100, verbose_name='Référence')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Date')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.product', verbose_name='Produit')),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='accounts.shop', verbose_name='Boutique')),
+            ],
+            options={
+                'verbose_name': 'Mouvement de stock',
+                'verbose_name_plural': 'Mouvements de stock',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['product', 'created_at'], name='inventory_move_product_date'), models.Index(fields=['shop', 'created_at'], name='inventory_move_shop_date')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(verbose_name='Stock')),
+                ('last_movement_id', models.BigIntegerField(verbose_name='Dernier mouvement inclus')),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Date')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.product', verbose_name='Produit')),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='accounts.shop', verbose_name='Boutique')),
+            ],
+            options={
+                'verbose_name': 'Instantané de stock',
+                'verbose_name_plural': 'Instantanés de stock',
+                'indexes': [models.Index(fields=['product', 'taken_at'], name='inventory_snap_product_date')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
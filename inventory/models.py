@@ -1,3 +1,95 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+from accounts.models import Shop
+from products.models import Product
+
+
+class StockMovement(models.Model):
+    """
+    Journal des mouvements de stock (ajout seul, jamais modifié).
+    Product.current_stock est le cache de la somme de ce journal ;
+    `reconcile_stock` vérifie qu'ils concordent.
+    """
+
+    OPENING = 'opening'
+    SALE = 'sale'
+    PURCHASE = 'purchase'
+    CANCELLATION = 'cancellation'
+    WEB_ORDER = 'web_order'
+    ADJUSTMENT = 'adjustment'
+    REASON_CHOICES = [
+        (OPENING, 'Stock initial'),
+        (SALE, 'Vente'),
+        (PURCHASE, 'Réception achat'),
+        (CANCELLATION, 'Annulation'),
+        (WEB_ORDER, 'Commande en ligne'),
+        (ADJUSTMENT, 'Ajustement manuel'),
+    ]
+
+    shop = models.ForeignKey(
+        Shop,
+        on_delete=models.CASCADE,
+        related_name='stock_movements',
+        null=True,
+        blank=True,
+        verbose_name="Boutique"
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stock_movements',
+        verbose_name="Produit"
+    )
+    quantity = models.IntegerField(verbose_name="Variation")
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name="Motif")
+    reference = models.CharField(max_length=100, blank=True, verbose_name="Référence")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Date")
+
+    class Meta:
+        verbose_name = "Mouvement de stock"
+        verbose_name_plural = "Mouvements de stock"
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='inventory_move_product_date'),
+            models.Index(fields=['shop', 'created_at'], name='inventory_move_shop_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.quantity:+d} ({self.get_reason_display()})"
+
+
+class StockSnapshot(models.Model):
+    """
+    Stock d'un produit arrêté à un mouvement du journal : le stock à une date
+    se lit depuis le dernier instantané antérieur plus les quelques
+    mouvements suivants, sans rejouer tout le journal.
+    """
+
+    shop = models.ForeignKey(
+        Shop,
+        on_delete=models.CASCADE,
+        related_name='stock_snapshots',
+        null=True,
+        blank=True,
+        verbose_name="Boutique"
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stock_snapshots',
+        verbose_name="Produit"
+    )
+    stock = models.IntegerField(verbose_name="Stock")
+    last_movement_id = models.BigIntegerField(verbose_name="Dernier mouvement inclus")
+    taken_at = models.DateTimeField(default=timezone.now, verbose_name="Date")
+
+    class Meta:
+        verbose_name = "Instantané de stock"
+        verbose_name_plural = "Instantanés de stock"
+        indexes = [
+            models.Index(fields=['product', 'taken_at'], name='inventory_snap_product_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} : {self.stock} au {self.taken_at:%d/%m/%Y}"
@@ -0,0 +1,212 @@
+"""
+Service de mouvements de stock
+Toutes les écritures sur Product.current_stock (ventes, achats, commandes web)
+passent par ici : verrouillage des lignes, mise à jour en un seul UPDATE et
+ajout des mouvements au journal (inventory/ledger.py).
+"""
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, Tuple
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, When
+
+from products.models import Product
+from .ledger import record_movements
+from .models import StockMovement
+
+
+class InsufficientStock(Exception):
+    """Stock disponible inférieur à la quantité demandée."""
+
+    def __init__(self, product, requested, available):
+        self.product = product
+        self.requested = requested
+        self.available = available
+        super().__init__(f"Stock insuffisant pour {product.name} (disponible: {available})")
+
+
+class StockService:
+    """
+    Mutations atomiques du stock.
+
+    - Les produits concernés sont verrouillés (`select_for_update`) dans l'ordre
+      des clés primaires : deux caisses qui vendent les mêmes articles dans un
+      ordre différent ne peuvent pas s'interbloquer.
+    - Le stock est recalculé par la base (`current_stock + delta`) en un seul
+      UPDATE, sans réécrire le reste de la ligne Product.
+    - Une sortie qui rendrait le stock négatif lève InsufficientStock et annule
+      toute la transaction ; les entrées ne sont jamais refusées. Le contrôle est refait après l'UPDATE, pour les
+      bases sans verrou de ligne (SQLite).
+    - Avec `respect_reservations` (caisse, commande web payée), la sortie ne
+      peut pas non plus entamer les unités réservées par les commandes en
+      ligne en attente (store/reservations.py) : le disponible est stock -
+      réservations, lues sous le même verrou.
+    - Chaque variation est inscrite au journal StockMovement (un `bulk_create`)
+      avec son motif et sa référence (« Vente #12 », « Achat #3 »...).
+    - Une réception (`receive`) met à jour le coût moyen pondéré dans le même
+      UPDATE, à partir du stock lu sous verrou ; les sorties ne le changent pas.
+    """
+
+    @staticmethod
+    def _merge(deltas) -> Dict[int, int]:
+        if isinstance(deltas, dict):
+            deltas = deltas.items()
+        merged = defaultdict(int)
+        for product_id, delta in deltas:
+            merged[int(product_id)] += int(delta)
+        return {product_id: delta for product_id, delta in merged.items() if delta}
+
+    @staticmethod
+    def apply(deltas, allow_negative: bool = False, reason: str = StockMovement.ADJUSTMENT,
+              reference: str = '', unit_costs=None, respect_reservations: bool = False) -> Dict[int, int]:
+        """
+        Applique des variations de stock.
+
+        Args:
+            deltas: {product_id: variation} ou itérable de (product_id, variation),
+                    négatif pour une sortie. Les doublons sont additionnés.
+            allow_negative: accepter un stock négatif (annulation d'une réception)
+            reason: motif inscrit au journal (StockMovement.SALE, PURCHASE...)
+            reference: pièce à l'origine du mouvement, pour l'historique
+            unit_costs: {product_id: coût unitaire} des entrées, pour le coût moyen pondéré
+            respect_reservations: refuser une sortie qui entame les réservations
+                    des commandes en ligne (sans effet avec allow_negative)
+
+        Returns:
+            dict: {product_id: nouveau stock}
+        """
+        deltas = StockService._merge(deltas)
+        if not deltas:
+            return {}
+
+        with transaction.atomic():
+            locked = {
+                product.id: product
+                for product in Product.objects.select_for_update()
+                .filter(id__in=deltas.keys())
+                .only('id', 'name', 'shop', 'current_stock', 'average_cost', 'purchase_price')
+                .order_by('id')
+            }
+
+            # Seules les sorties sont contrôlées : une entrée sur un stock déjà
+            # négatif (vente hors ligne) le rapproche de zéro et doit passer.
+            outgoing = [product_id for product_id, delta in deltas.items() if delta < 0]
+            reserved = {}
+            if not allow_negative:
+                if respect_reservations:
+                    reserved = StockService._reserved(outgoing)
+                for product_id, delta in deltas.items():
+                    product = locked.get(product_id)
+                    if product is None:
+                        raise Product.DoesNotExist(f"Produit {product_id} introuvable")
+                    if delta > 0:
+                        continue
+                    available = product.current_stock - reserved.get(product_id, 0)
+                    if available + delta < 0:
+                        raise InsufficientStock(product, -delta, max(available, 0))
+
+            updates = {
+                'current_stock': Case(
+                    *[When(id=product_id, then=F('current_stock') + delta) for product_id, delta in deltas.items()],
+                    default=F('current_stock'),
+                    output_field=IntegerField(),
+                )
+            }
+            average_costs = StockService._average_costs(locked, deltas, unit_costs or {})
+            if average_costs:
+                updates['average_cost'] = Case(
+                    *[When(id=product_id, then=cost) for product_id, cost in average_costs.items()],
+                    default=F('average_cost'),
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                )
+            Product.objects.filter(id__in=locked.keys()).update(**updates)
+
+            new_stock = dict(
+                Product.objects.filter(id__in=locked.keys()).values_list('id', 'current_stock')
+            )
+            if not allow_negative:
+                for product_id in outgoing:
+                    stock = new_stock.get(product_id, 0)
+                    if stock - reserved.get(product_id, 0) < 0:
+                        product = locked[product_id]
+                        available = stock - deltas[product_id] - reserved.get(product_id, 0)
+                        raise InsufficientStock(product, -deltas[product_id], max(available, 0))
+
+            record_movements(
+                {product_id: delta for product_id, delta in deltas.items() if product_id in locked},
+                {product_id: product.shop_id for product_id, product in locked.items()},
+                reason,
+                reference,
+            )
+            StockService._invalidate_catalog_stock()
+        return new_stock
+
+    @staticmethod
+    def _average_costs(locked, deltas, unit_costs):
+        """
+        {product_id: nouveau coût moyen} des entrées au coût connu :
+        (stock × coût moyen + quantité reçue × coût) / (stock + quantité).
+        Un stock négatif compte pour zéro.
+        """
+        averages = {}
+        for product_id, cost in unit_costs.items():
+            product = locked.get(product_id)
+            received = deltas.get(product_id, 0)
+            if product is None or received <= 0 or cost is None:
+                continue
+            on_hand = max(product.current_stock, 0)
+            previous = product.unit_cost or Decimal('0.00')
+            average = (on_hand * previous + received * Decimal(str(cost))) / (on_hand + received)
+            averages[product_id] = average.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return averages
+
+    @staticmethod
+    def decrement(items: Iterable[Tuple[int, int]], **movement) -> Dict[int, int]:
+        """Sortie de stock : items = [(product_id, quantité), ...] ; `movement` : reason, reference."""
+        return StockService.apply([(product_id, -quantity) for product_id, quantity in items], **movement)
+
+    @staticmethod
+    def increment(items: Iterable[Tuple[int, int]], **movement) -> Dict[int, int]:
+        """Entrée de stock : items = [(product_id, quantité), ...] ; `movement` : reason, reference."""
+        return StockService.apply([(product_id, quantity) for product_id, quantity in items], **movement)
+
+    @staticmethod
+    def receive(lines: Iterable[Tuple[int, int, Decimal]], **movement) -> Dict[int, int]:
+        """
+        Réception d'achat : lines = [(product_id, quantité, coût unitaire), ...].
+        Entrée de stock et coût moyen pondéré mis à jour ensemble ; un produit
+        reçu sur plusieurs lignes prend leur coût moyen.
+        """
+        quantities = defaultdict(int)
+        values = defaultdict(Decimal)
+        for product_id, quantity, cost in lines:
+            quantities[int(product_id)] += int(quantity)
+            values[int(product_id)] += int(quantity) * Decimal(str(cost))
+        unit_costs = {
+            product_id: values[product_id] / quantity
+            for product_id, quantity in quantities.items() if quantity > 0
+        }
+        return StockService.apply(quantities, unit_costs=unit_costs, **movement)
+
+    @staticmethod
+    def _reserved(product_ids) -> Dict[int, int]:
+        """{product_id: quantité réservée par les commandes en ligne}, lue en base."""
+        if not product_ids:
+            return {}
+        try:
+            from store.reservations import _sum_reserved
+        except ImportError:
+            return {}
+        return _sum_reserved(product_ids)
+
+    @staticmethod
+    def _invalidate_catalog_stock():
+        # L'UPDATE ne passe pas par Product.save : la carte des stocks de la
+        # boutique doit être invalidée explicitement (le snapshot, lui, ne
+        # contient pas le stock).
+        try:
+            from store.catalog import invalidate_catalog_stock
+        except ImportError:
+            return
+        invalidate_catalog_stock()
@@ -0,0 +1,40 @@
+"""
+Signaux Django du stock.
+Une modification de current_stock hors StockService (fiche produit, admin)
+est inscrite au journal comme stock initial ou ajustement manuel, pour que
+le journal reste la source du stock.
+"""
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from products.models import Product
+from .ledger import record_movements, stock_at
+from .models import StockMovement
+
+
+@receiver(post_init, sender=Product)
+def remember_loaded_stock(sender, instance, **kwargs):
+    instance._ledger_stock = instance.__dict__.get('current_stock')
+
+
+@receiver(post_save, sender=Product)
+def record_manual_stock_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return  # chargement de fixtures
+    if 'current_stock' not in instance.__dict__:
+        return  # champ différé : non enregistré par ce save
+    if update_fields is not None and 'current_stock' not in update_fields:
+        return
+    stock = instance.current_stock
+    if not created and stock == instance._ledger_stock:
+        return
+
+    if created:
+        reason, reference, delta = StockMovement.OPENING, "Création du produit", stock
+    else:
+        # Écart avec le journal, et non avec la valeur chargée : une instance
+        # déjà mise à jour par StockService (vente en caisse) ne crée rien.
+        balance = stock_at([instance.pk])[instance.pk]
+        reason, reference, delta = StockMovement.ADJUSTMENT, "Modification de la fiche produit", stock - balance
+    record_movements({instance.pk: delta}, {instance.pk: instance.shop_id}, reason, reference)
+    instance._ledger_stock = stock
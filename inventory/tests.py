@@ -1,3 +1,320 @@
-from django.test import TestCase
+import threading
+import time
+import unittest
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import OperationalError, close_old_connections, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import Shop
+from inventory.ai import StockBrain
+from inventory.ledger import daily_stock, find_drift, stock_at, take_snapshots
+from inventory.models import StockMovement, StockSnapshot
+from inventory.services import InsufficientStock, StockService
+from products.models import Category, Product
+from sales.models import Sale, SaleItem
+from sales.rollups import rebuild_daily_sales
+
+try:
+    import numpy as np
+    from inventory.forecasting import DemandForecast, HoltWinters, MovingAverage, days_of_cover
+    from inventory.management.commands.backtest_forecast import mae, mape
+except ImportError:  # pragma: no cover - NumPy absent
+    np = None
+
+
+def _create_product(category, name, stock):
+    return Product.objects.create(
+        name=name,
+        category=category,
+        selling_price=Decimal('10.00'),
+        purchase_price=Decimal('5.00'),
+        current_stock=stock,
+    )
+
+
+class StockServiceTests(TestCase):
+    """Tests du service de mouvements de stock"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Stock')
+        self.first = _create_product(self.category, 'Produit A', 10)
+        self.second = _create_product(self.category, 'Produit B', 3)
+
+    def test_decrement_merges_lines_and_updates_in_database(self):
+        new_stock = StockService.decrement([(self.first.id, 2), (self.second.id, 1), (self.first.id, 3)])
+        self.assertEqual(new_stock, {self.first.id: 5, self.second.id: 2})
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.current_stock, 5)
+
+    def test_insufficient_stock_rolls_back_every_line(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            StockService.decrement([(self.first.id, 2), (self.second.id, 4)])
+        self.assertEqual(ctx.exception.available, 3)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.current_stock, self.second.current_stock), (10, 3))
+
+    def test_receipt_on_negative_stock_is_accepted(self):
+        # Stock négatif laissé par une vente hors ligne
+        StockService.decrement([(self.second.id, 7)], allow_negative=True)
+
+        new_stock = StockService.receive([(self.second.id, 2, Decimal('5.00'))])
+        self.assertEqual(new_stock, {self.second.id: -2})
+        # Les sorties restent refusées tant que le stock est négatif
+        with self.assertRaises(InsufficientStock):
+            StockService.decrement([(self.second.id, 1)])
+
+    def test_update_does_not_rewrite_other_columns(self):
+        Product.objects.filter(pk=self.first.pk).update(name='Renommé ailleurs')
+        StockService.decrement([(self.first.id, 1)])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.name, 'Renommé ailleurs')
+        self.assertEqual(self.first.current_stock, 9)
+
+
+class StockLedgerTests(TestCase):
+    """Journal des mouvements : source du stock, instantanés, rapprochement"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Journal')
+        self.product = _create_product(self.category, 'Produit journal', 10)
+
+    def _movements(self):
+        return list(self.product.stock_movements.order_by('id').values_list('reason', 'quantity', 'reference'))
+
+    def test_every_write_is_journaled(self):
+        StockService.decrement([(self.product.id, 3)], reason=StockMovement.SALE, reference='Vente #1')
+        StockService.increment([(self.product.id, 5)], reason=StockMovement.PURCHASE, reference='Achat #1')
+
+        self.product.refresh_from_db()
+        self.product.current_stock = 20
+        self.product.save()
+
+        self.assertEqual(self._movements(), [
+            (StockMovement.OPENING, 10, 'Création du produit'),
+            (StockMovement.SALE, -3, 'Vente #1'),
+            (StockMovement.PURCHASE, 5, 'Achat #1'),
+            (StockMovement.ADJUSTMENT, 8, 'Modification de la fiche produit'),
+        ])
+        self.assertEqual(stock_at([self.product.id]), {self.product.id: 20})
+
+    def test_instance_updated_by_service_does_not_adjust(self):
+        self.product.current_stock = StockService.decrement([(self.product.id, 4)])[self.product.id]
+        self.product.save()
+        self.assertEqual(len(self._movements()), 2)
+        self.assertEqual(find_drift(), [])
+
+    def test_stock_at_date_reads_snapshot_and_later_movements(self):
+        now = timezone.now()
+        StockMovement.objects.filter(product=self.product).update(created_at=now - timedelta(days=3))
+        StockService.decrement([(self.product.id, 2)], reason=StockMovement.SALE)
+        StockMovement.objects.filter(product=self.product, reason=StockMovement.SALE).update(
+            created_at=now - timedelta(days=1),
+        )
+
+        self.assertEqual(take_snapshots(moment=now - timedelta(hours=1)), 1)
+        self.assertEqual(take_snapshots(moment=now - timedelta(hours=1)), 0)  # rien de nouveau
+        StockService.decrement([(self.product.id, 1)], reason=StockMovement.SALE)
+
+        snapshot = StockSnapshot.objects.get(product=self.product)
+        self.assertEqual(snapshot.stock, 8)
+        self.assertEqual(stock_at([self.product.id], moment=now - timedelta(days=2)), {self.product.id: 10})
+        self.assertEqual(stock_at([self.product.id]), {self.product.id: 7})
+
+        today = timezone.localdate()
+        levels = daily_stock(self.product, today - timedelta(days=3), today)
+        self.assertEqual([stock for _, stock in levels], [10, 10, 8, 7])
+
+    def test_reconcile_detects_and_fixes_drift(self):
+        Product.objects.filter(pk=self.product.pk).update(current_stock=15)
+
+        drift = find_drift()
+        self.assertEqual([(product.id, cached, ledger) for product, cached, ledger in drift],
+                         [(self.product.id, 15, 10)])
+
+        find_drift(fix=True)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 10)
+        self.assertEqual(find_drift(), [])
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    """Plusieurs caisses vendent le même stock en parallèle"""
+
+    THREADS = 8
+    SALES_PER_THREAD = 10
+    INITIAL_STOCK = 50
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Concurrence')
+        self.first = _create_product(self.category, 'Produit A', self.INITIAL_STOCK)
+        self.second = _create_product(self.category, 'Produit B', self.INITIAL_STOCK)
+
+    def _sell(self, lines, results, errors):
+        try:
+            for _ in range(self.SALES_PER_THREAD):
+                while True:
+                    try:
+                        StockService.decrement(lines)
+                        results.append(True)
+                        break
+                    except InsufficientStock:
+                        results.append(False)
+                        break
+                    except OperationalError:
+                        # SQLite : base verrouillée par un autre thread, on réessaie
+                        time.sleep(0.001)
+        except Exception as exc:  # pragma: no cover - remonté dans le test
+            errors.append(exc)
+        finally:
+            close_old_connections()
+            connection.close()
+
+    def test_no_lost_update_and_no_negative_stock(self):
+        results, errors = [], []
+        threads = []
+        for index in range(self.THREADS):
+            # Ordre des lignes inversé une fois sur deux : pas d'interblocage
+            lines = [(self.first.id, 1), (self.second.id, 1)]
+            if index % 2:
+                lines.reverse()
+            threads.append(threading.Thread(target=self._sell, args=(lines, results, errors)))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        sold = results.count(True)
+        self.assertEqual(sold, self.INITIAL_STOCK)
+        self.assertEqual(results.count(False), self.THREADS * self.SALES_PER_THREAD - self.INITIAL_STOCK)
+
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.current_stock, 0)
+        self.assertEqual(self.second.current_stock, 0)
+
+
+class StockBrainTests(TestCase):
+    """Prédictions de rupture calculées en une requête pour toute la boutique"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='gerant', password='secret123')
+        self.shop = Shop.objects.create(name='Boutique Test', created_by=self.user)
+        self.category = Category.objects.create(name='Cerveau')
+        self.products = []
+        for index, stock in enumerate([3, 60, 0, 100]):
+            product = _create_product(self.category, f'Produit {index}', stock)
+            product.shop = self.shop
+            product.save()
+            self.products.append(product)
+
+    def _sell(self, sales):
+        sale = Sale.objects.create(shop=self.shop, cashier=self.user, total=Decimal('0.00'))
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=product, quantity=quantity, unit_price=product.selling_price,
+                     subtotal=quantity * product.selling_price)
+            for product, quantity in sales
+        ])
+        rebuild_daily_sales()
+
+    def test_velocity_risk_and_days_left(self):
+        self._sell([(self.products[0], 30), (self.products[1], 60)])
+        brain = StockBrain(self.shop, analysis_period_days=30, forecast=False)
+
+        critical = brain.analyze_product(self.products[0])
+        self.assertEqual((critical['velocity'], critical['days_left'], critical['risk_level']), (1.0, 3.0, 'HIGH'))
+        self.assertEqual(brain.analyze_product(self.products[1])['days_left'], 30.0)
+        idle = brain.analyze_product(self.products[3])
+        self.assertEqual((idle['days_left'], idle['stockout_date'], idle['risk_level']), ("∞", None, 'LOW'))
+
+        dashboard = brain.get_dashboard_data()
+        # Produit 3 : ni vente ni stock bas, écarté ; rupture sans vente en dernier
+        self.assertEqual([data['product'] for data in dashboard], [self.products[0], self.products[1], self.products[2]])
+        self.assertEqual(dashboard[2]['risk_level'], 'OUT_OF_STOCK')
+
+    def test_dashboard_query_count_does_not_grow_with_products(self):
+        def count():
+            with CaptureQueriesContext(connection) as ctx:
+                StockBrain(self.shop).get_dashboard_data()
+            return len(ctx.captured_queries)
+
+        before = count()
+        for index in range(20):
+            product = _create_product(self.category, f'Extra {index}', 1)
+            product.shop = self.shop
+            product.save()
+            self._sell([(product, 1)])
+        self.assertEqual(count(), before)
+
+
+@unittest.skipUnless(np is not None, 'NumPy requis')
+class ForecastingTests(TestCase):
+    """Moteur de prévision vectorisé"""
+
+    def test_holt_winters_follows_weekday_pattern(self):
+        # Lundi..dimanche : ventes fortes le week-end
+        week = [2, 2, 2, 2, 4, 10, 10]
+        history = np.array([week * 8, [5] * 56], dtype=float)
+
+        model = HoltWinters().fit(history, start_weekday=date(2026, 1, 5).weekday())
+        forecast = model.forecast(7)
+
+        np.testing.assert_allclose(forecast[0], week, atol=0.5)
+        np.testing.assert_allclose(forecast[1], [5] * 7, atol=0.01)
+        self.assertLess(model.residual_std[0], 0.5)
+
+    def test_days_of_cover_consumes_the_daily_forecast(self):
+        # Horizon commençant un vendredi : le week-end épuise le stock bien
+        # avant ce que la vitesse moyenne (4/j) laisse croire.
+        week = [4, 10, 10, 2, 2, 2, 2]
+        forecast = np.array([week * 2, week * 2, week * 2, [0] * 14], dtype=float)
+
+        cover = days_of_cover([24, 100, 0, 50], forecast)
+
+        np.testing.assert_allclose(cover[:3], [3.0, 14 + 7 + 4 / 4, 0.0])
+        self.assertEqual(cover[3], float('inf'))
+        self.assertLess(cover[0], 24 / forecast[0].mean())
+
+    def test_backtest_errors_are_per_day(self):
+        actual = np.array([[2, 2, 2, 2, 4, 10, 10]], dtype=float)
+        flat = np.full((1, 7), 32 / 7)
+
+        # Le total de la semaine est juste, mais chaque jour est faux
+        self.assertGreater(mape(actual, flat), 50)
+        self.assertAlmostEqual(mae(actual, actual), 0.0)
+        self.assertAlmostEqual(mape(actual, actual), 0.0)
+
+    def test_reorder_point_includes_safety_stock(self):
+        user = User.objects.create_user(username='gerant', password='secret123')
+        shop = Shop.objects.create(name='Boutique Test', created_by=user)
+        product = _create_product(Category.objects.create(name='Prévision'), 'Produit A', 20)
+        product.shop = shop
+        product.save()
+        today = timezone.localdate()
+        for offset, quantity in enumerate([1, 5, 2, 8, 3, 6] * 3):
+            sale = Sale.objects.create(shop=shop, cashier=user, total=Decimal('0.00'))
+            Sale.objects.filter(pk=sale.pk).update(sale_date=timezone.now() - timedelta(days=offset))
+            SaleItem.objects.bulk_create([SaleItem(
+                sale=sale, product=product, quantity=quantity,
+                unit_price=product.selling_price, subtotal=quantity * product.selling_price,
+            )])
+        rebuild_daily_sales()
+
+        plan = DemandForecast(shop, model=MovingAverage(), history_days=28, lead_time_days=7).fit(
+            [product], end_date=today + timedelta(days=1),
+        ).for_product(product.id)
+
+        self.assertAlmostEqual(plan['daily_velocity'], 75 / 28)
+        self.assertAlmostEqual(plan['lead_time_demand'], 7 * 75 / 28)
+        self.assertGreater(plan['safety_stock'], 0)
+        self.assertAlmostEqual(plan['reorder_point'], plan['lead_time_demand'] + plan['safety_stock'])
+
+        analysis = StockBrain(shop, analysis_period_days=28).analyze_product(product)
+        self.assertIsNotNone(analysis['reorder_point'])
@@ -50,10 +50,10 @@ def brain_dashboard_view(request):
 
 @manager_required
 def get_product_history_api(request, product_id):
-    """API pour récupérer l'historique des ventes d'un produit (JSON)"""
+    """API pour récupérer l'historique des ventes et du stock d'un produit (JSON)"""
     from django.http import JsonResponse
-    from sales.models import SaleItem, Sale
-    from django.db.models import Sum
+    from sales.models import DailyProductSales
+    from .ledger import daily_stock
     from django.shortcuts import get_object_or_404
     from datetime import timedelta
     from django.utils import timezone
@@ -64,32 +64,32 @@ def get_product_history_api(request, product_id):
     product = get_object_or_404(Product, id=product_id, shop=request.user.profile.shop)
     
     days = 30
-    end_date = timezone.now().date()
+    end_date = timezone.localdate()
     start_date = end_date - timedelta(days=days)
     
+    # Une lecture de l'agrégat journalier pour toute la période
+    sold = dict(
+        DailyProductSales.objects.filter(
+            product=product, date__range=(start_date, end_date)
+        ).values_list('date', 'quantity')
+    )
+    
+    # Stock en fin de journée : dernier instantané + mouvements de la période
+    levels = daily_stock(product, start_date, end_date)
+    
     # Initialiser les données pour chaque jour (même s'il n'y a pas de vente)
     dates = []
     quantities = []
+    stock_levels = []
     
-    current = start_date
-    while current <= end_date:
-        # Chercher les ventes pour ce jour via SaleItem
-        # Note: SaleItem -> Sale -> Shop check implicit via Product ownership usually,
-        # but to be extra safe we could check sale__shop if Sale had it.
-        # Since Product is isolated, SaleItems for this product are implicitly isolated 
-        # UNLESS the same product ID existed in multiple shops (impossible due to ID primary key).
-        # So checking product ownership is sufficient.
-        total = SaleItem.objects.filter(
-            product=product,
-            sale__sale_date__date=current
-        ).aggregate(sum=Sum('quantity'))['sum'] or 0
-        
-        dates.append(current.strftime('%d/%m'))
-        quantities.append(total)
-        current += timedelta(days=1)
+    for day, stock in levels:
+        dates.append(day.strftime('%d/%m'))
+        quantities.append(sold.get(day, 0))
+        stock_levels.append(stock)
         
     return JsonResponse({
         'product_name': product.name,
         'dates': dates,
-        'quantities': quantities
+        'quantities': quantities,
+        'stock_levels': stock_levels,
     })
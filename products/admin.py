@@ -143,7 +143,7 @@ class ProductAdmin(admin.ModelAdmin):
         'is_active'
     ]
     search_fields = ['name', 'barcode']
-    readonly_fields = ['barcode', 'created_at', 'updated_at', 'profit_margin', 'effective_rules_preview']
+    readonly_fields = ['barcode', 'created_at', 'updated_at', 'average_cost', 'profit_margin', 'effective_rules_preview']
     
     fieldsets = (
         ('✨ PERSONNALISATION', {
@@ -168,7 +168,7 @@ class ProductAdmin(admin.ModelAdmin):
         }),
         ('💰 Prix & Stock', {
             'fields': (
-                ('purchase_price', 'selling_price', 'engraving_price', 'profit_margin'),
+                ('purchase_price', 'average_cost', 'selling_price', 'engraving_price', 'profit_margin'),
                 ('current_stock', 'minimum_stock')
             )
         }),
@@ -236,13 +236,14 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(CustomizationPreview)
 class CustomizationPreviewAdmin(admin.ModelAdmin):
     """Admin pour voir les previews générées"""
-    list_display = ['id', 'product', 'preview_thumbnail', 'created_at']
-    list_filter = ['created_at', 'product']
-    readonly_fields = ['product', 'customization_data', 'preview_image', 'created_at', 'pretty_data']
+    list_display = ['id', 'product', 'preview_thumbnail', 'status', 'created_at']
+    list_filter = ['status', 'created_at', 'product']
+    readonly_fields = ['product', 'customization_data', 'preview_image', 'display_image', 'thumbnail', 'status', 'fingerprint', 'created_at', 'rendered_at', 'last_used_at', 'pretty_data']
     
     def preview_thumbnail(self, obj):
-        if obj.preview_image:
-            return format_html('<img src="{}" style="max-height: 100px;" />', obj.preview_image.url)
+        image = obj.thumbnail or obj.preview_image
+        if image:
+            return format_html('<img src="{}" style="max-height: 100px;" />', image.url)
         return '—'
     preview_thumbnail.short_description = 'Aperçu'
     
@@ -0,0 +1,107 @@
+"""
+Index code-barres → produit, par boutique.
+
+Chaque bip de scanner devient une lecture de dictionnaire : l'index d'une
+boutique est construit à la première utilisation (une requête), partagé entre
+workers via le cache, et gardé en mémoire dans chaque processus. Les signaux
+de products/signals.py incrémentent la version de la boutique à chaque
+modification de produit, ce qui invalide toutes les copies.
+
+Le stock n'est pas dans l'index (il change à chaque vente, sans passer par
+Product.save) : il est relu par clé primaire au moment du scan.
+"""
+import time
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Product
+
+
+VERSION_KEY = 'products:barcodes:{shop_id}:version'
+DATA_KEY = 'products:barcodes:{shop_id}:{version}'
+DATA_TIMEOUT = 60 * 60 * 24
+
+_local = {}
+
+
+def normalize_barcode(barcode):
+    return (barcode or '').strip().upper()
+
+
+def get_index_version(shop_id):
+    key = VERSION_KEY.format(shop_id=shop_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_barcode_index(shop_id):
+    """Invalide l'index de la boutique dans tous les workers (immédiatement et après commit)."""
+    def bump():
+        try:
+            cache.incr(VERSION_KEY.format(shop_id=shop_id))
+        except ValueError:
+            get_index_version(shop_id)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def serialize_scan_product(product):
+    """Représentation d'un produit pour la caisse (sans le stock)."""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'barcode': product.barcode,
+        'category': product.category.name if product.category else '',
+        'price': float(product.selling_price),
+        'image': product.image.url if product.image else None,
+    }
+
+
+def build_barcode_index(shop_id):
+    products = Product.objects.filter(shop_id=shop_id, is_active=True).select_related('category')
+    return {
+        normalize_barcode(product.barcode): serialize_scan_product(product)
+        for product in products
+        if product.barcode
+    }
+
+
+def _publish(shop_id, version, index):
+    _local[shop_id] = (version, index)
+    cache.set(DATA_KEY.format(shop_id=shop_id, version=version), index, timeout=DATA_TIMEOUT)
+
+
+def get_barcode_index(shop_id):
+    """Dictionnaire {code-barres normalisé: produit} de la boutique."""
+    version = get_index_version(shop_id)
+    local = _local.get(shop_id)
+    if local is not None and local[0] == version:
+        return local[1]
+
+    index = cache.get(DATA_KEY.format(shop_id=shop_id, version=version))
+    if index is not None:
+        _local[shop_id] = (version, index)
+        return index
+
+    index = build_barcode_index(shop_id)
+    # Construit dans une transaction, l'index peut contenir des écritures non
+    # validées : il n'est partagé qu'après le commit.
+    transaction.on_commit(partial(_publish, shop_id, version, index))
+    return index
+
+
+def lookup_barcode(shop_id, barcode):
+    """Produit (dict, stock à jour inclus) correspondant au code-barres, ou None."""
+    entry = get_barcode_index(shop_id).get(normalize_barcode(barcode))
+    if entry is None:
+        return None
+    stock = Product.objects.filter(pk=entry['id'], is_active=True).values_list('current_stock', flat=True).first()
+    if stock is None:
+        return None
+    return {**entry, 'stock': stock}
@@ -0,0 +1,68 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Category, Product
+from products.search import NgramIndex, ProductSearch
+
+
+WORDS = [
+    'collier', 'bracelet', 'bague', 'pendentif', 'chaîne', 'médaille', 'gourmette',
+    'argent', 'or', 'acier', 'perle', 'coeur', 'étoile', 'croix', 'prénom', 'gravé',
+    'fin', 'large', 'enfant', 'homme', 'femme', 'maille', 'jonc', 'anneau',
+]
+QUERIES = ['col', 'bracelet argent', 'médaille gravée', 'ANN', 'xyz', 'maille', 'or']
+
+
+class Command(BaseCommand):
+    help = "Mesure la recherche produits sur un catalogue factice (annulé à la fin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000, help='Nombre de produits générés')
+        parser.add_argument('--repeat', type=int, default=20, help='Répétitions par saisie')
+
+    def _time(self, func, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) * 1000 / repeat
+
+    def handle(self, *args, **options):
+        count, repeat = options['products'], options['repeat']
+        rng = random.Random(42)
+
+        with transaction.atomic():
+            category = Category.objects.create(name='Benchmark recherche')
+            Product.objects.bulk_create(
+                (
+                    Product(
+                        name=' '.join(rng.sample(WORDS, 3)) + f' {index}',
+                        barcode=f'{rng.randrange(10 ** 12, 10 ** 13)}',
+                        category=category,
+                        selling_price=1000,
+                        purchase_price=500,
+                        is_active=False,
+                    )
+                    for index in range(count)
+                ),
+                batch_size=2000,
+            )
+            queryset = Product.objects.filter(category=category)
+
+            start = time.perf_counter()
+            index = NgramIndex.build()
+            self.stdout.write(f"Index n-grammes : {count} produits en {(time.perf_counter() - start) * 1000:.0f} ms")
+
+            self.stdout.write(f"{'saisie':<20}{'SQL (ms)':>10}{'index (ms)':>12}{'résultats':>12}")
+            for query in QUERIES:
+                search = ProductSearch(query)
+                sql = self._time(lambda: list(search.rank(search._sql_filter(queryset))[:10]), repeat)
+                ids = index.search(query, search.fields)
+                indexed = self._time(lambda: list(search.rank(search._index_filter(queryset, index))[:10]), repeat)
+                self.stdout.write(f"{query:<20}{sql:>10.2f}{indexed:>12.2f}{len(ids):>12}")
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("✅ Mesure terminée (données annulées)"))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.previews import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Supprime les aperçus de personnalisation qu'aucun panier ni commande ne référence (les moins récemment utilisés d'abord)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=max(1, settings.SESSION_COOKIE_AGE // 86400),
+            help="Supprimer les aperçus inutilisés depuis N jours (défaut : durée d'une session)",
+        )
+        parser.add_argument(
+            '--max-entries', type=int, default=getattr(settings, 'CUSTOMIZATION_PREVIEW_CACHE_SIZE', None),
+            help="Nombre d'aperçus conservés au plus (éviction LRU)",
+        )
+
+    def handle(self, *args, **options):
+        deleted = collect_garbage(timedelta(days=options['days']), options['max_entries'])
+        self.stdout.write(self.style.SUCCESS(f"✅ {deleted} aperçu(s) supprimé(s)"))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products import preview_assets
+from products.previews import render_pending, requeue_stale
+
+
+class Command(BaseCommand):
+    help = "Worker des aperçus de personnalisation : rend les CustomizationPreview en attente (en boucle, ou une passe avec --once)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Rendre les aperçus en attente puis quitter')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Secondes entre deux scrutations de la file')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"⚠️ {requeued} aperçu(s) abandonné(s) remis en attente"))
+
+        if options['once']:
+            rendered = render_pending()
+            self.stdout.write(self.style.SUCCESS(f"✅ {rendered} aperçu(s) rendu(s)"))
+            return
+
+        loaded = preview_assets.warm_up()
+        self.stdout.write(f"Worker des aperçus démarré, ressources de {loaded} produit(s) préchargées (Ctrl+C pour arrêter)")
+        try:
+            while True:
+                rendered = render_pending()
+                if rendered:
+                    self.stdout.write(f"{rendered} aperçu(s) rendu(s)")
+                else:
+                    requeue_stale()
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS("✅ Worker arrêté"))
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_userprofile_address_and_more'),
+        ('products', '0016_product_products_pr_shop_id_44685a_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('shop'), django.db.models.functions.text.Upper('barcode'), name='products_shop_barcode_upper'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-18 15:10
+
+from django.db import DatabaseError, migrations, transaction
+
+
+INDEXES = {
+    'products_name_upper_trgm': 'UPPER(("name")::text)',
+    'products_barcode_upper_trgm': 'UPPER(("barcode")::text)',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Index GIN pg_trgm pour `icontains` (PostgreSQL seulement)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DatabaseError:
+            # Extension non autorisée par l'hébergeur : la recherche reste
+            # correcte, sans index.
+            return
+        for name, expression in INDEXES.items():
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON products_product USING gin ({expression} gin_trgm_ops)'
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name in INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_product_shop_barcode_upper'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_product_average_cost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customizationpreview',
+            name='rendered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customizationpreview',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customizationpreview',
+            name='status',
+            field=models.CharField(choices=[('pending', 'En attente'), ('rendering', 'En cours'), ('done', 'Générée'), ('failed', 'Échec')], default='done', max_length=10, verbose_name='Statut'),
+        ),
+        migrations.AlterField(
+            model_name='customizationpreview',
+            name='preview_image',
+            field=models.ImageField(blank=True, upload_to='previews/', verbose_name='Image de prévisualisation'),
+        ),
+        migrations.AddIndex(
+            model_name='customizationpreview',
+            index=models.Index(fields=['status', 'created_at'], name='products_cu_status_aca19d_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 12:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_customizationpreview_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customizationpreview',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Empreinte'),
+        ),
+        migrations.AddField(
+            model_name='customizationpreview',
+            name='last_used_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
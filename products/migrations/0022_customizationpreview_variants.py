@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_customizationpreview_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customizationpreview',
+            name='display_image',
+            field=models.ImageField(blank=True, upload_to='previews/display/', verbose_name="Image d'affichage"),
+        ),
+        migrations.AddField(
+            model_name='customizationpreview',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='previews/thumbs/', verbose_name='Miniature'),
+        ),
+    ]
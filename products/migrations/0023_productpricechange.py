@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 18:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_customizationpreview_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPriceChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('previous_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Ancien prix')),
+                ('selling_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Nouveau prix')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Date')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_changes', to='products.product', verbose_name='Produit')),
+            ],
+            options={
+                'verbose_name': 'Changement de prix',
+                'verbose_name_plural': 'Changements de prix',
+                'ordering': ['-changed_at', '-id'],
+                'indexes': [models.Index(fields=['product', 'changed_at'], name='products_pr_product_e57c87_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from accounts.models import Shop
@@ -110,6 +112,8 @@ class Product(models.Model):
     purchase_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))], verbose_name="Prix d'achat")
     selling_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))], verbose_name="Prix de vente")
     engraving_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), verbose_name="Prix de gravure")
+    # Coût moyen pondéré, mis à jour à chaque réception d'achat (StockService.receive)
+    average_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Coût moyen pondéré")
     
     # Stock
     current_stock = models.IntegerField(default=0, validators=[MinValueValidator(0)], verbose_name="Stock actuel")
@@ -189,6 +193,8 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=['shop', 'is_active']),
             models.Index(fields=['category', 'is_active']),
+            # Recherche scanner insensible à la casse (unique_together couvre la recherche exacte)
+            models.Index(models.F('shop'), Upper('barcode'), name='products_shop_barcode_upper'),
         ]
     
     def __str__(self):
@@ -200,11 +206,17 @@ class Product(models.Model):
         from .services import CustomizationService
         return CustomizationService.get_product_rules(self)
     
+    @property
+    def unit_cost(self):
+        """Coût de revient unitaire : coût moyen pondéré, ou prix d'achat avant toute réception"""
+        return self.average_cost if self.average_cost is not None else self.purchase_price
+
     @property
     def profit_margin(self):
         """Marge bénéficiaire en %"""
-        if self.purchase_price > 0:
-            return ((self.selling_price - self.purchase_price) / self.purchase_price) * 100
+        unit_cost = self.unit_cost
+        if unit_cost and unit_cost > 0:
+            return ((self.selling_price - unit_cost) / unit_cost) * 100
         return 0
     
     @property
@@ -273,6 +285,35 @@ class Product(models.Model):
         super().save(*args, **kwargs)
 
 
+class ProductPriceChange(models.Model):
+    """
+    Journal des changements de prix de vente (écrit par products/signals.py).
+    Permet de retrouver le prix en vigueur à une date : celui affiché par la
+    caisse hors ligne au moment d'une vente synchronisée plus tard.
+    """
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='price_changes',
+        verbose_name="Produit"
+    )
+    previous_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Ancien prix")
+    selling_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Nouveau prix")
+    changed_at = models.DateTimeField(default=timezone.now, verbose_name="Date")
+
+    class Meta:
+        verbose_name = "Changement de prix"
+        verbose_name_plural = "Changements de prix"
+        ordering = ['-changed_at', '-id']
+        indexes = [
+            models.Index(fields=['product', 'changed_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product} : {self.previous_price} → {self.selling_price}"
+
+
 class CustomizationPreview(models.Model):
     """
     Preview générée d'une personnalisation.
@@ -281,21 +322,46 @@ class CustomizationPreview(models.Model):
     # Lien optionnel vers un CartItem ou OrderItem
     # (on peut aussi créer des previews à la volée sans les sauvegarder)
     
+    PENDING = 'pending'
+    RENDERING = 'rendering'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'En attente'),
+        (RENDERING, 'En cours'),
+        (DONE, 'Générée'),
+        (FAILED, 'Échec'),
+    ]
+
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Produit")
     customization_data = models.JSONField(verbose_name="Données de personnalisation")
     
-    # Image générée
+    # Image générée (hors requête, voir products/previews.py) : PNG sans perte pour l'atelier
     preview_image = models.ImageField(
         upload_to='previews/',
+        blank=True,
         verbose_name="Image de prévisualisation"
     )
+    # Variantes WebP issues du même rendu, pour l'affichage (panier, admin, commandes)
+    display_image = models.ImageField(upload_to='previews/display/', blank=True, verbose_name="Image d'affichage")
+    thumbnail = models.ImageField(upload_to='previews/thumbs/', blank=True, verbose_name="Miniature")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=DONE, verbose_name="Statut")
+    # Empreinte (mockup, zones, choix normalisés) : une personnalisation identique réutilise l'aperçu
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True, verbose_name="Empreinte")
     
     # Métadonnées
     created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    rendered_at = models.DateTimeField(null=True, blank=True)
+    # Dernière réutilisation (éviction LRU par la commande gc_previews)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
     
     class Meta:
         verbose_name = "Prévisualisation"
         verbose_name_plural = "Prévisualisations"
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
     
     def __str__(self):
         return f"Preview {self.id} - {self.product.name}"
@@ -0,0 +1,139 @@
+"""
+Cache des ressources du rendu des aperçus, par processus.
+
+`generate_preview_image` ne relit plus ses ressources à chaque rendu :
+mockups décodés (déjà en RGBA), polices FreeType par (police, taille) et
+symboles PNG déjà réduits par taille restent en mémoire (LRU). Tout passe
+par l'API de stockage : mockups via le stockage des médias (Cloudinary en
+production, où `.path` n'existe pas), polices et symboles via le stockage
+des fichiers statiques, puis les finders en développement.
+
+`warm_up()` précharge les ressources des produits personnalisables au
+démarrage d'un worker (pool d'aperçus, commande `render_previews`) : en
+régime établi, un rendu ne fait plus aucune lecture disque ni réseau.
+"""
+import io
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+MOCKUP_CACHE_SIZE = 16
+FONT_CACHE_SIZE = 64
+SYMBOL_CACHE_SIZE = 256
+
+FONT_PATH = 'fonts/{name}.ttf'
+SYMBOL_PATH = 'img/symbols/{name}.png'
+
+DEFAULT_TEXT_SIZE = 20
+DEFAULT_SYMBOL_SIZE = 40
+
+
+def _read_static(path):
+    """Contenu d'un fichier statique (collecté, sinon trouvé dans les sources), None s'il n'existe pas."""
+    from django.contrib.staticfiles import finders
+    from django.contrib.staticfiles.storage import staticfiles_storage
+
+    try:
+        with staticfiles_storage.open(path) as handle:
+            return handle.read()
+    except (OSError, ValueError):
+        pass
+    found = finders.find(path)
+    if not found:
+        return None
+    with open(found, 'rb') as handle:
+        return handle.read()
+
+
+@lru_cache(maxsize=MOCKUP_CACHE_SIZE)
+def _mockup(name):
+    from django.core.files.storage import default_storage
+    from PIL import Image
+
+    with default_storage.open(name, 'rb') as handle:
+        image = Image.open(handle)
+        return image.convert('RGBA')
+
+
+def get_mockup(product):
+    """
+    Copie du mockup du produit, en RGBA, prête à dessiner. La clé est le
+    nom de fichier : un nouveau mockup (nouveau nom) n'est pas masqué par
+    l'ancien.
+    """
+    return _mockup(product.mockup_image.name).copy()
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def _font_data(name):
+    return _read_static(FONT_PATH.format(name=name))
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def get_font(name, size):
+    """Police FreeType `name` à la taille `size` ; police par défaut de Pillow si le fichier manque."""
+    from PIL import ImageFont
+
+    data = _font_data(name)
+    if data is not None:
+        try:
+            return ImageFont.truetype(io.BytesIO(data), size)
+        except OSError:
+            logger.warning("Police %s illisible, police par défaut utilisée", name)
+    else:
+        logger.warning("Police %s introuvable (%s), police par défaut utilisée", name, FONT_PATH.format(name=name))
+    return ImageFont.load_default(size)
+
+
+@lru_cache(maxsize=SYMBOL_CACHE_SIZE)
+def get_symbol(name, size):
+    """Symbole `name` en RGBA, réduit pour tenir dans size x size ; None s'il n'existe pas."""
+    from PIL import Image
+
+    data = _read_static(SYMBOL_PATH.format(name=name))
+    if data is None:
+        logger.warning("Symbole %s introuvable", name)
+        return None
+    image = Image.open(io.BytesIO(data)).convert('RGBA')
+    image.thumbnail((size, size))
+    return image
+
+
+def clear():
+    for cached in (_mockup, _font_data, get_font, get_symbol):
+        cached.cache_clear()
+
+
+def warm_up(limit=MOCKUP_CACHE_SIZE):
+    """
+    Précharge mockups, polices et symboles des produits personnalisables
+    les plus récents (au plus `limit`). Best effort : une ressource
+    illisible n'empêche pas le worker de démarrer.
+    """
+    from .models import CustomizationFont, Product
+    from .services import CustomizationService
+
+    active_fonts = list(CustomizationFont.objects.filter(is_active=True).values_list('font_family', flat=True))
+    products = (
+        Product.objects.filter(is_customizable=True, is_active=True)
+        .exclude(mockup_image='').exclude(mockup_image__isnull=True)
+        .order_by('-updated_at')[:limit]
+    )
+    loaded = 0
+    for product in products:
+        try:
+            _mockup(product.mockup_image.name)
+            rules = CustomizationService.get_compiled_rules(product)
+            for zone in rules.zones if rules else ():
+                config = zone.preview_config
+                if zone.type == 'text':
+                    for font in zone.allowed_fonts or active_fonts or ['Arial']:
+                        get_font(font, config.get('size', DEFAULT_TEXT_SIZE))
+                elif zone.type in ('selection', 'shape'):
+                    for value in zone.option_values:
+                        get_symbol(value, config.get('size', DEFAULT_SYMBOL_SIZE))
+            loaded += 1
+        except Exception:
+            logger.exception("Préchargement des ressources du produit #%s impossible", product.pk)
+    return loaded
@@ -0,0 +1,34 @@
+"""
+Point d'entrée des processus du pool d'aperçus (products/previews.py).
+
+Ce module n'importe rien de Django au chargement : un processus lancé en
+`spawn` le désérialise avant que les applications soient prêtes.
+"""
+
+
+def _setup():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def warm_up():
+    """Initialiseur du pool : charge Django et précharge les ressources du rendu."""
+    _setup()
+
+    from django.db import close_old_connections
+    from products import preview_assets
+
+    try:
+        preview_assets.warm_up()
+    finally:
+        close_old_connections()
+
+
+def render(preview_id):
+    _setup()
+
+    from products.previews import render_preview
+    return render_preview(preview_id)
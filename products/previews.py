@@ -0,0 +1,402 @@
+"""
+Rendu des aperçus de personnalisation hors requête.
+
+`add_to_cart` et `sync_cart` n'ouvrent plus le mockup avec Pillow : ils
+enregistrent un CustomizationPreview en attente et rendent son id tout de
+suite. Le rendu est fait par la commande `render_previews` (lancée par
+railway.sh) ; un pool de processus par processus web peut s'y ajouter
+(CUSTOMIZATION_PREVIEW_WORKERS, désactivé par défaut). Sans worker, un
+aperçu en attente est rendu au passage de commande (`ensure_rendered`). En
+attendant, le front garde l'aperçu dessiné côté client et peut interroger
+`store:preview_status`.
+
+Le passage PENDING -> RENDERING est un UPDATE conditionnel : un aperçu
+n'est jamais rendu deux fois, quel que soit le processus qui le prend.
+
+Les aperçus sont adressés par contenu : l'empreinte (mockup, zones rendues,
+choix normalisés) d'une personnalisation déjà demandée renvoie l'aperçu
+existant, sans nouveau rendu ni nouveau fichier. La commande `gc_previews`
+supprime les aperçus qu'aucun CartItem ni WebOrderItem ne référence, les
+moins récemment utilisés d'abord ; un aperçu utilisé depuis moins d'une
+durée de session (panier en session) n'est jamais évincé.
+
+Le rendu en file ne produit que les fichiers affichés : une image WebP
+d'affichage et une miniature WebP (panier, admin, commandes). Le PNG sans
+perte (`preview_image`, pour l'atelier) n'est produit que pour les aperçus
+commandés : `ensure_rendered` au passage de commande, `ensure_master` à la
+demande pour les aperçus qui n'en ont pas encore.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import preview_worker
+from .models import CustomizationPreview
+
+logger = logging.getLogger(__name__)
+
+# Un aperçu RENDERING plus ancien que ce délai a perdu son processus
+STALE_AFTER = timedelta(minutes=5)
+
+# À incrémenter quand le dessin de generate_preview_image change
+RENDERER_VERSION = 1
+
+GC_CHUNK_SIZE = 500
+
+# Côté le plus long des variantes WebP (pixels)
+DISPLAY_SIZE = 1024
+THUMBNAIL_SIZE = 240
+WEBP_QUALITY = 80
+
+VARIANT_FIELDS = ('preview_image', 'display_image', 'thumbnail')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+
+    workers = getattr(settings, 'CUSTOMIZATION_PREVIEW_WORKERS', 0)
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn : pas de connexion DB ni de verrou hérité du processus web
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=preview_worker.warm_up,
+            )
+    return _pool
+
+
+def _submit(preview_id):
+    global _pool
+
+    pool = _get_pool()
+    if pool is None:
+        return
+    try:
+        pool.submit(preview_worker.render, preview_id)
+    except Exception:
+        # Pool cassé (processus tué) : recréé au prochain aperçu, celui-ci
+        # reste en attente pour la commande render_previews.
+        logger.exception("Envoi de l'aperçu #%s au pool impossible", preview_id)
+        with _pool_lock:
+            _pool = None
+
+
+def _rendered_choices(rules, choices):
+    """Seuls les choix que le rendu dessine : zones actives, valeur non vide, texte et police séparés."""
+    from .services import CustomizationService
+
+    rendered = []
+    for zone in rules.zones if rules else ():
+        if not zone.is_active(choices):
+            continue
+        value = choices.get(zone.id)
+        if not value:
+            continue
+        if zone.type == 'text':
+            value = [CustomizationService._extract_text_from_value(value),
+                     CustomizationService._extract_font_from_value(value)]
+        elif zone.type in ('selection', 'shape'):
+            value = str(value)
+        else:
+            continue
+        rendered.append([zone.id, zone.type, dict(zone.preview_config), value])
+    return rendered
+
+
+def preview_fingerprint(product, customization_data):
+    """
+    Empreinte du rendu : mockup du produit, configuration des zones
+    dessinées et choix normalisés. Les clés que le rendu ignore (prix,
+    aperçu client, id d'aperçu) n'en font pas partie.
+    """
+    from .services import CustomizationService
+
+    rules = CustomizationService.get_compiled_rules(product)
+    payload = {
+        'renderer': RENDERER_VERSION,
+        'product': product.pk,
+        'mockup': product.mockup_image.name,
+        'choices': _rendered_choices(rules, (customization_data or {}).get('choices') or {}),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _reusable(fingerprint):
+    preview = (
+        CustomizationPreview.objects.filter(fingerprint=fingerprint)
+        .exclude(status=CustomizationPreview.FAILED).order_by('-created_at').first()
+    )
+    if preview is None or (preview.status == CustomizationPreview.DONE and not preview.display_image):
+        return None
+    return preview
+
+
+def touch_previews(preview_ids):
+    """Marque les aperçus comme utilisés maintenant (une requête). Retourne l'horodatage."""
+    now = timezone.now()
+    preview_ids = [int(pk) for pk in preview_ids if str(pk).isdigit()]
+    if preview_ids:
+        CustomizationPreview.objects.filter(pk__in=preview_ids).update(last_used_at=now)
+    return now
+
+
+def queue_preview(product, customization_data):
+    """
+    Retourne l'aperçu de cette personnalisation : un aperçu de même
+    empreinte (rendu ou en cours), sinon un nouvel aperçu en attente dont
+    le rendu est planifié après le commit. Retourne None si le produit n'a
+    pas de mockup (rien à rendre).
+    """
+    if not product.mockup_image:
+        return None
+    fingerprint = preview_fingerprint(product, customization_data)
+    preview = _reusable(fingerprint)
+    if preview is not None:
+        preview.last_used_at = touch_previews([preview.pk])
+        return preview
+
+    preview = CustomizationPreview.objects.create(
+        product=product,
+        customization_data=customization_data,
+        fingerprint=fingerprint,
+        status=CustomizationPreview.PENDING,
+    )
+    transaction.on_commit(partial(_submit, preview.pk))
+    return preview
+
+
+def _claim(preview_id, stale=False):
+    """Passe l'aperçu en RENDERING s'il est en attente (ou abandonné, avec `stale`). Retourne 1 si pris."""
+    now = timezone.now()
+    claimable = Q(status=CustomizationPreview.PENDING)
+    if stale:
+        claimable |= Q(status=CustomizationPreview.RENDERING, started_at__lt=now - STALE_AFTER)
+    return CustomizationPreview.objects.filter(claimable, pk=preview_id).update(
+        status=CustomizationPreview.RENDERING, started_at=now,
+    )
+
+
+def _encode(image, format, **params):
+    from django.core.files.base import ContentFile
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return ContentFile(buffer.getvalue())
+
+
+def _resized(image, size):
+    if max(image.size) <= size:
+        return image
+    resized = image.copy()
+    resized.thumbnail((size, size))
+    return resized
+
+
+def web_variants(image):
+    """Image d'affichage et miniature WebP d'une image Pillow : {'display': ..., 'thumbnail': ...}."""
+    display = _resized(image, DISPLAY_SIZE)
+    return {
+        'display': _encode(display, 'WEBP', quality=WEBP_QUALITY, method=4),
+        # Réduite depuis l'image d'affichage : moins de pixels à rééchantillonner
+        'thumbnail': _encode(_resized(display, THUMBNAIL_SIZE), 'WEBP', quality=WEBP_QUALITY, method=4),
+    }
+
+
+def _file_name(preview):
+    return preview.fingerprint or f"preview_{preview.product_id}"
+
+
+def _save_master(preview, image):
+    preview.preview_image.save(f"{_file_name(preview)}.png", _encode(image, 'PNG', optimize=True), save=False)
+
+
+def _render(preview, master=False):
+    """Rend les variantes WebP de l'aperçu, et le PNG sans perte si `master`."""
+    from .services import CustomizationService
+
+    image = CustomizationService.render_preview(preview.product, preview.customization_data)
+    if image is not None:
+        variants = web_variants(image)
+        name = _file_name(preview)
+        preview.display_image.save(f"{name}.webp", variants['display'], save=False)
+        preview.thumbnail.save(f"{name}.webp", variants['thumbnail'], save=False)
+        if master:
+            _save_master(preview, image)
+        preview.status = CustomizationPreview.DONE
+    else:
+        preview.status = CustomizationPreview.FAILED
+    preview.rendered_at = timezone.now()
+    preview.save(update_fields=[*VARIANT_FIELDS, 'status', 'rendered_at'])
+    return preview
+
+
+def render_preview(preview_id):
+    """Rend un aperçu en attente. Retourne False s'il est déjà pris par un autre processus."""
+    from django.db import close_old_connections
+
+    close_old_connections()
+    try:
+        if not _claim(preview_id):
+            return False
+        preview = CustomizationPreview.objects.select_related('product').get(pk=preview_id)
+        try:
+            _render(preview)
+        except Exception:
+            logger.exception("Échec du rendu de l'aperçu #%s", preview_id)
+            CustomizationPreview.objects.filter(pk=preview_id).update(
+                status=CustomizationPreview.FAILED, rendered_at=timezone.now(),
+            )
+        return True
+    finally:
+        close_old_connections()
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """Remet en attente les aperçus RENDERING abandonnés. Retourne leur nombre."""
+    return CustomizationPreview.objects.filter(
+        status=CustomizationPreview.RENDERING, started_at__lt=timezone.now() - older_than,
+    ).update(status=CustomizationPreview.PENDING)
+
+
+def render_pending(limit=None):
+    """Rend les aperçus en attente, du plus ancien au plus récent. Retourne le nombre rendu."""
+    rendered = 0
+    while limit is None or rendered < limit:
+        preview_id = (
+            CustomizationPreview.objects.filter(status=CustomizationPreview.PENDING)
+            .order_by('created_at', 'id').values_list('pk', flat=True).first()
+        )
+        if preview_id is None:
+            break
+        if render_preview(preview_id):
+            rendered += 1
+    return rendered
+
+
+def ensure_master(preview):
+    """
+    PNG sans perte d'un aperçu rendu qui n'en a pas encore (rendu en file).
+    Le rendu est refait à la demande ; retourne l'aperçu.
+    """
+    from .services import CustomizationService
+
+    if preview.status != CustomizationPreview.DONE or preview.preview_image:
+        return preview
+    try:
+        image = CustomizationService.render_preview(preview.product, preview.customization_data)
+        if image is not None:
+            _save_master(preview, image)
+            preview.save(update_fields=['preview_image'])
+    except Exception:
+        logger.exception("Échec du rendu du PNG de l'aperçu #%s", preview.pk)
+    return preview
+
+
+def ensure_rendered(preview):
+    """
+    Aperçu prêt pour la commande, PNG sans perte compris : rendu sur place
+    s'il est encore en attente (worker saturé ou arrêté au moment de valider
+    le panier) ou si son rendu a été abandonné (RENDERING depuis plus de
+    STALE_AFTER), PNG ajouté s'il a été rendu par la file.
+    """
+    pending = (CustomizationPreview.PENDING, CustomizationPreview.RENDERING)
+    if preview.status in pending and _claim(preview.pk, stale=True):
+        preview.refresh_from_db()
+        try:
+            _render(preview, master=True)
+        except Exception:
+            logger.exception("Échec du rendu de l'aperçu #%s", preview.pk)
+            preview.status = CustomizationPreview.FAILED
+            preview.save(update_fields=['status'])
+        return preview
+    return ensure_master(preview)
+
+
+def referenced_preview_ids():
+    """Ids d'aperçus cités par un article de panier ou de commande (customization_data.preview_id)."""
+    from store.models import CartItem, WebOrderItem
+
+    ids = set()
+    for model in (CartItem, WebOrderItem):
+        values = (
+            model.objects.filter(customization_data__has_key='preview_id')
+            .values_list('customization_data__preview_id', flat=True)
+        )
+        for value in values.iterator():
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                continue
+    return ids
+
+
+def collect_garbage(max_age, max_entries=None, min_age=None):
+    """
+    Supprime (lignes et fichiers) les aperçus non référencés inutilisés
+    depuis `max_age`, puis les moins récemment utilisés au-delà de
+    `max_entries` aperçus. Les aperçus en attente ou en cours sont gardés.
+    Retourne le nombre supprimé.
+
+    Les paniers vivent dans la session, hors de `referenced_preview_ids` :
+    chaque synchronisation du panier rafraîchit `last_used_at`, et
+    l'éviction LRU ne touche pas aux aperçus utilisés depuis moins de
+    `min_age` (par défaut la durée d'une session).
+    """
+    if min_age is None:
+        min_age = timedelta(seconds=settings.SESSION_COOKIE_AGE)
+    referenced = referenced_preview_ids()
+    now = timezone.now()
+    cutoff = now - max_age
+    evictable = now - min_age
+    excess = None
+    if max_entries is not None:
+        excess = CustomizationPreview.objects.count() - max_entries
+
+    doomed = []
+    candidates = (
+        CustomizationPreview.objects
+        .exclude(status__in=[CustomizationPreview.PENDING, CustomizationPreview.RENDERING])
+        .order_by('last_used_at', 'id')
+        .values_list('pk', 'last_used_at')
+    )
+    for pk, last_used_at in candidates.iterator():
+        if pk in referenced:
+            continue
+        if last_used_at < cutoff:
+            doomed.append(pk)
+        elif excess is not None and len(doomed) < excess and last_used_at < evictable:
+            doomed.append(pk)
+        else:
+            # Trié par dernière utilisation : plus rien d'expiré ni d'évictable
+            break
+
+    for start in range(0, len(doomed), GC_CHUNK_SIZE):
+        chunk = CustomizationPreview.objects.filter(pk__in=doomed[start:start + GC_CHUNK_SIZE])
+        for preview in chunk.only('pk', *VARIANT_FIELDS):
+            for field in VARIANT_FIELDS:
+                file = getattr(preview, field)
+                if not file:
+                    continue
+                try:
+                    file.delete(save=False)
+                except Exception:
+                    logger.exception("Suppression du fichier de l'aperçu #%s impossible", preview.pk)
+        chunk.delete()
+    return len(doomed)
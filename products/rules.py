@@ -0,0 +1,243 @@
+"""
+Règles de personnalisation compilées, par produit.
+
+Les règles effectives d'un produit (config Atelier convertie, surcharge JSON
+ou template) sont construites une fois puis compilées en objet immuable :
+zones indexées par id, valeurs d'options en frozenset, `allowed_chars`
+précompilé, formules de prix en Decimal. Validation, prix, données de
+production et aperçu ne relisent plus ni les M2M de la config ni les URL
+d'images des composants (signées à chaque appel sur Cloudinary).
+
+Le JSON des règles est partagé entre workers via le cache sous un numéro
+de version ; chaque processus garde sa copie compilée. La version d'un
+produit combine une version globale et la sienne (lues en un seul
+`get_many`) : les signaux de products/signals.py incrémentent celle du
+produit quand le produit ou sa config Atelier (et ses M2M) change, et la
+version globale quand un template, un composant ou une police change.
+
+Un appel « chaud » lit encore ces deux versions dans le cache : aucune
+requête avec LocMemCache, une requête sur la table de cache avec
+DatabaseCache (production).
+"""
+import copy
+import re
+import time
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from types import MappingProxyType
+from typing import Any, Dict, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+VERSION_KEY = 'products:customization:version'
+PRODUCT_VERSION_KEY = 'products:customization:{product_id}:version'
+DATA_KEY = 'products:customization:{version}:{product_id}'
+DATA_TIMEOUT = 60 * 60 * 24
+
+# Motif `allowed_chars` invalide : aucun texte n'est accepté
+_NEVER_MATCHES = re.compile(r'(?!)')
+
+_local = {}
+
+
+def _version_keys(product_id):
+    if product_id is None:
+        return [VERSION_KEY]
+    return [VERSION_KEY, PRODUCT_VERSION_KEY.format(product_id=product_id)]
+
+
+def get_rules_version(product_id=None):
+    """Version des règles du produit (version globale seule sans `product_id`)."""
+    keys = _version_keys(product_id)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if versions.get(key) is None:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def invalidate_customization_rules(product_id=None):
+    """
+    Invalide, dans tous les workers, les règles compilées du produit
+    `product_id`, ou de tous les produits sans argument.
+    """
+    key = _version_keys(product_id)[-1]
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            get_rules_version(product_id)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(value if value is not None else 0))
+    except InvalidOperation:
+        return Decimal('0')
+
+
+def _contains(values, value):
+    """`value in values` pour un frozenset, faux pour une valeur non hachable (dict envoyé par le client)."""
+    try:
+        return value in values
+    except TypeError:
+        return False
+
+
+@dataclass(frozen=True)
+class CompiledOption:
+    value: Any
+    label: str
+    price_modifier: Decimal
+
+
+@dataclass(frozen=True)
+class CompiledZone:
+    id: str
+    type: str
+    label: str
+    required: bool
+    # ((clé, valeurs acceptées (frozenset) ou None, valeur attendue), ...)
+    conditions: Tuple
+    max_length: int
+    allowed_chars: Optional[re.Pattern]
+    allowed_fonts: frozenset
+    price_base: Decimal
+    price_per_char: Decimal
+    option_values: frozenset
+    options: MappingProxyType
+    preview_config: MappingProxyType
+
+    def is_active(self, user_choices: Dict) -> bool:
+        """Zone active selon ses conditions (ex : police seulement si type == "text")."""
+        for key, accepted, expected in self.conditions:
+            actual = user_choices.get(key)
+            if accepted is not None:
+                if not _contains(accepted, actual):
+                    return False
+            elif actual != expected:
+                return False
+        return True
+
+    def accepts_option(self, value) -> bool:
+        return _contains(self.option_values, value)
+
+    def option(self, value) -> Optional[CompiledOption]:
+        if not self.accepts_option(value):
+            return None
+        return self.options[value]
+
+
+@dataclass(frozen=True)
+class CompiledRules:
+    raw: Dict
+    zones: Tuple[CompiledZone, ...]
+    zones_by_id: MappingProxyType
+
+    def as_dict(self) -> Dict:
+        """Copie des règles JSON (pour le front) : l'objet compilé reste intact."""
+        return copy.deepcopy(self.raw)
+
+
+def _compile_conditions(conditions):
+    compiled = []
+    for key, expected in (conditions or {}).items():
+        if isinstance(expected, list):
+            accepted = frozenset(value for value in expected if value.__hash__ is not None)
+            compiled.append((key, accepted, None))
+        else:
+            compiled.append((key, None, expected))
+    return tuple(compiled)
+
+
+def _compile_zone(zone: Dict) -> CompiledZone:
+    zone_id = zone.get('id')
+    constraints = zone.get('constraints') or {}
+    price_formula = zone.get('price_formula') or {}
+
+    pattern = constraints.get('allowed_chars')
+    allowed_chars = None
+    if pattern:
+        try:
+            allowed_chars = re.compile(pattern)
+        except re.error:
+            allowed_chars = _NEVER_MATCHES
+
+    options = {}
+    for option in zone.get('options') or []:
+        value = option.get('value')
+        if value.__hash__ is None or value in options:
+            continue  # la première option d'une valeur l'emporte
+        options[value] = CompiledOption(
+            value=value,
+            label=option.get('label', str(value)),
+            price_modifier=_decimal(option.get('price_modifier', 0)),
+        )
+
+    return CompiledZone(
+        id=zone_id,
+        type=zone.get('type'),
+        label=zone.get('label', zone_id),
+        required=bool(zone.get('required', False)),
+        conditions=_compile_conditions(zone.get('conditions')),
+        max_length=constraints.get('max_length', 100),
+        allowed_chars=allowed_chars,
+        allowed_fonts=frozenset(constraints.get('allowed_fonts') or ()),
+        price_base=_decimal(price_formula.get('base', 0)),
+        price_per_char=_decimal(price_formula.get('per_char', 0)),
+        option_values=frozenset(options),
+        options=MappingProxyType(options),
+        preview_config=MappingProxyType(dict(zone.get('preview_config') or {})),
+    )
+
+
+def compile_rules(rules: Optional[Dict]) -> Optional[CompiledRules]:
+    if not rules:
+        return None
+    raw = copy.deepcopy(rules)
+    zones = tuple(_compile_zone(zone) for zone in raw.get('zones', []))
+    return CompiledRules(
+        raw=raw,
+        zones=zones,
+        zones_by_id=MappingProxyType({zone.id: zone for zone in zones}),
+    )
+
+
+def _publish(product_id, version, rules, compiled):
+    _local[product_id] = (version, compiled)
+    cache.set(DATA_KEY.format(version=version, product_id=product_id), {'rules': rules}, timeout=DATA_TIMEOUT)
+
+
+def get_compiled_rules(product, build) -> Optional[CompiledRules]:
+    """
+    Règles compilées du produit pour la version courante. `build(product)`
+    construit le JSON des règles (une fois par version, tous workers confondus).
+    """
+    if product.pk is None:
+        return compile_rules(build(product))
+
+    version = get_rules_version(product.pk)
+    local = _local.get(product.pk)
+    if local is not None and local[0] == version:
+        return local[1]
+
+    shared = cache.get(DATA_KEY.format(version=version, product_id=product.pk))
+    if shared is not None:
+        compiled = compile_rules(shared['rules'])
+        _local[product.pk] = (version, compiled)
+        return compiled
+
+    rules = build(product)
+    compiled = compile_rules(rules)
+    # Construites dans une transaction, les règles peuvent refléter des
+    # écritures non validées : partagées seulement après le commit.
+    transaction.on_commit(partial(_publish, product.pk, version, rules, compiled))
+    return compiled
@@ -0,0 +1,195 @@
+"""
+Recherche de produits (caisse, liste des produits, boutique en ligne).
+
+Une seule API, `ProductSearch`, pour les trois écrans :
+- PostgreSQL : `icontains` tel quel, servi par les index GIN trigrammes
+  (pg_trgm) sur UPPER(name) et UPPER(barcode) créés par la migration 0018 ;
+- autres bases (SQLite en développement) : index n-grammes en mémoire qui
+  renvoie les identifiants candidats, la requête ne filtre plus que par clé
+  primaire.
+
+Classement commun : code-barres exact > nom commençant par la saisie > le reste.
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from functools import partial
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Upper
+
+from .models import Product
+
+
+VERSION_KEY = 'products:search:version'
+NGRAM = 3
+
+# Au-delà, la recherche est trop peu sélective pour qu'un index serve :
+# on laisse la base filtrer (et on évite un IN (...) géant).
+MAX_CANDIDATES = 2000
+
+_local = {}
+
+
+def normalize(text):
+    return (text or '').strip().upper()
+
+
+def get_index_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_search_index():
+    """Invalide l'index n-grammes dans tous les workers (immédiatement et après commit)."""
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            get_index_version()
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class NgramIndex:
+    """
+    Index en mémoire de tous les produits :
+    - trigrammes → identifiants (recherche « contient ») ;
+    - mots triés (recherche par préfixe pour les saisies de 1 ou 2 caractères) ;
+    - code-barres → identifiants (correspondance exacte).
+    Les candidats sont revérifiés sur le texte, il n'y a pas de faux positif.
+    """
+
+    FIELDS = ('name', 'barcode', 'category')
+
+    def __init__(self, rows):
+        self.texts = {}
+        self.postings = defaultdict(list)
+        self.barcodes = defaultdict(list)
+        words = set()
+        for product_id, name, barcode, category in rows:
+            fields = {'name': normalize(name), 'barcode': normalize(barcode), 'category': normalize(category)}
+            self.texts[product_id] = fields
+            if fields['barcode']:
+                self.barcodes[fields['barcode']].append(product_id)
+            grams = set()
+            for value in fields.values():
+                grams |= _ngrams(value)
+                words.update((word, product_id) for word in value.split())
+            for gram in grams:
+                self.postings[gram].append(product_id)
+        self.words = sorted(words)
+
+    @classmethod
+    def build(cls):
+        return cls(Product.objects.values_list('id', 'name', 'barcode', 'category__name').iterator(chunk_size=5000))
+
+    def _matches(self, product_id, query, fields):
+        texts = self.texts[product_id]
+        return any(query in texts[field] for field in fields)
+
+    def _prefix(self, query, fields):
+        ids = set()
+        for position in range(bisect_left(self.words, (query,)), len(self.words)):
+            word, product_id = self.words[position]
+            if not word.startswith(query):
+                break
+            ids.add(product_id)
+        return {product_id for product_id in ids if self._matches(product_id, query, fields)}
+
+    def search(self, query, fields=FIELDS):
+        """Identifiants des produits dont un des champs contient la saisie."""
+        query = normalize(query)
+        if not query:
+            return set()
+        if len(query) < NGRAM:
+            ids = self._prefix(query, fields)
+        else:
+            lists = [self.postings.get(gram, ()) for gram in _ngrams(query)]
+            rarest = min(lists, key=len)
+            ids = {product_id for product_id in rarest if self._matches(product_id, query, fields)}
+        return ids | set(self.barcodes.get(query, ()))
+
+
+def _publish(version, index):
+    _local['index'] = (version, index)
+
+
+def get_search_index():
+    version = get_index_version()
+    local = _local.get('index')
+    if local is not None and local[0] == version:
+        return local[1]
+    index = NgramIndex.build()
+    # Construit dans une transaction, l'index peut contenir des écritures non
+    # validées : il n'est gardé qu'après le commit.
+    transaction.on_commit(partial(_publish, version, index))
+    return index
+
+
+class ProductSearch:
+    """
+    Filtre et classe un queryset de produits selon une saisie.
+
+    Usage:
+        products = ProductSearch(query, fields=('name', 'barcode')).apply(queryset)
+
+    `fields` : champs cherchés en « contient » parmi name, barcode et category.
+    Le code-barres exact est toujours accepté (scanner, douchette).
+    """
+
+    FIELDS = ('name', 'barcode')
+    LOOKUPS = {
+        'name': 'name__icontains',
+        'barcode': 'barcode__icontains',
+        'category': 'category__name__icontains',
+    }
+
+    def __init__(self, query, fields=FIELDS):
+        self.query = (query or '').strip()
+        self.fields = tuple(fields)
+
+    def _sql_filter(self, queryset):
+        condition = Q(barcode_upper=normalize(self.query))
+        for field in self.fields:
+            condition |= Q(**{self.LOOKUPS[field]: self.query})
+        return queryset.annotate(barcode_upper=Upper('barcode')).filter(condition)
+
+    def _index_filter(self, queryset, index):
+        ids = index.search(self.query, self.fields)
+        if len(ids) > MAX_CANDIDATES:
+            return self._sql_filter(queryset)
+        return queryset.filter(pk__in=ids)
+
+    def filter(self, queryset):
+        if not self.query:
+            return queryset
+        if connections[queryset.db].vendor == 'postgresql':
+            return self._sql_filter(queryset)
+        return self._index_filter(queryset, get_search_index())
+
+    def rank(self, queryset):
+        """Trie : code-barres exact (0), nom qui commence par la saisie (1), le reste (2)."""
+        if not self.query:
+            return queryset
+        return queryset.annotate(
+            search_rank=Case(
+                When(barcode__iexact=self.query, then=Value(0)),
+                When(name__istartswith=self.query, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            )
+        ).order_by('search_rank', 'name', 'id')
+
+    def apply(self, queryset):
+        return self.rank(self.filter(queryset))
@@ -3,12 +3,14 @@ Service de Personnalisation Produit
 Moteur de règles basé sur JSON avec validation et pricing sécurisé
 """
 import json
-import re
+import logging
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 from .models import ProductCustomizationConfig, CustomizableComponent, CustomizationFont
+from .rules import CompiledRules, CompiledZone, get_compiled_rules
 from typing import Dict, Any, Optional, List
 
+logger = logging.getLogger(__name__)
 
 class CustomizationService:
     """
@@ -23,9 +25,22 @@ class CustomizationService:
     @staticmethod
     def get_product_rules(product) -> Optional[Dict]:
         """
-        Récupère les règles actives.
+        Récupère les règles actives (copie JSON, pour le front).
         Si une config Atelier existe, elle est convertie en structure JSON compatible.
         """
+        compiled = CustomizationService.get_compiled_rules(product)
+        return compiled.as_dict() if compiled else None
+
+    @staticmethod
+    def get_compiled_rules(product) -> Optional[CompiledRules]:
+        """Règles actives compilées, en cache par produit et version (products/rules.py)."""
+        if not product.is_customizable:
+            return None
+        return get_compiled_rules(product, CustomizationService.build_product_rules)
+
+    @staticmethod
+    def build_product_rules(product) -> Optional[Dict]:
+        """Construit les règles actives depuis la base (sans cache)."""
         if not product.is_customizable:
             return None
         
@@ -33,7 +48,7 @@ class CustomizationService:
         try:
             config = product.customization_config
             return CustomizationService.convert_studio_config_to_rules(config)
-        except:
+        except Exception:
             pass
 
         # 2. Surcharge locale (JSON brut legacy)
@@ -102,29 +117,6 @@ class CustomizationService:
     # 2. VALIDATION CONDITIONNELLE
     # ==========================================
     
-    @staticmethod
-    def _is_zone_active(zone: Dict, user_choices: Dict) -> bool:
-        """
-        Vérifie si une zone est active selon ses conditions.
-        Ex: zone "font" active seulement si choices["type"] == "text"
-        """
-        conditions = zone.get('conditions', {})
-        if not conditions:
-            return True
-        
-        for key, expected_value in conditions.items():
-            actual_value = user_choices.get(key)
-            
-            # Support des valeurs multiples
-            if isinstance(expected_value, list):
-                if actual_value not in expected_value:
-                    return False
-            else:
-                if actual_value != expected_value:
-                    return False
-        
-        return True
-    
     @staticmethod
     def _extract_text_from_value(value: Any) -> str:
         """Extrait le texte d'une valeur (str ou dict)"""
@@ -158,30 +150,26 @@ class CustomizationService:
         Raises:
             ValidationError: Si validation échoue
         """
-        rules = CustomizationService.get_product_rules(product)
+        rules = CustomizationService.get_compiled_rules(product)
         
         if not rules:
             if customization_data and customization_data.get('choices'):
                 raise ValidationError("Ce produit n'est pas personnalisable.")
             return
         
-        zones = rules.get('zones', [])
         user_choices = customization_data.get('choices', {})
         
-        for zone in zones:
+        for zone in rules.zones:
             # Vérifier si la zone est active
-            if not CustomizationService._is_zone_active(zone, user_choices):
+            if not zone.is_active(user_choices):
                 continue
             
-            zone_id = zone.get('id')
-            zone_label = zone.get('label', zone_id)
-            is_required = zone.get('required', False)
-            zone_type = zone.get('type')
-            user_value = user_choices.get(zone_id)
+            zone_type = zone.type
+            user_value = user_choices.get(zone.id)
             
             # 1. Vérif Requis
-            if is_required and not user_value:
-                raise ValidationError(f"Le champ '{zone_label}' est obligatoire.")
+            if zone.required and not user_value:
+                raise ValidationError(f"Le champ '{zone.label}' est obligatoire.")
             
             if not user_value:
                 continue
@@ -197,49 +185,39 @@ class CustomizationService:
                 CustomizationService._validate_image_zone(zone, user_value)
     
     @staticmethod
-    def _validate_text_zone(zone: Dict, value: Any) -> None:
+    def _validate_text_zone(zone: CompiledZone, value: Any) -> None:
         """Valide une zone de type texte"""
         text = CustomizationService._extract_text_from_value(value)
         font = CustomizationService._extract_font_from_value(value)
-        constraints = zone.get('constraints', {})
-        zone_label = zone.get('label', zone['id'])
         
         # Longueur max
-        max_length = constraints.get('max_length', 100)
-        if len(text) > max_length:
+        if len(text) > zone.max_length:
             raise ValidationError(
-                f"'{zone_label}': Texte trop long ({len(text)}/{max_length} caractères)."
+                f"'{zone.label}': Texte trop long ({len(text)}/{zone.max_length} caractères)."
             )
         
-        # Caractères autorisés (regex)
-        allowed_chars_pattern = constraints.get('allowed_chars')
-        if allowed_chars_pattern:
-            if not re.match(allowed_chars_pattern, text):
-                raise ValidationError(
-                    f"'{zone_label}': Caractères non autorisés dans le texte."
-                )
+        # Caractères autorisés (regex précompilée)
+        if zone.allowed_chars is not None and not zone.allowed_chars.match(text):
+            raise ValidationError(
+                f"'{zone.label}': Caractères non autorisés dans le texte."
+            )
         
         # Police autorisée
-        allowed_fonts = constraints.get('allowed_fonts', [])
-        if allowed_fonts and font not in allowed_fonts:
+        if zone.allowed_fonts and font not in zone.allowed_fonts:
             raise ValidationError(
-                f"'{zone_label}': Police '{font}' non autorisée."
+                f"'{zone.label}': Police '{font}' non autorisée."
             )
     
     @staticmethod
-    def _validate_selection_zone(zone: Dict, value: str) -> None:
+    def _validate_selection_zone(zone: CompiledZone, value: str) -> None:
         """Valide une zone de sélection"""
-        options = zone.get('options', [])
-        valid_values = [opt['value'] for opt in options]
-        zone_label = zone.get('label', zone['id'])
-        
-        if value not in valid_values:
+        if not zone.accepts_option(value):
             raise ValidationError(
-                f"'{zone_label}': Choix '{value}' invalide."
+                f"'{zone.label}': Choix '{value}' invalide."
             )
     
     @staticmethod
-    def _validate_image_zone(zone: Dict, value: Any) -> None:
+    def _validate_image_zone(zone: CompiledZone, value: Any) -> None:
         """Valide une zone image (upload ou URL)"""
         # Pour l'instant simple, on peut ajouter validation taille/format
         if isinstance(value, dict):
@@ -259,54 +237,40 @@ class CustomizationService:
         Returns:
             Decimal: Coût extra (sans le prix de base du produit)
         """
-        rules = CustomizationService.get_product_rules(product)
+        rules = CustomizationService.get_compiled_rules(product)
         if not rules:
             return Decimal('0.00')
         
         extra_cost = Decimal('0.00')
-        zones = rules.get('zones', [])
         user_choices = customization_data.get('choices', {})
         
-        for zone in zones:
+        for zone in rules.zones:
             # Ignorer les zones inactives
-            if not CustomizationService._is_zone_active(zone, user_choices):
+            if not zone.is_active(user_choices):
                 continue
             
-            zone_id = zone.get('id')
-            user_value = user_choices.get(zone_id)
+            user_value = user_choices.get(zone.id)
             
             if not user_value:
                 continue
             
-            price_formula = zone.get('price_formula', {})
-            zone_type = zone.get('type')
-            
             # TEXTE: base + per_char
-            if zone_type == 'text':
-                base = Decimal(str(price_formula.get('base', 0)))
-                per_char = Decimal(str(price_formula.get('per_char', 0)))
-                
+            if zone.type == 'text':
                 text = CustomizationService._extract_text_from_value(user_value)
                 char_count = len(text)
                 
                 if char_count > 0:
-                    extra_cost += base + (char_count * per_char)
+                    extra_cost += zone.price_base + (char_count * zone.price_per_char)
             
             # SÉLECTION: price_modifier de l'option
-            elif zone_type == 'selection':
-                options = zone.get('options', [])
-                selected_option = next(
-                    (opt for opt in options if opt['value'] == user_value),
-                    None
-                )
+            elif zone.type == 'selection':
+                selected_option = zone.option(user_value)
                 if selected_option:
-                    modifier = Decimal(str(selected_option.get('price_modifier', 0)))
-                    extra_cost += modifier
+                    extra_cost += selected_option.price_modifier
             
             # IMAGE: coût fixe upload
-            elif zone_type == 'image':
-                upload_cost = Decimal(str(price_formula.get('base', 0)))
-                extra_cost += upload_cost
+            elif zone.type == 'image':
+                extra_cost += zone.price_base
         
         return extra_cost
     
@@ -340,26 +304,23 @@ class CustomizationService:
                 "special_notes": "Non remboursable, délai 3j"
             }
         """
-        rules = CustomizationService.get_product_rules(product)
+        rules = CustomizationService.get_compiled_rules(product)
         user_choices = customization_data.get('choices', {})
         
         instructions = []
         
         if rules:
-            zones = rules.get('zones', [])
-            
-            for zone in zones:
-                if not CustomizationService._is_zone_active(zone, user_choices):
+            for zone in rules.zones:
+                if not zone.is_active(user_choices):
                     continue
                 
-                zone_id = zone.get('id')
-                zone_label = zone.get('label', zone_id)
-                user_value = user_choices.get(zone_id)
+                zone_label = zone.label
+                user_value = user_choices.get(zone.id)
                 
                 if not user_value:
                     continue
                 
-                zone_type = zone.get('type')
+                zone_type = zone.type
                 
                 if zone_type == 'text':
                     text = CustomizationService._extract_text_from_value(user_value)
@@ -376,12 +337,11 @@ class CustomizationService:
                     })
                 
                 elif zone_type == 'selection':
-                    options = zone.get('options', [])
-                    selected = next((o for o in options if o['value'] == user_value), None)
+                    selected = zone.option(user_value)
                     if selected:
                         instructions.append({
                             "zone": zone_label,
-                            "action": f"Appliquer: {selected['label']}"
+                            "action": f"Appliquer: {selected.label}"
                         })
             
             # Fallback for generic image uploads
@@ -479,76 +439,75 @@ class CustomizationService:
     @staticmethod
     def generate_preview_image(product, customization_data: Dict) -> Optional[Any]:
         """
-        Génère une image de prévisualisation fusionnée.
-        Utilise Pillow pour coller le texte/formes sur le mockup.
+        Génère une image de prévisualisation fusionnée, en PNG.
+        Les variantes WebP sont produites par products/previews.py.
         """
-        from PIL import Image, ImageDraw, ImageFont
         import io
         from django.core.files.base import ContentFile
+
+        image = CustomizationService.render_preview(product, customization_data)
+        if image is None:
+            return None
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return ContentFile(buffer.getvalue(), name=f"preview_{product.id}.png")
+
+    @staticmethod
+    def render_preview(product, customization_data: Dict) -> Optional[Any]:
+        """
+        Dessine la personnalisation sur le mockup et retourne l'image Pillow (RGBA).
+        Utilise Pillow pour coller le texte/formes sur le mockup ; mockup,
+        polices et symboles viennent du cache de products/preview_assets.py.
+        """
+        from PIL import ImageDraw
+        from . import preview_assets
         
         if not product.mockup_image:
             return None
             
         try:
-            # Ouvrir le mockup
-            mockup = Image.open(product.mockup_image.path).convert('RGBA')
+            # Copie du mockup décodé (RGBA)
+            mockup = preview_assets.get_mockup(product)
             draw = ImageDraw.Draw(mockup)
             
-            rules = CustomizationService.get_product_rules(product)
+            rules = CustomizationService.get_compiled_rules(product)
             user_choices = customization_data.get('choices', {})
             
-            for zone in rules.get('zones', []):
-                if not CustomizationService._is_zone_active(zone, user_choices):
+            for zone in rules.zones:
+                if not zone.is_active(user_choices):
                     continue
                 
-                zone_id = zone.get('id')
-                user_value = user_choices.get(zone_id)
+                user_value = user_choices.get(zone.id)
                 if not user_value:
                     continue
                 
-                config = zone.get('preview_config', {})
+                config = zone.preview_config
                 pos = config.get('position', {'x': 50, 'y': 50})
                 
                 # Conversion % en pixels
                 pixel_x = (pos['x'] * mockup.width) / 100
                 pixel_y = (pos['y'] * mockup.height) / 100
                 
-                if zone['type'] == 'text':
+                if zone.type == 'text':
                     text = CustomizationService._extract_text_from_value(user_value)
                     font_name = CustomizationService._extract_font_from_value(user_value)
-                    size = config.get('size', 20)
+                    size = config.get('size', preview_assets.DEFAULT_TEXT_SIZE)
                     color = config.get('color', '#000000')
                     
-                    # Tentative de chargement de police (fallback Arial)
-                    try:
-                        # On pourrait chercher dans un dossier media/fonts/
-                        font = ImageFont.truetype(f"static/fonts/{font_name}.ttf", size)
-                    except:
-                        font = ImageFont.load_default()
-                        
+                    font = preview_assets.get_font(font_name, size)
                     draw.text((pixel_x, pixel_y), text, fill=color, font=font, anchor="mm")
                     
-                elif (zone['type'] == 'selection' or zone['type'] == 'shape') and user_value:
-                    # Render Symbol/Shape
-                    # We can use a library of PNG/SVG icons in static/img/symbols/
-                    symbol_path = f"static/img/symbols/{user_value}.png"
-                    try:
-                        symbol_img = Image.open(symbol_path).convert('RGBA')
-                        size = config.get('size', 40)
-                        symbol_img.thumbnail((size, size))
-                        # Center symbol on position
+                elif (zone.type == 'selection' or zone.type == 'shape') and user_value:
+                    # Symbole static/img/symbols/<valeur>.png centré sur la position
+                    size = config.get('size', preview_assets.DEFAULT_SYMBOL_SIZE)
+                    symbol_img = preview_assets.get_symbol(str(user_value), size)
+                    if symbol_img is not None:
                         mockup.paste(symbol_img, (int(pixel_x - size/2), int(pixel_y - size/2)), symbol_img)
-                    except:
-                        # Fallback: draw a basic shape or skip
-                        pass
             
-            # Sauvegarder dans un buffer
-            buffer = io.BytesIO()
-            mockup.save(buffer, format='PNG')
-            return ContentFile(buffer.getvalue(), name=f"preview_{product.id}.png")
+            return mockup
             
-        except Exception as e:
-            print(f"Error generating preview: {e}")
+        except Exception:
+            logger.exception("Error generating preview for product #%s", product.pk)
             return None
 
     # ==========================================
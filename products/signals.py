@@ -0,0 +1,106 @@
+"""
+Signaux Django pour les produits.
+Tiennent à jour l'index code-barres de la caisse (products/barcode_index.py),
+l'index de recherche en mémoire (products/search.py), les règles de
+personnalisation compilées (products/rules.py) et le journal des prix de
+vente (ProductPriceChange).
+"""
+from decimal import Decimal
+
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .barcode_index import invalidate_barcode_index
+from .models import (
+    Category, CustomizableComponent, CustomizationFont, CustomizationTemplate, Product,
+    ProductCustomizationConfig, ProductPriceChange,
+)
+from .rules import invalidate_customization_rules
+from .search import invalidate_search_index
+
+
+@receiver(post_init, sender=Product)
+def remember_barcode_shop(sender, instance, **kwargs):
+    """Un produit déplacé vers une autre boutique doit sortir de l'ancien index."""
+    instance._barcode_shop_id = instance.__dict__.get('shop_id')
+
+
+@receiver(post_init, sender=Product)
+def remember_selling_price(sender, instance, **kwargs):
+    instance._saved_selling_price = instance.__dict__.get('selling_price') if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def journal_price_change(sender, instance, created, **kwargs):
+    """Prix de vente modifié : ancien et nouveau prix au journal (prix hors ligne vérifiés avec)."""
+    previous = getattr(instance, '_saved_selling_price', None)
+    current = instance.__dict__.get('selling_price')
+    if not created and previous is not None and current is not None \
+            and Decimal(str(previous)) != Decimal(str(current)):
+        ProductPriceChange.objects.create(product=instance, previous_price=previous, selling_price=current)
+    instance._saved_selling_price = current
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_barcodes_on_product_change(sender, instance, **kwargs):
+    shop_ids = {instance.shop_id, getattr(instance, '_barcode_shop_id', None)} - {None}
+    for shop_id in shop_ids:
+        invalidate_barcode_index(shop_id)
+    instance._barcode_shop_id = instance.shop_id
+    invalidate_search_index()
+
+
+@receiver(post_save, sender=Category)
+def invalidate_barcodes_on_category_change(sender, instance, created, **kwargs):
+    """Le nom de catégorie fait partie de la fiche renvoyée au scan et du texte cherché."""
+    if created:
+        return
+    if instance.shop_id:
+        invalidate_barcode_index(instance.shop_id)
+    invalidate_search_index()
+
+
+# Sources des règles de personnalisation propres à un produit : le produit
+# (template, surcharge JSON, prix de gravure) et sa config Atelier
+CUSTOMIZATION_PRODUCT_MODELS = [Product, ProductCustomizationConfig]
+# Sources partagées entre produits : templates, composants et polices
+CUSTOMIZATION_SOURCE_MODELS = [CustomizationTemplate, CustomizableComponent, CustomizationFont]
+CUSTOMIZATION_SOURCE_M2M = [
+    ProductCustomizationConfig.allowed_components.through,
+    ProductCustomizationConfig.allowed_fonts.through,
+]
+
+
+def _rules_product_id(instance):
+    return instance.pk if isinstance(instance, Product) else instance.product_id
+
+
+def invalidate_product_rules_on_change(sender, instance, **kwargs):
+    invalidate_customization_rules(_rules_product_id(instance))
+
+
+def invalidate_rules_on_change(sender, **kwargs):
+    invalidate_customization_rules()
+
+
+def invalidate_rules_on_m2m_change(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, ProductCustomizationConfig):
+        invalidate_customization_rules(instance.product_id)
+    else:
+        # Modifié depuis le composant ou la police : configs concernées inconnues
+        invalidate_customization_rules()
+
+
+for model in CUSTOMIZATION_PRODUCT_MODELS:
+    post_save.connect(invalidate_product_rules_on_change, sender=model, dispatch_uid=f'rules_save_{model._meta.label}')
+    post_delete.connect(invalidate_product_rules_on_change, sender=model, dispatch_uid=f'rules_delete_{model._meta.label}')
+
+for model in CUSTOMIZATION_SOURCE_MODELS:
+    post_save.connect(invalidate_rules_on_change, sender=model, dispatch_uid=f'rules_save_{model._meta.label}')
+    post_delete.connect(invalidate_rules_on_change, sender=model, dispatch_uid=f'rules_delete_{model._meta.label}')
+
+for through in CUSTOMIZATION_SOURCE_M2M:
+    m2m_changed.connect(invalidate_rules_on_m2m_change, sender=through, dispatch_uid=f'rules_m2m_{through._meta.label}')
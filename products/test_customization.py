@@ -1,6 +1,21 @@
-from django.test import TestCase, Client
+import io
+import os
+import tempfile
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
-from products.models import Product, Category, CustomizationTemplate
+from django.utils import timezone
+from products.models import (
+    Product, Category, CustomizationPreview, CustomizationTemplate, CustomizableComponent, CustomizationFont,
+    ProductCustomizationConfig,
+)
+from products import preview_assets
+from products.previews import collect_garbage, ensure_rendered, queue_preview, render_pending
 from products.services import CustomizationService
 from django.contrib.auth.models import User
 from decimal import Decimal
@@ -104,3 +119,354 @@ class CustomizationLogicTest(TestCase):
         self.assertTrue(key.startswith(str(self.product.id)))
         self.assertEqual(session_cart[key]['quantity'], 2)
         self.assertEqual(session_cart[key]['customization']['choices']['engraving']['text'], "Marie")
+
+
+@override_settings(STORE_CATALOG_BACKGROUND_REBUILD=False)
+class CompiledRulesTest(TestCase):
+    """Règles compilées en cache par produit et version"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Atelier")
+        self.product = Product.objects.create(
+            name="Médaillon", purchase_price=Decimal("10.00"), selling_price=Decimal("30.00"),
+            engraving_price=Decimal("4.00"), category=category, is_customizable=True,
+        )
+        self.heart = CustomizableComponent.objects.create(
+            name="Cœur", image="customization/components/coeur.png",
+            shape_identifier="heart", base_price_modifier=Decimal("2.50"),
+        )
+        self.star = CustomizableComponent.objects.create(
+            name="Étoile", image="customization/components/etoile.png",
+            shape_identifier="star", base_price_modifier=Decimal("3.00"),
+        )
+        font = CustomizationFont.objects.create(name="Script", font_family="Dancing Script")
+        self.config = ProductCustomizationConfig.objects.create(
+            product=self.product, studio_config={"max_length": 8},
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.allowed_components.add(self.heart, self.star)
+            self.config.allowed_fonts.add(font)
+        self.data = {"choices": {
+            "studio_component": str(self.heart.id),
+            "studio_engraving": {"text": "Lea", "font": "Dancing Script"},
+        }}
+
+    def _price(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CustomizationService.calculate_customization_price(self.product, self.data)
+
+    def test_warm_rules_do_not_query(self):
+        self.assertEqual(self._price(), Decimal("6.50"))
+
+        with self.assertNumQueries(0):
+            CustomizationService.validate_customization_data(self.product, self.data)
+            self.assertEqual(CustomizationService.calculate_customization_price(self.product, self.data), Decimal("6.50"))
+            CustomizationService.generate_production_data(self.product, self.data)
+
+        with self.assertRaises(ValidationError):
+            CustomizationService.validate_customization_data(
+                self.product, {"choices": {"studio_component": str(self.heart.id),
+                                           "studio_engraving": {"text": "Lea", "font": "Arial"}}},
+            )
+
+    def test_component_and_m2m_changes_invalidate(self):
+        self._price()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.heart.base_price_modifier = Decimal("5.00")
+            self.heart.save()
+        self.assertEqual(self._price(), Decimal("9.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.allowed_components.remove(self.heart)
+        with self.assertRaises(ValidationError):
+            CustomizationService.validate_customization_data(self.product, self.data)
+
+    def test_product_changes_invalidate_only_that_product(self):
+        from products.rules import get_rules_version
+
+        other = Product.objects.create(
+            name="Plaque", purchase_price=Decimal("10.00"), selling_price=Decimal("20.00"),
+            category=self.product.category,
+        )
+        before = get_rules_version(self.product.pk), get_rules_version(other.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.studio_config = {"max_length": 2}
+            self.config.save()
+        self.assertNotEqual(get_rules_version(self.product.pk), before[0])
+        self.assertEqual(get_rules_version(other.pk), before[1])
+        with self.assertRaises(ValidationError):
+            CustomizationService.validate_customization_data(self.product, self.data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.heart.save()
+        self.assertNotEqual(get_rules_version(other.pk), before[1])
+
+    def test_rules_copy_does_not_alter_compiled_rules(self):
+        rules = CustomizationService.get_product_rules(self.product)
+        rules["zones"][0]["options"][0]["price_modifier"] = 1000
+
+        self.assertEqual(self._price(), Decimal("6.50"))
+
+    def test_invalid_allowed_chars_pattern_rejects_text(self):
+        template = CustomizationTemplate.objects.create(name="Regex", rules={"zones": [{
+            "id": "engraving", "type": "text", "label": "Gravure",
+            "constraints": {"allowed_chars": "[a-z"},
+        }]})
+        self.config.delete()
+        self.product.customization_template = template
+        self.product.save()
+
+        with self.assertRaises(ValidationError):
+            CustomizationService.validate_customization_data(self.product, {"choices": {"engraving": "abc"}})
+
+
+@override_settings(STORE_CATALOG_BACKGROUND_REBUILD=False, CUSTOMIZATION_PREVIEW_WORKERS=0)
+class PreviewQueueTest(TestCase):
+    """Aperçus rendus hors requête"""
+
+    def setUp(self):
+        from PIL import Image
+
+        cache.clear()
+        preview_assets.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 800), 'white').save(buffer, format='PNG')
+        template = CustomizationTemplate.objects.create(name="Gravure", rules={"zones": [{
+            "id": "engraving", "type": "text", "label": "Gravure",
+            "preview_config": {"position": {"x": 50, "y": 50}, "size": 12},
+        }]})
+        self.product = Product.objects.create(
+            name="Plaque", purchase_price=Decimal("10.00"), selling_price=Decimal("20.00"),
+            category=Category.objects.create(name="Aperçus"), is_customizable=True,
+            customization_template=template,
+            mockup_image=SimpleUploadedFile('plaque.png', buffer.getvalue(), content_type='image/png'),
+        )
+        self.user = User.objects.create_user(username='apercu', password='Secret123!')
+        self.client.force_login(self.user)
+        self.customization = {"choices": {"engraving": "Noa"}}
+
+    def _sync(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('store:sync_cart'),
+                data=json.dumps({"cart": [{"productId": self.product.id, "quantity": 1,
+                                           "customization": dict(self.customization)}]}),
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_add_to_cart_returns_pending_preview_rendered_by_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('store:add_to_cart', args=[self.product.id]),
+                data=json.dumps({"customization": self.customization}), content_type='application/json',
+            )
+        preview = response.json()['preview']
+        self.assertEqual(preview['status'], CustomizationPreview.PENDING)
+        self.assertIsNone(preview['url'])
+
+        call_command('render_previews', '--once', stdout=io.StringIO())
+
+        status = self.client.get(preview['status_url']).json()
+        self.assertEqual(status['status'], CustomizationPreview.DONE)
+        self.assertTrue(status['url'].endswith('.webp'))
+        self.assertTrue(status['thumbnail_url'].endswith('.webp'))
+
+        self.client.force_login(User.objects.create_user(username='autre', password='Secret123!'))
+        self.assertEqual(self.client.get(preview['status_url']).status_code, 404)
+
+    def test_sync_cart_reuses_preview_of_unchanged_item(self):
+        first = self._sync()
+        self.assertEqual(len(first['previews']), 1)
+
+        self.assertEqual(self._sync()['previews'], {})
+        self.assertEqual(CustomizationPreview.objects.count(), 1)
+        cart = self.client.session['cart']
+        self.assertEqual(list(cart.values())[0]['customization']['preview_id'],
+                         list(first['previews'].values())[0]['id'])
+
+    def test_pending_preview_is_rendered_on_demand(self):
+        preview = queue_preview(self.product, self.customization)
+
+        preview = ensure_rendered(preview)
+        self.assertEqual(preview.status, CustomizationPreview.DONE)
+        self.assertTrue(preview.preview_image)
+
+    def test_abandoned_render_is_taken_over_on_demand(self):
+        from products.previews import STALE_AFTER
+
+        preview = queue_preview(self.product, self.customization)
+        CustomizationPreview.objects.filter(pk=preview.pk).update(
+            status=CustomizationPreview.RENDERING, started_at=timezone.now(),
+        )
+        preview.refresh_from_db()
+        self.assertEqual(ensure_rendered(preview).status, CustomizationPreview.RENDERING)
+
+        CustomizationPreview.objects.filter(pk=preview.pk).update(
+            started_at=timezone.now() - STALE_AFTER - timedelta(minutes=1),
+        )
+        preview.refresh_from_db()
+        preview = ensure_rendered(preview)
+        self.assertEqual(preview.status, CustomizationPreview.DONE)
+        self.assertTrue(preview.preview_image)
+
+    def test_render_keeps_lossless_master_and_webp_variants(self):
+        from PIL import Image
+
+        preview = ensure_rendered(queue_preview(self.product, self.customization))
+
+        sizes = {}
+        for field in ('preview_image', 'display_image', 'thumbnail'):
+            with getattr(preview, field).open('rb') as handle:
+                image = Image.open(handle)
+                sizes[field] = (image.format, image.size)
+        self.assertEqual(sizes, {
+            'preview_image': ('PNG', (1600, 800)),
+            'display_image': ('WEBP', (1024, 512)),
+            'thumbnail': ('WEBP', (240, 120)),
+        })
+        self.assertLess(preview.thumbnail.size, preview.display_image.size)
+
+    def test_queue_renders_webp_only_and_order_adds_master(self):
+        from products.previews import ensure_master
+
+        preview = queue_preview(self.product, self.customization)
+        render_pending()
+        preview.refresh_from_db()
+        self.assertEqual(preview.status, CustomizationPreview.DONE)
+        self.assertTrue(preview.display_image.name.endswith('.webp'))
+        self.assertTrue(preview.thumbnail.name.endswith('.webp'))
+        self.assertFalse(preview.preview_image)
+
+        preview = ensure_rendered(preview)
+        self.assertTrue(preview.preview_image.name.endswith('.png'))
+        name = preview.preview_image.name
+        self.assertEqual(ensure_master(preview).preview_image.name, name)
+
+    def test_product_without_mockup_has_no_preview(self):
+        self.product.mockup_image = None
+        self.product.save()
+
+        self.assertIsNone(queue_preview(self.product, self.customization))
+
+    def test_identical_customization_reuses_rendered_preview(self):
+        first = queue_preview(self.product, self.customization)
+        render_pending()
+
+        same = queue_preview(self.product, {"choices": {"engraving": "Noa", "ignored": "x"},
+                                            "extra_cost": 0, "preview": "data:image/png;base64,AAAA"})
+        self.assertEqual(same.pk, first.pk)
+        self.assertEqual(same.status, CustomizationPreview.DONE)
+        self.assertTrue(same.display_image.name.endswith(f"{first.fingerprint}.webp"))
+
+        other = queue_preview(self.product, {"choices": {"engraving": "Eli"}})
+        self.assertNotEqual(other.pk, first.pk)
+        self.assertEqual(CustomizationPreview.objects.count(), 2)
+
+    def test_gc_keeps_referenced_and_recent_previews(self):
+        from store.models import WebOrder, WebOrderItem
+
+        previews = [queue_preview(self.product, {"choices": {"engraving": text}}) for text in ("Ana", "Bea", "Cyd", "Dan")]
+        render_pending()
+        for age, preview in zip((30, 20, 10, 0), previews):
+            CustomizationPreview.objects.filter(pk=preview.pk).update(last_used_at=timezone.now() - timedelta(days=age))
+        order = WebOrder.objects.create(full_name='Client', email='client@example.com', phone='+243000000002',
+                                        address='Adresse', city='Kinshasa', total_amount=Decimal('20.00'))
+        WebOrderItem.objects.create(order=order, product=self.product, quantity=1, price=Decimal('20.00'),
+                                    customization_data={"preview_id": previews[0].pk})
+        oldest_file = CustomizationPreview.objects.get(pk=previews[1].pk).display_image.path
+
+        # Expiré et non référencé : seul "Bea" part ; puis éviction LRU jusqu'à 2 aperçus
+        self.assertEqual(collect_garbage(timedelta(days=14)), 1)
+        self.assertFalse(os.path.exists(oldest_file))
+        self.assertEqual(collect_garbage(timedelta(days=14), max_entries=2, min_age=timedelta(days=7)), 1)
+        self.assertEqual(set(CustomizationPreview.objects.values_list('pk', flat=True)), {previews[0].pk, previews[3].pk})
+
+    def test_previews_of_session_carts_are_kept(self):
+        preview_id = list(self._sync()['previews'].values())[0]['id']
+        render_pending()
+        stale = timezone.now() - timedelta(days=30)
+
+        # Resynchronisation du panier et suivi du rendu : aperçu utilisé
+        CustomizationPreview.objects.filter(pk=preview_id).update(last_used_at=stale)
+        self._sync()
+        self.assertGreater(CustomizationPreview.objects.get(pk=preview_id).last_used_at, stale)
+        CustomizationPreview.objects.filter(pk=preview_id).update(last_used_at=stale)
+        self.client.get(reverse('store:preview_status', args=[preview_id]))
+        self.assertGreater(CustomizationPreview.objects.get(pk=preview_id).last_used_at, stale)
+
+        # Plus récent qu'une session : jamais évincé par la limite LRU
+        self.assertEqual(collect_garbage(timedelta(days=30), max_entries=0), 0)
+        self.assertTrue(CustomizationPreview.objects.filter(pk=preview_id).exists())
+
+
+@override_settings(STORE_CATALOG_BACKGROUND_REBUILD=False)
+class PreviewAssetCacheTest(TestCase):
+    """Ressources du rendu chargées une fois par processus, via les stockages"""
+
+    def setUp(self):
+        from PIL import Image
+
+        cache.clear()
+        preview_assets.clear()
+        self.addCleanup(preview_assets.clear)
+        media = tempfile.TemporaryDirectory()
+        static = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(static.cleanup)
+        paths_override = override_settings(MEDIA_ROOT=media.name, STATICFILES_DIRS=[static.name])
+        paths_override.enable()
+        self.addCleanup(paths_override.disable)
+
+        os.makedirs(os.path.join(static.name, 'img', 'symbols'))
+        Image.new('RGBA', (40, 40), (255, 0, 0, 255)).save(os.path.join(static.name, 'img', 'symbols', 'heart.png'))
+        buffer = io.BytesIO()
+        Image.new('RGB', (100, 100), 'white').save(buffer, format='PNG')
+        template = CustomizationTemplate.objects.create(name="Symbole", rules={"zones": [
+            {"id": "symbol", "type": "selection", "label": "Symbole",
+             "options": [{"value": "heart", "label": "Cœur"}],
+             "preview_config": {"position": {"x": 50, "y": 50}, "size": 20}},
+            {"id": "engraving", "type": "text", "label": "Gravure"},
+        ]})
+        self.product = Product.objects.create(
+            name="Pendentif", purchase_price=Decimal("10.00"), selling_price=Decimal("20.00"),
+            category=Category.objects.create(name="Ressources"), is_customizable=True,
+            customization_template=template,
+            mockup_image=SimpleUploadedFile('pendentif.png', buffer.getvalue(), content_type='image/png'),
+        )
+        self.data = {"choices": {"symbol": "heart", "engraving": {"text": "Zoé", "font": "Arial"}}}
+
+    def _render(self):
+        from PIL import Image
+
+        image = CustomizationService.generate_preview_image(self.product, self.data)
+        return Image.open(io.BytesIO(image.read()))
+
+    def test_warm_renders_do_not_touch_storage(self):
+        from unittest import mock
+
+        self.assertEqual(preview_assets.warm_up(), 1)
+
+        with mock.patch('django.core.files.storage.base.Storage.open', side_effect=AssertionError), \
+                mock.patch('products.preview_assets._read_static', side_effect=AssertionError):
+            image = self._render()
+            self._render()
+
+        self.assertEqual(image.getpixel((50, 45))[:3], (255, 0, 0))
+        # Le mockup en cache n'est pas modifié par le dessin
+        self.assertEqual(preview_assets.get_mockup(self.product).getpixel((50, 45))[:3], (255, 255, 255))
+
+    def test_missing_font_falls_back_to_default_font(self):
+        with self.assertLogs('products.preview_assets', level='WARNING'):
+            self.assertIsNotNone(preview_assets.get_font("Absente", 20))
+        self.assertIsNone(preview_assets.get_symbol("inconnu", 20))
@@ -1,3 +1,111 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Shop
+from products import barcode_index, search
+from products.barcode_index import get_barcode_index, lookup_barcode
+from products.models import Category, Product
+from products.search import ProductSearch
+
+
+class BarcodeIndexTests(TestCase):
+    """Index code-barres de la caisse"""
+
+    def setUp(self):
+        barcode_index._local.clear()
+        owner = User.objects.create_user(username='gerant', password='secret123')
+        self.shop = Shop.objects.create(name='Boutique Test', created_by=owner)
+        self.category = Category.objects.create(name='Scanner', shop=self.shop)
+        self.product = Product.objects.create(
+            name='Produit A', category=self.category, shop=self.shop, barcode='ABC123',
+            selling_price=Decimal('1000.00'), purchase_price=Decimal('500.00'), current_stock=5,
+        )
+
+    def _warm(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_barcode_index(self.shop.id)
+
+    def test_lookup_is_case_insensitive_and_reads_fresh_stock(self):
+        self._warm()
+        Product.objects.filter(pk=self.product.pk).update(current_stock=2)
+
+        product = lookup_barcode(self.shop.id, ' abc123 ')
+
+        self.assertEqual(product['id'], self.product.id)
+        self.assertEqual(product['stock'], 2)
+        self.assertIsNone(lookup_barcode(self.shop.id, 'INCONNU'))
+
+    def test_warm_lookup_does_not_query_barcodes(self):
+        self._warm()
+        with CaptureQueriesContext(connection) as ctx:
+            lookup_barcode(self.shop.id, 'ABC123')
+        self.assertFalse(any('barcode' in query['sql'].lower() for query in ctx.captured_queries))
+
+    def test_product_save_invalidates_index(self):
+        self._warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.barcode = 'XYZ789'
+            self.product.save()
+
+        self.assertIsNone(lookup_barcode(self.shop.id, 'ABC123'))
+        self.assertEqual(lookup_barcode(self.shop.id, 'xyz789')['id'], self.product.id)
+
+    def test_deactivated_product_is_not_found(self):
+        self._warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.is_active = False
+            self.product.save()
+
+        self.assertIsNone(lookup_barcode(self.shop.id, 'ABC123'))
+
+
+class ProductSearchTests(TestCase):
+    """Recherche produits commune à la caisse, à la liste et à la boutique"""
+
+    def setUp(self):
+        search._local.clear()
+        self.category = Category.objects.create(name='Bijoux')
+        names = [
+            ('Bracelet argent', '1111111111111'),
+            ('Collier bracelet', '2222222222222'),
+            ('Bague', 'BRACELET'),
+            ('Médaille', '3333333333333'),
+        ]
+        self.products = {
+            name: Product.objects.create(
+                name=name, barcode=barcode, category=self.category,
+                selling_price=Decimal('1000.00'), purchase_price=Decimal('500.00'),
+            )
+            for name, barcode in names
+        }
+
+    def _names(self, query, fields=ProductSearch.FIELDS):
+        return [product.name for product in ProductSearch(query, fields).apply(Product.objects.all())]
+
+    def test_exact_barcode_then_prefix_then_substring(self):
+        self.assertEqual(self._names('bracelet'), ['Bague', 'Bracelet argent', 'Collier bracelet'])
+
+    def test_index_matches_database_filter(self):
+        for query in ('arg', 'ACELET', 'br', '2222', 'xyz'):
+            searcher = ProductSearch(query)
+            expected = set(searcher._sql_filter(Product.objects.all()).values_list('id', flat=True))
+            self.assertEqual(set(searcher.filter(Product.objects.all()).values_list('id', flat=True)), expected, query)
+
+    def test_category_is_searched_only_when_requested(self):
+        self.assertEqual(self._names('bijoux'), [])
+        self.assertEqual(len(self._names('bijoux', fields=('name', 'category'))), 4)
+
+    def test_index_follows_product_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._names('médaille'), ['Médaille'])
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.products['Médaille']
+            product.name = 'Pendentif'
+            product.save()
 
-# Create your tests here.
+        self.assertEqual(self._names('médaille'), [])
+        self.assertEqual(self._names('pendentif'), ['Pendentif'])
@@ -4,11 +4,12 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.contrib import messages
-from django.db.models import F, Q
+from django.db.models import F
 from django.http import JsonResponse, HttpResponse
 from accounts.decorators import manager_required
 from django.utils.decorators import method_decorator
 from .models import Product, Category, CustomizableComponent, CustomizationFont, ProductCustomizationConfig, CustomizationTemplate
+from .search import ProductSearch
 from .utils.barcode_utils import generate_barcode_image
 import zipfile
 import io
@@ -134,11 +135,7 @@ class ProductListView(ListView):
         # Recherche
         search = self.request.GET.get('search', '')
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(barcode__icontains=search) |
-                Q(category__name__icontains=search)
-            )
+            queryset = ProductSearch(search, fields=('name', 'barcode', 'category')).apply(queryset)
         
         # Filtre par catÃ©gorie
         category_id = self.request.GET.get('category', '')
@@ -153,6 +150,9 @@ class ProductListView(ListView):
             queryset = queryset.filter(is_active=False)
         elif status == 'low_stock':
             queryset = queryset.filter(current_stock__lte=F('minimum_stock'))
+        elif status == 'on_sale':
+            from promotions.effective_prices import filter_on_sale
+            queryset = filter_on_sale(queryset)
         
         return queryset
     
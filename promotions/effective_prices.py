@@ -0,0 +1,145 @@
+"""
+Table matérialisée des prix effectifs (ProductEffectivePrice).
+
+Pour chaque produit, une ligne par plage de temps [valid_from, valid_to[ pendant
+laquelle le prix remisé ne change pas. Les plages sont tirées des bornes de
+l'index des promotions (promotions/index.py) : la table reste exacte au passage
+d'un début ou d'une fin de promo sans tâche planifiée.
+
+Les lignes sont recalculées incrémentalement par les signaux
+(promotions/signals.py) : seuls les produits touchés par une promotion, un prix
+ou une catégorie modifiés sont réécrits. `rebuild_effective_prices` (commande
+du même nom) recalcule tout et purge l'historique.
+
+Côté lecture, `annotate_effective_price` et `filter_on_sale` transforment le tri
+par prix remisé et le filtre "en promo" en simples requêtes SQL indexées.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.models import Product
+from .index import PromotionIndex
+from .models import ProductEffectivePrice
+
+
+CENT = Decimal('0.01')
+
+
+def _price_rows(product, index, now):
+    """Lignes de prix d'un produit à partir de `now`, plages consécutives fusionnées."""
+    starts = [now] + [boundary for boundary in index.boundaries if boundary > now]
+    base_price = Decimal(str(product.selling_price))
+
+    rows = []
+    previous = object()
+    for start in starts:
+        promotion = index.best_promotion(product, start)
+        if promotion is previous:
+            continue
+        if rows:
+            rows[-1].valid_to = start
+        if promotion is None:
+            price = base_price
+        else:
+            price = promotion.calculate_discounted_price(base_price)
+        rows.append(ProductEffectivePrice(
+            product_id=product.id,
+            effective_price=price.quantize(CENT, rounding=ROUND_HALF_UP),
+            promotion=promotion,
+            valid_from=start,
+        ))
+        previous = promotion
+    return rows
+
+
+def refresh_effective_prices(product_ids=None):
+    """
+    Recalcule les prix effectifs des produits donnés (tous si None).
+
+    L'index est rechargé depuis la base plutôt que pris dans le cache du
+    processus : appelé depuis un signal, il doit voir les écritures de la
+    transaction en cours.
+
+    Returns:
+        int: nombre de lignes écrites
+    """
+    if product_ids is not None:
+        product_ids = set(product_ids)
+        if not product_ids:
+            return 0
+
+    now = timezone.now()
+    index = PromotionIndex.load()
+
+    products = Product.objects.only('id', 'selling_price', 'category_id')
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+
+    rows = []
+    for product in products.iterator():
+        rows.extend(_price_rows(product, index, now))
+
+    with transaction.atomic():
+        stale = ProductEffectivePrice.objects.all()
+        if product_ids is not None:
+            stale = stale.filter(product_id__in=product_ids)
+        stale.delete()
+        ProductEffectivePrice.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def rebuild_effective_prices():
+    """Reconstruction complète (déploiement, réparation)."""
+    return refresh_effective_prices()
+
+
+def products_for_promotion(promotion):
+    """Produits dont le prix effectif dépend (ou dépendait) de cette promotion."""
+    product_ids = set(
+        ProductEffectivePrice.objects.filter(promotion_id=promotion.id)
+        .values_list('product_id', flat=True)
+    )
+    if promotion.scope == 'all_products':
+        product_ids.update(Product.objects.values_list('id', flat=True))
+    elif promotion.scope == 'specific_products':
+        product_ids.update(promotion.products.values_list('id', flat=True))
+    elif promotion.scope == 'specific_categories':
+        product_ids.update(
+            Product.objects.filter(category__in=promotion.categories.all())
+            .values_list('id', flat=True)
+        )
+    return product_ids
+
+
+def current_effective_prices(at=None):
+    """Lignes valides à l'instant `at` (une par produit)."""
+    if at is None:
+        at = timezone.now()
+    return ProductEffectivePrice.objects.filter(valid_from__lte=at).filter(
+        Q(valid_to__gt=at) | Q(valid_to__isnull=True)
+    )
+
+
+def annotate_effective_price(queryset, at=None):
+    """
+    Ajoute `effective_price` (prix de vente si aucune ligne) et
+    `effective_promotion_id` à un queryset de Product.
+    """
+    rows = current_effective_prices(at).filter(product_id=OuterRef('pk'))
+    return queryset.annotate(
+        effective_price=Coalesce(
+            Subquery(rows.values('effective_price')[:1]),
+            F('selling_price'),
+        ),
+        effective_promotion_id=Subquery(rows.values('promotion_id')[:1]),
+    )
+
+
+def filter_on_sale(queryset, at=None):
+    """Restreint un queryset de Product aux produits en promotion à l'instant `at`."""
+    on_sale = current_effective_prices(at).filter(promotion__isnull=False)
+    return queryset.filter(id__in=on_sale.values('product_id'))
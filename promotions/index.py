@@ -0,0 +1,178 @@
+"""
+Index en mémoire des promotions, découpé par bornes de temps.
+
+Les dates de début et de fin de toutes les promotions actives (non expirées)
+forment une liste triée de bornes. Entre deux bornes consécutives, l'ensemble
+des promotions applicables ne change pas : il est précalculé une fois, et
+"quelles promotions s'appliquent à l'instant t" devient une recherche
+dichotomique (O(log n)), sans requête.
+
+L'index se recharge tout seul :
+- dès que la prochaine borne est passée (une promo commence ou se termine),
+  pour rester exact à la seconde sans tâche planifiée ;
+- quand le compteur de génération stocké dans le cache partagé change. Les
+  signaux de promotions/signals.py l'incrémentent, ce qui invalide l'index de
+  tous les workers gunicorn.
+"""
+import time
+from bisect import bisect_right
+from datetime import timedelta
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Promotion
+
+
+GENERATION_KEY = 'promotions:index:generation'
+
+# end_date est inclusive : la promotion sort de l'index une microseconde après.
+END_EPSILON = timedelta(microseconds=1)
+
+_index = None
+
+
+class PromotionIndex:
+    """Promotions applicables par intervalle de temps + liens produits/catégories."""
+
+    def __init__(self, promotions, product_links, category_links, loaded_at=None, generation=None):
+        self.loaded_at = loaded_at or timezone.now()
+        self.generation = generation
+        self.product_links = product_links
+        self.category_links = category_links
+
+        # Priorité : la promotion commencée le plus récemment l'emporte.
+        promotions = sorted(promotions, key=lambda promo: (promo.start_date, promo.id), reverse=True)
+
+        events = set()
+        for promo in promotions:
+            events.add(promo.start_date)
+            events.add(promo.end_date + END_EPSILON)
+        self.boundaries = sorted(events)
+        self.segments = [
+            tuple(
+                promo for promo in promotions
+                if promo.start_date <= boundary < promo.end_date + END_EPSILON
+            )
+            for boundary in self.boundaries
+        ]
+
+        upcoming = bisect_right(self.boundaries, self.loaded_at)
+        self.refresh_at = self.boundaries[upcoming] if upcoming < len(self.boundaries) else None
+
+    @classmethod
+    def load(cls, promotions=None, generation=None):
+        """Charge les promotions et leurs liens M2M (trois requêtes au maximum)."""
+        loaded_at = timezone.now()
+        if promotions is None:
+            promotions = Promotion.objects.filter(is_active=True, end_date__gte=loaded_at)
+        promotions = list(promotions)
+
+        product_links = {}
+        specific_ids = [promo.id for promo in promotions if promo.scope == 'specific_products']
+        if specific_ids:
+            links = Promotion.products.through.objects.filter(
+                promotion_id__in=specific_ids,
+            ).values_list('promotion_id', 'product_id')
+            for promotion_id, product_id in links:
+                product_links.setdefault(promotion_id, set()).add(product_id)
+
+        category_links = {}
+        category_scope_ids = [promo.id for promo in promotions if promo.scope == 'specific_categories']
+        if category_scope_ids:
+            links = Promotion.categories.through.objects.filter(
+                promotion_id__in=category_scope_ids,
+            ).values_list('promotion_id', 'category_id')
+            for promotion_id, category_id in links:
+                category_links.setdefault(promotion_id, set()).add(category_id)
+
+        return cls(promotions, product_links, category_links, loaded_at=loaded_at, generation=generation)
+
+    def covers(self, at):
+        """L'index ne connaît que les promotions non expirées au moment du chargement."""
+        return at >= self.loaded_at
+
+    def promotions_at(self, at):
+        """Promotions applicables à l'instant `at`, par ordre de priorité."""
+        position = bisect_right(self.boundaries, at) - 1
+        if position < 0:
+            return ()
+        return self.segments[position]
+
+    def next_boundary(self, at):
+        """Prochain instant (strictement après `at`) où les promotions applicables changent."""
+        position = bisect_right(self.boundaries, at)
+        if position < len(self.boundaries):
+            return self.boundaries[position]
+        return None
+
+    def applies_to(self, promo, product):
+        if promo.scope == 'all_products':
+            return True
+        if promo.scope == 'specific_products':
+            return product.id in self.product_links.get(promo.id, ())
+        if promo.scope == 'specific_categories':
+            return product.category_id in self.category_links.get(promo.id, ())
+        return False
+
+    def best_promotion(self, product, at):
+        for promo in self.promotions_at(at):
+            if self.applies_to(promo, product):
+                return promo
+        return None
+
+
+def get_index_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_index_generation()
+
+
+def invalidate_promotion_index():
+    """Force le rechargement de l'index dans tous les workers (immédiatement et après commit)."""
+    _bump_generation()
+    transaction.on_commit(_bump_generation)
+
+
+def _publish(index):
+    global _index
+
+    if _index is None or _index.loaded_at <= index.loaded_at:
+        _index = index
+
+
+def get_promotion_index(at=None):
+    """
+    Index courant du processus, rechargé si la génération a changé ou si une
+    borne est passée. Pour un instant antérieur au chargement (historique),
+    un index ponctuel est construit à partir de la base.
+    """
+    now = timezone.now()
+    generation = get_index_generation()
+    index = _index
+    if (
+        index is None
+        or index.generation != generation
+        or (index.refresh_at is not None and now >= index.refresh_at)
+    ):
+        index = PromotionIndex.load(generation=generation)
+        # Chargé dans une transaction, l'index peut contenir des écritures non
+        # validées : il n'est partagé qu'une fois la transaction commitée.
+        transaction.on_commit(partial(_publish, index))
+
+    if at is not None and not index.covers(at):
+        return PromotionIndex.load(
+            promotions=Promotion.objects.filter(is_active=True, start_date__lte=at, end_date__gte=at)
+        )
+    return index
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from promotions.effective_prices import rebuild_effective_prices
+
+
+class Command(BaseCommand):
+    help = 'Recalcule toute la table des prix effectifs (promotions appliquées)'
+
+    def handle(self, *args, **options):
+        count = rebuild_effective_prices()
+        self.stdout.write(self.style.SUCCESS(f"✅ {count} ligne(s) de prix effectif écrite(s)"))
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 13:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_product_products_pr_shop_id_44685a_idx_and_more'),
+        ('promotions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductEffectivePrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('effective_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Prix effectif')),
+                ('valid_from', models.DateTimeField(verbose_name='Valide à partir de')),
+                ('valid_to', models.DateTimeField(blank=True, help_text='Vide = sans limite', null=True, verbose_name="Valide jusqu'à (exclu)")),
+            ],
+            options={
+                'verbose_name': 'Prix effectif',
+                'verbose_name_plural': 'Prix effectifs',
+                'ordering': ['product', 'valid_from'],
+            },
+        ),
+        migrations.AddField(
+            model_name='producteffectiveprice',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_prices', to='products.product', verbose_name='Produit'),
+        ),
+        migrations.AddField(
+            model_name='producteffectiveprice',
+            name='promotion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='effective_prices', to='promotions.promotion', verbose_name='Promotion appliquée'),
+        ),
+        migrations.AddIndex(
+            model_name='producteffectiveprice',
+            index=models.Index(fields=['product', 'valid_from'], name='promotions__product_c9c2f9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producteffectiveprice',
+            index=models.Index(fields=['valid_from', 'valid_to'], name='promotions__valid_f_631e01_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producteffectiveprice',
+            index=models.Index(fields=['effective_price'], name='promotions__effecti_b48f14_idx'),
+        ),
+    ]
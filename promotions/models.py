@@ -296,3 +296,53 @@ class PromotionLog(models.Model):
     
     def __str__(self):
         return f"{self.promotion.name} - {self.get_action_display()} ({self.timestamp.strftime('%d/%m/%Y %H:%M')})"
+
+
+class ProductEffectivePrice(models.Model):
+    """
+    Prix effectif (promotions appliquées) d'un produit sur une plage de temps.
+    Table dénormalisée tenue à jour par promotions/effective_prices.py : elle
+    permet de filtrer et trier par prix remisé directement en SQL.
+    """
+    
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='effective_prices',
+        verbose_name="Produit"
+    )
+    effective_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name="Prix effectif"
+    )
+    promotion = models.ForeignKey(
+        Promotion,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='effective_prices',
+        verbose_name="Promotion appliquée"
+    )
+    valid_from = models.DateTimeField(
+        verbose_name="Valide à partir de"
+    )
+    valid_to = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Valide jusqu'à (exclu)",
+        help_text="Vide = sans limite"
+    )
+    
+    class Meta:
+        verbose_name = "Prix effectif"
+        verbose_name_plural = "Prix effectifs"
+        ordering = ['product', 'valid_from']
+        indexes = [
+            models.Index(fields=['product', 'valid_from']),
+            models.Index(fields=['valid_from', 'valid_to']),
+            models.Index(fields=['effective_price']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} : {self.effective_price} ({self.valid_from:%d/%m/%Y %H:%M})"
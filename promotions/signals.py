@@ -2,10 +2,13 @@
 Signaux Django pour les promotions.
 Utilisés pour tracker automatiquement les changements et mettre à jour les logs.
 """
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
+from products.models import Category, Product
 from .models import Promotion, PromotionLog
+from .index import invalidate_promotion_index
+from .effective_prices import products_for_promotion, refresh_effective_prices
 
 
 @receiver(post_save, sender=Promotion)
@@ -58,3 +61,79 @@ def log_promotion_deletion(sender, instance, **kwargs):
         )
     except Exception as e:
         print(f"Error logging promotion deletion: {e}")
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def invalidate_index_on_promotion_change(sender, **kwargs):
+    """Recharge l'index des promotions dans tous les workers."""
+    invalidate_promotion_index()
+
+
+@receiver(m2m_changed, sender=Promotion.products.through)
+@receiver(m2m_changed, sender=Promotion.categories.through)
+def invalidate_index_on_scope_change(sender, action, **kwargs):
+    """Les liens produits/catégories font partie de l'index."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_promotion_index()
+
+
+# --- Prix effectifs (ProductEffectivePrice) ---
+
+PRICING_FIELDS = ('selling_price', 'category_id')
+
+
+@receiver(post_init, sender=Product)
+def remember_pricing_state(sender, instance, **kwargs):
+    """Mémorise prix et catégorie pour ne recalculer qu'en cas de changement."""
+    instance._pricing_state = tuple(instance.__dict__.get(field) for field in PRICING_FIELDS)
+
+
+@receiver(post_save, sender=Product)
+def refresh_prices_on_product_change(sender, instance, created, update_fields=None, **kwargs):
+    """Un mouvement de stock (save du produit) ne réécrit pas ses prix effectifs."""
+    state = tuple(instance.__dict__.get(field) for field in PRICING_FIELDS)
+    if created or state != getattr(instance, '_pricing_state', None):
+        refresh_effective_prices([instance.pk])
+    instance._pricing_state = state
+
+
+@receiver(post_save, sender=Promotion)
+def refresh_prices_on_promotion_save(sender, instance, **kwargs):
+    refresh_effective_prices(products_for_promotion(instance))
+
+
+@receiver(pre_delete, sender=Promotion)
+def collect_products_before_promotion_delete(sender, instance, **kwargs):
+    instance._affected_product_ids = products_for_promotion(instance)
+
+
+@receiver(post_delete, sender=Promotion)
+def refresh_prices_on_promotion_delete(sender, instance, **kwargs):
+    refresh_effective_prices(getattr(instance, '_affected_product_ids', set()))
+
+
+@receiver(m2m_changed, sender=Promotion.products.through)
+@receiver(m2m_changed, sender=Promotion.categories.through)
+def refresh_prices_on_scope_change(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Seuls les produits ajoutés/retirés de la portée sont recalculés
+    (plus ceux qui portaient déjà la promotion, pour un clear).
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if isinstance(instance, Promotion):
+        product_ids = products_for_promotion(instance)
+        if model is Product and pk_set:
+            product_ids.update(pk_set)
+        elif model is Category and pk_set:
+            product_ids.update(
+                Product.objects.filter(category_id__in=pk_set).values_list('id', flat=True)
+            )
+    elif isinstance(instance, Product):
+        product_ids = {instance.pk}
+    else:
+        product_ids = set(instance.products.values_list('id', flat=True))
+
+    refresh_effective_prices(product_ids)
@@ -13,6 +13,8 @@ def sync_promotion_status():
     """
     Task Celery pour synchroniser le statut des promotions toutes les 5 minutes.
     Activation/désactivation automatique basées sur start/end dates.
+    Le pricing n'en dépend pas : l'index en mémoire (promotions/index.py)
+    applique les bornes start/end à la seconde près.
     """
     try:
         stats = update_promotion_status()
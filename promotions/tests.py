@@ -9,7 +9,7 @@ from decimal import Decimal
 from django.contrib.auth.models import User
 
 from promotions.models import Promotion, PromotionLog
-from promotions.utils import calculate_product_price, get_active_promotions, update_promotion_status
+from promotions.utils import calculate_product_price, get_active_promotions, price_catalog, update_promotion_status
 from products.models import Product, Category
 
 
@@ -367,3 +367,283 @@ class PromotionIntegrationTests(TestCase):
         # 5. Vérifier le badge
         badge = promo.get_badge_text()
         self.assertEqual(badge, '-15%')
+
+
+class PriceCatalogTests(TestCase):
+    """Tests du pricing en lot"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='123456')
+        self.bijoux = Category.objects.create(name='Bijoux')
+        self.montres = Category.objects.create(name='Montres')
+        now = timezone.now()
+        
+        self.promo_categories = Promotion.objects.create(
+            name='Bijoux -10%',
+            discount_type='percentage',
+            discount_value=Decimal('10.00'),
+            scope='specific_categories',
+            start_date=now - timedelta(hours=3),
+            end_date=now + timedelta(hours=3),
+            is_active=True,
+            created_by=self.user
+        )
+        self.promo_categories.categories.add(self.bijoux)
+        
+        self.promo_products = Promotion.objects.create(
+            name='Vente flash',
+            discount_type='fixed',
+            discount_value=Decimal('5.00'),
+            scope='specific_products',
+            start_date=now - timedelta(hours=1),
+            end_date=now + timedelta(hours=1),
+            is_active=True,
+            created_by=self.user
+        )
+    
+    def _create_products(self, count, category):
+        return [
+            Product.objects.create(
+                name=f'Produit {category.name} {index}',
+                selling_price=Decimal('100.00'),
+                purchase_price=Decimal('50.00'),
+                category=category
+            )
+            for index in range(count)
+        ]
+    
+    def test_price_catalog_matches_single_product_pricing(self):
+        """Le lot donne le même résultat que le calcul produit par produit"""
+        bijou, flash_bijou = self._create_products(2, self.bijoux)
+        montre, = self._create_products(1, self.montres)
+        self.promo_products.products.add(flash_bijou)
+        
+        pricing = price_catalog([bijou, flash_bijou, montre])
+        
+        self.assertEqual(pricing[bijou.id]['promotion'], self.promo_categories)
+        self.assertEqual(pricing[bijou.id]['discounted_price'], Decimal('90.00'))
+        # La promotion commencée le plus récemment l'emporte
+        self.assertEqual(pricing[flash_bijou.id]['promotion'], self.promo_products)
+        self.assertEqual(pricing[flash_bijou.id]['discounted_price'], Decimal('95.00'))
+        self.assertFalse(pricing[montre.id]['has_promotion'])
+        
+        for product in (bijou, flash_bijou, montre):
+            single = calculate_product_price(product)
+            self.assertEqual(single['discounted_price'], pricing[product.id]['discounted_price'])
+            self.assertEqual(single['promotion'], pricing[product.id]['promotion'])
+    
+    def test_price_catalog_query_count_is_flat(self):
+        """Le nombre de requêtes ne dépend pas de la taille du catalogue"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        small = self._create_products(5, self.bijoux)
+        self.promo_products.products.add(*small[:2])
+        with CaptureQueriesContext(connection) as small_queries:
+            price_catalog(small)
+        
+        large = small + self._create_products(200, self.montres) + self._create_products(200, self.bijoux)
+        self.promo_products.products.add(*large[-50:])
+        with CaptureQueriesContext(connection) as large_queries:
+            pricing = price_catalog(large)
+        
+        # Rechargement de l'index (liens M2M modifiés) : mêmes requêtes dans les deux cas
+        self.assertLessEqual(len(large_queries), 3)
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertEqual(len(pricing), len(large))
+        self.assertEqual(pricing[large[-1].id]['promotion'], self.promo_products)
+        
+        # Index publié (après commit) et à jour : plus aucune requête
+        with self.captureOnCommitCallbacks(execute=True):
+            price_catalog(large)
+        with self.assertNumQueries(0):
+            price_catalog(large)
+
+
+class PromotionIndexTests(TestCase):
+    """Tests de l'index des promotions en mémoire"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='123456')
+        self.category = Category.objects.create(name='Index')
+        self.product = Product.objects.create(
+            name='Produit Index',
+            selling_price=Decimal('100.00'),
+            purchase_price=Decimal('50.00'),
+            category=self.category
+        )
+        self.now = timezone.now()
+    
+    def _create_promo(self, name, start, end, value='10.00'):
+        return Promotion.objects.create(
+            name=name,
+            discount_type='percentage',
+            discount_value=Decimal(value),
+            scope='all_products',
+            start_date=start,
+            end_date=end,
+            is_active=True,
+            created_by=self.user
+        )
+    
+    def test_promotions_at_respects_exact_boundaries(self):
+        """Une promo s'applique de start_date à end_date incluses"""
+        from promotions.index import PromotionIndex
+        
+        first = self._create_promo('Matin', self.now + timedelta(hours=1), self.now + timedelta(hours=3))
+        second = self._create_promo('Midi', self.now + timedelta(hours=2), self.now + timedelta(hours=4))
+        index = PromotionIndex.load()
+        
+        self.assertEqual(index.promotions_at(first.start_date - timedelta(microseconds=1)), ())
+        self.assertEqual(index.promotions_at(first.start_date), (first,))
+        self.assertEqual(index.promotions_at(second.start_date), (second, first))
+        self.assertEqual(index.promotions_at(first.end_date), (second, first))
+        self.assertEqual(index.promotions_at(first.end_date + timedelta(microseconds=1)), (second,))
+        self.assertEqual(index.promotions_at(second.end_date + timedelta(seconds=1)), ())
+        self.assertEqual(index.next_boundary(self.now), first.start_date)
+    
+    def test_index_refreshes_when_next_boundary_passes(self):
+        """Sans tâche planifiée, le prix change à l'heure exacte de fin"""
+        from unittest import mock
+        
+        promo = self._create_promo('Courte', self.now - timedelta(hours=1), self.now + timedelta(minutes=10), '20.00')
+        self.assertEqual(calculate_product_price(self.product)['promotion'], promo)
+        
+        after_end = promo.end_date + timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=after_end):
+            pricing = calculate_product_price(self.product)
+        self.assertFalse(pricing['has_promotion'])
+        self.assertEqual(pricing['discounted_price'], Decimal('100.00'))
+    
+    def test_signal_bumps_generation(self):
+        """Les signaux invalident l'index de tous les workers via le cache"""
+        from promotions.index import get_index_generation, get_promotion_index
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            index = get_promotion_index()
+        self.assertIs(get_promotion_index(), index)
+        
+        generation = get_index_generation()
+        promo = self._create_promo('Nouvelle', self.now - timedelta(hours=1), self.now + timedelta(hours=1))
+        
+        self.assertNotEqual(get_index_generation(), generation)
+        self.assertIsNot(get_promotion_index(), index)
+        self.assertEqual(calculate_product_price(self.product)['promotion'], promo)
+    
+    def test_historical_lookup_uses_database(self):
+        """Un instant antérieur au chargement de l'index reste calculable"""
+        promo = self._create_promo('Ancienne', self.now - timedelta(days=3), self.now - timedelta(days=2))
+        pricing = calculate_product_price(self.product, at_datetime=self.now - timedelta(days=2, hours=12))
+        self.assertEqual(pricing['promotion'], promo)
+        self.assertFalse(calculate_product_price(self.product)['has_promotion'])
+
+
+class ProductEffectivePriceTests(TestCase):
+    """Tests de la table matérialisée des prix effectifs"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='123456')
+        self.category = Category.objects.create(name='Effectif')
+        self.other_category = Category.objects.create(name='Autre')
+        self.product = Product.objects.create(
+            name='Produit A',
+            selling_price=Decimal('100.00'),
+            purchase_price=Decimal('50.00'),
+            category=self.category
+        )
+        self.cheap = Product.objects.create(
+            name='Produit B',
+            selling_price=Decimal('80.00'),
+            purchase_price=Decimal('40.00'),
+            category=self.other_category
+        )
+        self.now = timezone.now()
+    
+    def _create_promo(self, start, end, value='30.00', scope='specific_categories'):
+        promo = Promotion.objects.create(
+            name='Promo effective',
+            discount_type='percentage',
+            discount_value=Decimal(value),
+            scope=scope,
+            start_date=start,
+            end_date=end,
+            is_active=True,
+            created_by=self.user
+        )
+        if scope == 'specific_categories':
+            promo.categories.add(self.category)
+        return promo
+    
+    def _prices(self, at=None):
+        from promotions.effective_prices import annotate_effective_price
+        return dict(
+            annotate_effective_price(Product.objects.all(), at=at)
+            .values_list('id', 'effective_price')
+        )
+    
+    def test_new_product_gets_base_price_row(self):
+        """Un produit créé a immédiatement son prix effectif"""
+        from promotions.models import ProductEffectivePrice
+        
+        rows = ProductEffectivePrice.objects.filter(product=self.product)
+        self.assertEqual(rows.count(), 1)
+        self.assertEqual(rows[0].effective_price, Decimal('100.00'))
+        self.assertIsNone(rows[0].promotion)
+        self.assertIsNone(rows[0].valid_to)
+    
+    def test_promotion_scope_is_maintained_incrementally(self):
+        """Ajout d'une catégorie à la portée : seuls ses produits sont remisés"""
+        promo = self._create_promo(self.now - timedelta(hours=1), self.now + timedelta(hours=1))
+        prices = self._prices()
+        self.assertEqual(prices[self.product.id], Decimal('70.00'))
+        self.assertEqual(prices[self.cheap.id], Decimal('80.00'))
+        
+        promo.categories.remove(self.category)
+        self.assertEqual(self._prices()[self.product.id], Decimal('100.00'))
+    
+    def test_future_windows_are_materialized(self):
+        """Les plages futures sont écrites : le prix change à l'heure exacte"""
+        promo = self._create_promo(self.now + timedelta(hours=1), self.now + timedelta(hours=2))
+        
+        self.assertEqual(self._prices()[self.product.id], Decimal('100.00'))
+        self.assertEqual(self._prices(at=promo.start_date)[self.product.id], Decimal('70.00'))
+        self.assertEqual(self._prices(at=promo.end_date)[self.product.id], Decimal('70.00'))
+        after_end = promo.end_date + timedelta(microseconds=1)
+        self.assertEqual(self._prices(at=after_end)[self.product.id], Decimal('100.00'))
+    
+    def test_price_change_and_deactivation_refresh_rows(self):
+        """Changement de prix et désactivation de la promo réécrivent les lignes"""
+        promo = self._create_promo(self.now - timedelta(hours=1), self.now + timedelta(hours=1))
+        self.product.selling_price = Decimal('200.00')
+        self.product.save()
+        self.assertEqual(self._prices()[self.product.id], Decimal('140.00'))
+        
+        promo.is_active = False
+        promo.save()
+        self.assertEqual(self._prices()[self.product.id], Decimal('200.00'))
+    
+    def test_stock_only_save_does_not_rewrite_prices(self):
+        """Un save de stock ne touche pas la table"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        self.product.current_stock = 5
+        with CaptureQueriesContext(connection) as ctx:
+            self.product.save()
+        self.assertFalse(any('effectiveprice' in q['sql'] for q in ctx.captured_queries))
+    
+    def test_on_sale_filter_and_price_sort_in_sql(self):
+        """Filtre "en promo" et tri par prix remisé directement en SQL"""
+        from promotions.effective_prices import annotate_effective_price, filter_on_sale
+        
+        self._create_promo(self.now - timedelta(hours=1), self.now + timedelta(hours=1), value='50.00')
+        self.assertEqual(list(filter_on_sale(Product.objects.all())), [self.product])
+        
+        ordered = annotate_effective_price(Product.objects.all()).order_by('effective_price')
+        self.assertEqual([p.id for p in ordered], [self.product.id, self.cheap.id])
+        
+        response_ids = [
+            p.id for p in annotate_effective_price(Product.objects.all())
+            .filter(effective_price__lte=Decimal('60.00'))
+        ]
+        self.assertEqual(response_ids, [self.product.id])
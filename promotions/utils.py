@@ -39,34 +39,8 @@ def get_active_promotions(product_id=None, at_datetime=None):
     return promotions
 
 
-def calculate_product_price(product, base_price=None, at_datetime=None):
-    """
-    Calcule le prix final d'un produit en tenant compte des promotions actives.
-    
-    Args:
-        product: Instance du modèle Product
-        base_price: Prix de base (utilise product.selling_price si None)
-        at_datetime: DateTimeField pour vérifier à un instant spécifique
-        
-    Returns:
-        dict: {
-            'original_price': Decimal,
-            'discounted_price': Decimal,
-            'discount_amount': Decimal,
-            'discount_percent': Decimal,
-            'has_promotion': bool,
-            'promotion': Promotion ou None,
-            'savings': str (pour affichage)
-        }
-    """
-    if base_price is None:
-        base_price = product.selling_price
-    
-    base_price = Decimal(str(base_price))
-    
-    # Récupérer les promotions actives pour ce produit
-    promotion = get_active_promotions(product_id=product.id, at_datetime=at_datetime).first()
-
+def _build_pricing(base_price, promotion):
+    """Construit le dict de pricing pour un prix de base et une promotion (ou None)."""
     if promotion is None:
         return {
             'original_price': base_price,
@@ -78,7 +52,6 @@ def calculate_product_price(product, base_price=None, at_datetime=None):
             'savings': '$0.00',
         }
     
-    # Utiliser la première (meilleure) promotion
     discounted_price = promotion.calculate_discounted_price(base_price)
     discount_amount = base_price - discounted_price
     
@@ -99,6 +72,81 @@ def calculate_product_price(product, base_price=None, at_datetime=None):
     }
 
 
+def get_best_promotions(products, at_datetime=None):
+    """
+    Associe à chaque produit la promotion qui s'applique, sans requête par produit.
+    
+    S'appuie sur l'index en mémoire (promotions/index.py) : aucune requête tant
+    que l'index du processus est à jour, trois au maximum pour le recharger.
+    La priorité est celle de `get_active_promotions(...).first()` : la promotion
+    commencée le plus récemment l'emporte.
+    
+    Args:
+        products: Itérable d'instances Product
+        at_datetime: DateTimeField pour vérifier à un instant spécifique
+        
+    Returns:
+        dict: {product_id: Promotion ou None}
+    """
+    from .index import get_promotion_index
+    
+    index = get_promotion_index(at=at_datetime)
+    if at_datetime is None:
+        at_datetime = timezone.now()
+    
+    return {product.id: index.best_promotion(product, at_datetime) for product in products}
+
+
+def price_catalog(products, at=None, base_prices=None):
+    """
+    Calcule le pricing (promotions incluses) de N produits en une seule passe.
+    
+    Args:
+        products: Itérable d'instances Product
+        at: DateTimeField pour vérifier à un instant spécifique
+        base_prices: dict optionnel {product_id: prix de base} (sinon selling_price)
+        
+    Returns:
+        dict: {product_id: pricing} (même structure que calculate_product_price)
+    """
+    products = list(products)
+    base_prices = base_prices or {}
+    promotions = get_best_promotions(products, at_datetime=at)
+    
+    pricing = {}
+    for product in products:
+        base_price = base_prices.get(product.id)
+        if base_price is None:
+            base_price = product.selling_price
+        pricing[product.id] = _build_pricing(Decimal(str(base_price)), promotions[product.id])
+    return pricing
+
+
+def calculate_product_price(product, base_price=None, at_datetime=None):
+    """
+    Calcule le prix final d'un produit en tenant compte des promotions actives.
+    Raccourci de `price_catalog` pour un seul produit.
+    
+    Args:
+        product: Instance du modèle Product
+        base_price: Prix de base (utilise product.selling_price si None)
+        at_datetime: DateTimeField pour vérifier à un instant spécifique
+        
+    Returns:
+        dict: {
+            'original_price': Decimal,
+            'discounted_price': Decimal,
+            'discount_amount': Decimal,
+            'discount_percent': Decimal,
+            'has_promotion': bool,
+            'promotion': Promotion ou None,
+            'savings': str (pour affichage)
+        }
+    """
+    base_prices = {product.id: base_price} if base_price is not None else None
+    return price_catalog([product], at=at_datetime, base_prices=base_prices)[product.id]
+
+
 def update_promotion_status():
     """
     Met à jour le statut des promotions :
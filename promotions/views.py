@@ -8,7 +8,7 @@ from django.utils import timezone
 from django.contrib import messages
 from .models import Promotion, PromotionLog
 from .forms import PromotionForm, BulkPromotionActionForm
-from .utils import calculate_product_price, update_promotion_status
+from .utils import price_catalog, update_promotion_status
 from products.models import Product
 
 
@@ -123,11 +123,12 @@ class PromotionDetailView(LoginRequiredMixin, DetailView):
         context['logs'] = promotion.logs.all()[:5]
         
         # Exemple de prix réduit
-        products = promotion.get_applicable_products()[:3]
+        products = list(promotion.get_applicable_products()[:3])
+        pricing = price_catalog(products)
         context['price_examples'] = [
             {
                 'product': p,
-                'pricing': calculate_product_price(p)
+                'pricing': pricing[p.id]
             }
             for p in products
         ]
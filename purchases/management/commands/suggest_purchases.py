@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Shop
+from purchases.planner import ReorderPlanner
+
+
+class Command(BaseCommand):
+    help = "Calcule les commandes fournisseurs suggérées d'une boutique (et les enregistre avec --create)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, required=True, help='Boutique (id)')
+        parser.add_argument('--review-days', type=int, default=14, help='Jours couverts par chaque commande')
+        parser.add_argument('--create', action='store_true', help='Enregistrer les commandes (achats non reçus)')
+
+    def handle(self, *args, **options):
+        try:
+            shop = Shop.objects.get(pk=options['shop'])
+        except Shop.DoesNotExist:
+            raise CommandError(f"Boutique {options['shop']} introuvable")
+
+        start = time.perf_counter()
+        planner = ReorderPlanner(shop, review_days=options['review_days'])
+        drafts = planner.draft_purchases()
+        elapsed = time.perf_counter() - start
+
+        for purchase, items in drafts:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{purchase.supplier} — {purchase.total} FC"))
+            for item in items:
+                self.stdout.write(f"  {item.quantity:>5} × {item.product.name}")
+
+        lines = sum(len(items) for _, items in drafts)
+        self.stdout.write(f"{lines} ligne(s), {len(drafts)} fournisseur(s), calcul en {elapsed:.2f} s")
+        if options['create'] and drafts:
+            purchases = planner.create_purchases(drafts)
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(purchases)} commande(s) créée(s)"))
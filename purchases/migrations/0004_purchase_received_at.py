@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchases', '0003_purchase_invoice_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='received_at',
+            field=models.DateTimeField(blank=True, help_text='Sert à mesurer le délai de livraison du fournisseur', null=True, verbose_name='Reçue le'),
+        ),
+    ]
@@ -4,6 +4,8 @@ from django.core.validators import MinValueValidator
 from decimal import Decimal
 from products.models import Product
 from accounts.models import Shop
+from inventory.models import StockMovement
+from inventory.services import StockService
 
 
 class Purchase(models.Model):
@@ -68,6 +70,12 @@ class Purchase(models.Model):
         verbose_name="Marchandise reçue",
         help_text="Cocher quand la marchandise est réceptionnée"
     )
+    received_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Reçue le",
+        help_text="Sert à mesurer le délai de livraison du fournisseur"
+    )
     
     class Meta:
         verbose_name = "Achat"
@@ -146,8 +154,11 @@ class PurchaseItem(models.Model):
         
         # Ajouter au stock si l'achat est marqué comme reçu
         if is_new and self.purchase.is_received:
-            self.product.current_stock += self.quantity
-            self.product.save()
+            new_stock = StockService.receive(
+                [(self.product_id, self.quantity, self.purchase_price)], reason=StockMovement.PURCHASE,
+                reference=f"Achat #{self.purchase_id}",
+            )
+            self.product.current_stock = new_stock[self.product_id]
         
         # Recalculer le total de l'achat
         self.purchase.calculate_total()
@@ -0,0 +1,214 @@
+"""
+Suggestions de commandes fournisseurs.
+
+Pour toute la boutique en un lot de requêtes fixes (produits, commandes en
+cours, fournisseur habituel, délais de livraison, prévision de la demande),
+puis un calcul par produit en mémoire :
+
+    position        = stock actuel + quantités commandées non reçues
+    stock sécurité  = max(z × σ × √(délai), stock minimum)
+    point commande  = demande prévue pendant le délai + stock sécurité
+    niveau cible    = demande prévue pendant (délai + période de revue) + stock sécurité
+
+Un produit dont la position est sous le point de commande est commandé
+jusqu'au niveau cible. Les lignes sont regroupées par fournisseur en
+brouillons de Purchase (non enregistrés).
+"""
+import math
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from statistics import NormalDist
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from products.models import Product
+from sales.models import DailyProductSales
+from .models import Purchase, PurchaseItem
+
+
+UNKNOWN_SUPPLIER = "Fournisseur à définir"
+
+
+class ReorderPlanner:
+    """
+    Usage:
+        planner = ReorderPlanner(shop)
+        drafts = planner.draft_purchases()        # [(Purchase, [PurchaseItem, ...]), ...]
+        planner.create_purchases(drafts, user)    # enregistre les brouillons
+    """
+
+    def __init__(self, shop, review_days=14, default_lead_time_days=7, service_level=0.95,
+                 history_days=56, lead_time_history_days=365):
+        self.shop = shop
+        self.review_days = review_days
+        self.default_lead_time_days = default_lead_time_days
+        self.service_level = service_level
+        self.history_days = history_days
+        self.lead_time_history_days = lead_time_history_days
+
+    # ------------------------------------------
+    # Données de la boutique (une requête chacune)
+    # ------------------------------------------
+    def open_quantities(self):
+        """{product_id: quantité commandée non reçue}"""
+        return dict(
+            PurchaseItem.objects.filter(purchase__shop=self.shop, purchase__is_received=False)
+            .values('product_id')
+            .annotate(total=Sum('quantity'))
+            .values_list('product_id', 'total')
+        )
+
+    def usual_suppliers(self):
+        """{product_id: fournisseur du dernier achat du produit}"""
+        suppliers = {}
+        rows = (
+            PurchaseItem.objects.filter(purchase__shop=self.shop)
+            .order_by('product_id', '-purchase__purchase_date')
+            .values_list('product_id', 'purchase__supplier')
+        )
+        for product_id, supplier in rows:
+            suppliers.setdefault(product_id, supplier)
+        return suppliers
+
+    def supplier_lead_times(self):
+        """{fournisseur: délai moyen en jours (commande → réception)}"""
+        since = timezone.now() - timedelta(days=self.lead_time_history_days)
+        delays = defaultdict(list)
+        rows = Purchase.objects.filter(
+            shop=self.shop,
+            is_received=True,
+            received_at__isnull=False,
+            purchase_date__gte=since,
+        ).values_list('supplier', 'purchase_date', 'received_at')
+        for supplier, ordered, received in rows:
+            delays[supplier].append(max((received - ordered).total_seconds() / 86400, 0))
+        return {supplier: sum(values) / len(values) for supplier, values in delays.items()}
+
+    def demand(self, product_ids, horizon):
+        """
+        ({product_id: [demande prévue jour par jour]}, {product_id: σ journalier}).
+        Moteur de prévision si NumPy est disponible, moyenne plate sinon.
+        """
+        try:
+            from inventory.forecasting import DemandForecast
+        except ImportError:
+            DemandForecast = None
+
+        if DemandForecast is not None:
+            forecast = DemandForecast(self.shop, history_days=self.history_days, horizon_days=horizon)
+            forecast.fit(product_ids)
+            return (
+                {product_id: forecast.forecast[row].tolist() for product_id, row in forecast.rows.items()},
+                {product_id: float(forecast.model.residual_std[row]) for product_id, row in forecast.rows.items()},
+            )
+
+        start = timezone.localdate() - timedelta(days=self.history_days - 1)
+        sold = dict(
+            DailyProductSales.objects.filter(shop=self.shop, date__gte=start)
+            .values('product_id')
+            .annotate(total=Sum('quantity'))
+            .values_list('product_id', 'total')
+        )
+        return (
+            {product_id: [(sold.get(product_id) or 0) / self.history_days] * horizon for product_id in product_ids},
+            {product_id: 0.0 for product_id in product_ids},
+        )
+
+    # ------------------------------------------
+    # Calcul
+    # ------------------------------------------
+    def suggestions(self):
+        """Lignes à commander : une par produit, triées par fournisseur puis nom."""
+        products = list(
+            Product.objects.filter(shop=self.shop, is_active=True)
+            .only('id', 'name', 'current_stock', 'minimum_stock', 'purchase_price')
+            .order_by('name')
+        )
+        if not products:
+            return []
+
+        on_order = self.open_quantities()
+        suppliers = self.usual_suppliers()
+        lead_times = self.supplier_lead_times()
+        max_lead = max([self.default_lead_time_days, *lead_times.values()])
+        horizon = math.ceil(max_lead) + self.review_days
+        daily_demand, sigmas = self.demand([product.id for product in products], horizon)
+        z = NormalDist().inv_cdf(self.service_level)
+
+        lines = []
+        for product in products:
+            supplier = suppliers.get(product.id, UNKNOWN_SUPPLIER)
+            lead_time = lead_times.get(supplier, self.default_lead_time_days)
+            lead_days = max(math.ceil(lead_time), 1)
+            forecast = daily_demand[product.id]
+            lead_demand = sum(forecast[:lead_days])
+            cycle_demand = sum(forecast[:lead_days + self.review_days])
+            safety_stock = max(z * sigmas[product.id] * math.sqrt(lead_days), product.minimum_stock)
+
+            position = product.current_stock + on_order.get(product.id, 0)
+            reorder_point = lead_demand + safety_stock
+            if position > reorder_point:
+                continue
+            quantity = math.ceil(cycle_demand + safety_stock - position)
+            if quantity < 1:
+                continue
+            lines.append({
+                'product': product,
+                'supplier': supplier,
+                'quantity': quantity,
+                'current_stock': product.current_stock,
+                'on_order': on_order.get(product.id, 0),
+                'lead_time_days': round(lead_time, 1),
+                'reorder_point': round(reorder_point, 1),
+                'safety_stock': round(safety_stock, 1),
+            })
+
+        lines.sort(key=lambda line: (line['supplier'] == UNKNOWN_SUPPLIER, line['supplier'], line['product'].name))
+        return lines
+
+    def draft_purchases(self, lines=None):
+        """Brouillons (non enregistrés) : [(Purchase, [PurchaseItem, ...]), ...], un par fournisseur."""
+        grouped = OrderedDict()
+        for line in self.suggestions() if lines is None else lines:
+            grouped.setdefault(line['supplier'], []).append(line)
+
+        today = timezone.localdate().strftime('%d/%m/%Y')
+        drafts = []
+        for supplier, supplier_lines in grouped.items():
+            items = []
+            for line in supplier_lines:
+                item = PurchaseItem(
+                    product=line['product'],
+                    quantity=line['quantity'],
+                    purchase_price=line['product'].purchase_price,
+                    subtotal=line['quantity'] * line['product'].purchase_price,
+                )
+                item.suggestion = line  # détail du calcul, pour l'affichage
+                items.append(item)
+            purchase = Purchase(
+                shop=self.shop,
+                supplier=supplier,
+                notes=f"Commande suggérée le {today}",
+                is_received=False,
+                total=sum(item.subtotal for item in items),
+            )
+            drafts.append((purchase, items))
+        return drafts
+
+    @staticmethod
+    @transaction.atomic
+    def create_purchases(drafts, user=None):
+        """Enregistre les brouillons comme achats non reçus (sans effet sur le stock)."""
+        purchases = []
+        items = []
+        for purchase, purchase_items in drafts:
+            purchase.created_by = user
+            purchase.save()
+            for item in purchase_items:
+                item.purchase = purchase
+            items.extend(purchase_items)
+            purchases.append(purchase)
+        PurchaseItem.objects.bulk_create(items)
+        return purchases
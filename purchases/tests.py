@@ -1,3 +1,101 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import Group, User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Shop
+from products.models import Category, Product
+from purchases.models import Purchase, PurchaseItem
+from purchases.planner import UNKNOWN_SUPPLIER, ReorderPlanner
+
+
+class ReorderPlannerTests(TestCase):
+    """Commandes fournisseurs suggérées"""
+
+    def setUp(self):
+        manager_group, _ = Group.objects.get_or_create(name='Manager')
+        self.manager = User.objects.create_user(username='gerant', password='secret123')
+        self.manager.groups.add(manager_group)
+        self.shop = Shop.objects.create(name='Boutique Test', created_by=self.manager)
+        self.manager.profile.shop = self.shop
+        self.manager.profile.save()
+        self.category = Category.objects.create(name='Achats')
+        self.low = self._product('Produit bas', stock=2, minimum=10)
+        self.covered = self._product('Produit commandé', stock=2, minimum=10)
+        self.healthy = self._product('Produit sain', stock=50, minimum=10)
+
+        # Historique : « Grossiste » livre en 4 jours
+        history = self._purchase('Grossiste', [(self.low, 5), (self.healthy, 5)])
+        Purchase.objects.filter(pk=history.pk).update(
+            is_received=True,
+            purchase_date=timezone.now() - timedelta(days=10),
+            received_at=timezone.now() - timedelta(days=6),
+        )
+        # Commande en cours qui couvre déjà le produit
+        self._purchase('Atelier', [(self.covered, 20)])
+
+    def _product(self, name, stock, minimum):
+        return Product.objects.create(
+            name=name, category=self.category, shop=self.shop, current_stock=stock, minimum_stock=minimum,
+            selling_price=Decimal('1000.00'), purchase_price=Decimal('400.00'),
+        )
+
+    def _purchase(self, supplier, lines):
+        purchase = Purchase.objects.create(shop=self.shop, supplier=supplier)
+        PurchaseItem.objects.bulk_create([
+            PurchaseItem(purchase=purchase, product=product, quantity=quantity,
+                         purchase_price=product.purchase_price, subtotal=quantity * product.purchase_price)
+            for product, quantity in lines
+        ])
+        return purchase
+
+    def test_suggestions_use_stock_open_orders_and_supplier_lead_time(self):
+        lines = ReorderPlanner(self.shop).suggestions()
+
+        self.assertEqual([line['product'] for line in lines], [self.low])
+        line = lines[0]
+        self.assertEqual(line['supplier'], 'Grossiste')
+        self.assertEqual(line['lead_time_days'], 4.0)
+        self.assertEqual(line['quantity'], 8)  # jusqu'au stock minimum, sans vente prévue
+
+    def test_drafts_are_grouped_by_supplier_and_saved_without_stock_change(self):
+        self.healthy.current_stock = 0
+        self.healthy.save()
+        self._product('Produit nouveau', stock=0, minimum=3)
+        planner = ReorderPlanner(self.shop)
+        drafts = planner.draft_purchases()
+
+        self.assertEqual([purchase.supplier for purchase, _ in drafts], ['Grossiste', UNKNOWN_SUPPLIER])
+        self.assertEqual(len(drafts[0][1]), 2)
+
+        purchases = planner.create_purchases(drafts, self.manager)
+        self.assertEqual(purchases[0].total, Decimal('400.00') * (8 + 10))
+        self.assertFalse(purchases[0].is_received)
+        self.low.refresh_from_db()
+        self.assertEqual(self.low.current_stock, 2)
+
+    def test_query_count_does_not_grow_with_products(self):
+        def count():
+            with CaptureQueriesContext(connection) as ctx:
+                ReorderPlanner(self.shop).suggestions()
+            return len(ctx.captured_queries)
+
+        before = count()
+        for index in range(30):
+            self._product(f'Extra {index}', stock=0, minimum=2)
+        self.assertEqual(count(), before)
+
+    def test_view_lists_and_creates_selected_suppliers(self):
+        self.client.force_login(self.manager)
+        url = reverse('purchases:purchase_suggestions')
+
+        self.assertContains(self.client.get(url), 'Produit bas')
+        response = self.client.post(url, {'suppliers': ['Grossiste']})
 
-# Create your tests here.
+        self.assertRedirects(response, reverse('purchases:purchase_list'))
+        self.assertTrue(Purchase.objects.filter(supplier='Grossiste', is_received=False, notes__startswith='Commande suggérée').exists())
@@ -14,6 +14,9 @@ urlpatterns = [
     # Détails d'un achat
     path('<int:pk>/', views.PurchaseDetailView.as_view(), name='purchase_detail'),
     
+    # Commandes suggérées
+    path('suggestions/', views.purchase_suggestions_view, name='purchase_suggestions'),
+    
     # Marquer comme reçu/non reçu
     path('<int:pk>/toggle-received/', views.purchase_toggle_received, name='purchase_toggle_received'),
     
@@ -6,9 +6,12 @@ from django.views.generic import ListView, CreateView, DetailView
 from django.contrib import messages
 from django.db import transaction
 from django.http import JsonResponse
+from django.utils import timezone
 from accounts.decorators import manager_required
 from django.utils.decorators import method_decorator
 from products.models import Product
+from inventory.models import StockMovement
+from inventory.services import InsufficientStock, StockService
 from .models import Purchase, PurchaseItem
 import json
 
@@ -78,6 +81,7 @@ def purchase_create_view(request):
                     invoice_file=invoice_file,
                     notes=notes,
                     is_received=is_received,
+                    received_at=timezone.now() if is_received else None,
                     created_by=request.user,
                     total=0  # Sera calculé automatiquement
                 )
@@ -157,23 +161,55 @@ def purchase_toggle_received(request, pk):
     # Filter by shop
     purchase = get_object_or_404(Purchase, pk=pk, shop=request.user.profile.shop)
     
-    # Si on marque comme reçu, ajouter au stock
+    lines = list(purchase.items.values_list('product_id', 'quantity', 'purchase_price'))
+    items = [(product_id, quantity) for product_id, quantity, _ in lines]
+
+    # Si on marque comme reçu, ajouter au stock (et au coût moyen pondéré)
     if not purchase.is_received:
         with transaction.atomic():
-            for item in purchase.items.all():
-                item.product.current_stock += item.quantity
-                item.product.save()
+            StockService.receive(lines, reason=StockMovement.PURCHASE, reference=f"Achat #{purchase.id}")
             purchase.is_received = True
+            purchase.received_at = timezone.now()
             purchase.save()
             messages.success(request, f'Achat #{purchase.id} marqué comme reçu. Stock mis à jour.')
     else:
         # Si on annule la réception, retirer du stock
-        with transaction.atomic():
-            for item in purchase.items.all():
-                item.product.current_stock -= item.quantity
-                item.product.save()
-            purchase.is_received = False
-            purchase.save()
+        try:
+            with transaction.atomic():
+                StockService.decrement(
+                    items, reason=StockMovement.CANCELLATION, reference=f"Réception annulée, achat #{purchase.id}",
+                )
+                purchase.is_received = False
+                purchase.received_at = None
+                purchase.save()
+        except InsufficientStock as e:
+            messages.error(request, f"Impossible d'annuler la réception : {e}")
+        else:
             messages.warning(request, f'Réception annulée pour l\'achat #{purchase.id}. Stock mis à jour.')
     
     return redirect('purchases:purchase_detail', pk=purchase.id)
+
+
+@manager_required
+def purchase_suggestions_view(request):
+    """Commandes fournisseurs suggérées (prévision, stock, commandes en cours)"""
+    from .planner import ReorderPlanner
+
+    planner = ReorderPlanner(request.user.profile.shop)
+    drafts = planner.draft_purchases()
+
+    if request.method == 'POST':
+        selected = set(request.POST.getlist('suppliers'))
+        chosen = [(purchase, items) for purchase, items in drafts if purchase.supplier in selected]
+        if not chosen:
+            messages.error(request, 'Sélectionnez au moins un fournisseur.')
+            return redirect('purchases:purchase_suggestions')
+        purchases = planner.create_purchases(chosen, request.user)
+        messages.success(request, f'{len(purchases)} commande(s) créée(s), en attente de réception.')
+        return redirect('purchases:purchase_list')
+
+    context = {
+        'drafts': [{'purchase': purchase, 'items': items} for purchase, items in drafts],
+        'lines_count': sum(len(items) for _, items in drafts),
+    }
+    return render(request, 'purchases/purchase_suggestions.html', context)
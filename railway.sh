@@ -38,6 +38,8 @@ while retry_count < max_retries:
 # Run migrations
 echo "🔄 Running database migrations..."
 python manage.py migrate --noinput
+python manage.py createcachetable
+python manage.py rebuild_effective_prices
 
 # Collect static files
 echo "📁 Collecting static files..."
@@ -56,6 +58,12 @@ else:
     print('ℹ️  Superuser already exists')
 EOF
 
+# Background workers: same container as Gunicorn (numReplicas = 1),
+# restarted if they stop. Exports and previews would otherwise stay queued.
+echo "🧵 Starting background workers..."
+(while true; do python manage.py run_report_jobs; sleep 5; done) &
+(while true; do python manage.py render_previews; sleep 5; done) &
+
 echo "======================================"
 echo "✅ Deployment setup complete!"
 echo "🚀 Starting Gunicorn server..."
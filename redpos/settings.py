@@ -134,6 +134,40 @@ else:
     print("WARNING: DATABASE_URL not found! Falling back to SQLite (Data will be lost).")
 
 
+# Cache partagé entre les workers gunicorn (versions du catalogue, snapshots...).
+# En production on utilise la base (table créée par `createcachetable`), sans
+# dépendance externe ; en local un cache mémoire suffit.
+if database_url:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'redpos_cache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'redpos-local',
+        }
+    }
+
+# Snapshot JSON du catalogue boutique (store/catalog.py)
+STORE_CATALOG_SNAPSHOT_TTL = int(os.environ.get('STORE_CATALOG_SNAPSHOT_TTL', '600'))
+STORE_CATALOG_BACKGROUND_REBUILD = _env_bool('STORE_CATALOG_BACKGROUND_REBUILD', True)
+# Durée (secondes) pendant laquelle une commande en ligne non payée garde ses articles
+STORE_RESERVATION_TTL = int(os.environ.get('STORE_RESERVATION_TTL', str(48 * 3600)))
+# Secondes après lesquelles un export comptable non pris par `run_report_jobs` est généré dans la requête de suivi ;
+# `off` : jamais (déploiements avec worker, l'export reste dans la file)
+REPORT_JOB_SYNC_AFTER = os.environ.get('REPORT_JOB_SYNC_AFTER', '15')
+REPORT_JOB_SYNC_AFTER = None if REPORT_JOB_SYNC_AFTER == 'off' else int(REPORT_JOB_SYNC_AFTER)
+# Processus de rendu des aperçus lancés par chaque processus web (products/previews.py) ;
+# 0 (défaut) : rendu par la commande render_previews, ou au passage de commande
+CUSTOMIZATION_PREVIEW_WORKERS = int(os.environ.get('CUSTOMIZATION_PREVIEW_WORKERS', '0'))
+# Aperçus conservés au plus par la commande gc_previews (les moins récemment utilisés partent d'abord)
+CUSTOMIZATION_PREVIEW_CACHE_SIZE = int(os.environ.get('CUSTOMIZATION_PREVIEW_CACHE_SIZE', '5000'))
+
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -0,0 +1,59 @@
+"""
+Cache des résumés financiers des périodes closes.
+
+Un jour passé ou un mois terminé ne change plus, sauf écriture datée dans
+le passé (annulation d'une ancienne vente, vente hors ligne synchronisée
+en retard, charge ou achat antidaté, recalcul des agrégats). Ses totaux
+sont donc gardés dans le cache partagé sous un numéro de version par
+boutique ; ces écritures l'incrémentent (maintenant et après le commit),
+les écritures du jour ne le touchent pas.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+
+VERSION_KEY = 'reports:summary:{shop_id}:version'
+SEGMENT_KEY = 'reports:summary:{shop_id}:{version}:{segment}'
+# Les entrées d'une version dépassée ne sont plus lues : elles expirent seules
+SEGMENT_TTL = 30 * 24 * 3600
+
+
+def get_summary_version(shop_id):
+    key = VERSION_KEY.format(shop_id=shop_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(shop_id):
+    try:
+        cache.incr(VERSION_KEY.format(shop_id=shop_id))
+    except ValueError:
+        get_summary_version(shop_id)
+
+
+def invalidate_closed_periods(shop_ids):
+    """À appeler après toute écriture comptable datée d'avant aujourd'hui."""
+    for shop_id in set(shop_ids):
+        if shop_id is None:
+            continue
+        _bump_version(shop_id)
+        transaction.on_commit(lambda shop_id=shop_id: _bump_version(shop_id))
+
+
+def touches_closed_period(*days):
+    """Vrai si l'un des jours (date ou datetime, None ignoré) est avant aujourd'hui."""
+    today = timezone.localdate()
+    for day in days:
+        if day is None:
+            continue
+        if hasattr(day, 'hour'):
+            day = timezone.localdate(day)
+        if day < today:
+            return True
+    return False
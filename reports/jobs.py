@@ -0,0 +1,201 @@
+"""
+File d'exports comptables (ReportJob) traitée par la commande
+`run_report_jobs`, sans broker externe : la vue enregistre la demande, le
+worker génère le fichier dans le stockage des médias (reports/) et la page
+de suivi interroge la progression. En développement, sans worker, la page
+de suivi génère elle-même un export resté en attente plus de
+REPORT_JOB_SYNC_AFTER secondes ; les déploiements lancent le worker et
+désactivent ce secours.
+
+Chaque demande porte une empreinte (boutique, format, période, version des
+données). Tant que les données de la période ne bougent pas, une nouvelle
+demande identique réutilise le fichier déjà produit (ou le job en cours).
+"""
+import hashlib
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import ReportJob
+from .services import AccountingService
+from .utils import ExportManager
+
+logger = logging.getLogger(__name__)
+
+# Un job RUNNING plus ancien que ce délai a perdu son worker (arrêt, crash)
+STALE_AFTER = timedelta(minutes=30)
+
+# (clé AccountingService.get_querysets, champ montant) composant la version des données
+VERSIONED_QUERYSETS = [
+    ('sales', 'total'),
+    ('sale_items', 'subtotal'),
+    ('purchases', 'total'),
+    ('expenses', 'amount'),
+]
+
+
+def data_version(shop, start_date=None, end_date=None):
+    """
+    Version des données d'une période : nombre, dernier id et somme des
+    montants de chaque table exportée (une requête par table). Une vente,
+    une annulation, un achat ou une charge de la période la modifie.
+    """
+    querysets = AccountingService(shop).get_querysets(start_date, end_date)
+    parts = []
+    for key, amount in VERSIONED_QUERYSETS:
+        totals = querysets[key].aggregate(count=Count('id'), last=Max('id'), amount=Sum(amount))
+        parts.append(f"{key}:{totals['count']}:{totals['last'] or 0}:{totals['amount'] or 0}")
+    return '|'.join(parts)
+
+
+def job_fingerprint(shop, report_type, start_date, end_date, version):
+    raw = f"{shop.pk}|{report_type}|{start_date or ''}|{end_date or ''}|{version}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def request_report(shop, report_type, period, start_date=None, end_date=None, user=None):
+    """
+    Retourne le job servant cette demande : un export terminé de même
+    empreinte dont le fichier existe encore, un job identique en attente ou
+    en cours, ou à défaut un nouveau job en attente.
+
+    Deux demandes simultanées ne créent qu'un job : la contrainte
+    `unique_active_report_job` refuse le second, qui reprend alors celui
+    de la première.
+    """
+    fingerprint = job_fingerprint(shop, report_type, start_date, end_date, data_version(shop, start_date, end_date))
+    job = _reusable_job(shop, fingerprint)
+    if job is not None:
+        return job
+
+    try:
+        with transaction.atomic():
+            return ReportJob.objects.create(
+                shop=shop,
+                requested_by=user,
+                report_type=report_type,
+                period=period,
+                start_date=start_date,
+                end_date=end_date,
+                fingerprint=fingerprint,
+            )
+    except IntegrityError:
+        job = _reusable_job(shop, fingerprint)
+        if job is None:
+            raise
+        return job
+
+
+def _reusable_job(shop, fingerprint):
+    existing = ReportJob.objects.filter(
+        shop=shop, fingerprint=fingerprint,
+        status__in=[ReportJob.DONE, ReportJob.PENDING, ReportJob.RUNNING],
+    ).order_by('-created_at')
+    for job in existing:
+        if job.status != ReportJob.DONE or (job.file and job.file.storage.exists(job.file.name)):
+            return job
+    return None
+
+
+def claim_next_job():
+    """
+    Prend le plus ancien job en attente. Le passage PENDING -> RUNNING est
+    un UPDATE conditionnel : deux workers ne traitent jamais le même job.
+    """
+    while True:
+        job = ReportJob.objects.filter(status=ReportJob.PENDING).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        claimed = ReportJob.objects.filter(pk=job.pk, status=ReportJob.PENDING).update(
+            status=ReportJob.RUNNING, started_at=timezone.now(), progress=0,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_if_unclaimed(job):
+    """
+    Secours synchrone : génère ici un job qu'aucun worker n'a pris depuis
+    REPORT_JOB_SYNC_AFTER secondes. Le passage PENDING -> RUNNING reste
+    conditionnel : un worker arrivé entre-temps garde la main. Désactivé
+    (REPORT_JOB_SYNC_AFTER à None) quand un worker tourne : un gros export
+    ne doit pas se générer dans la requête.
+    """
+    sync_after = getattr(settings, 'REPORT_JOB_SYNC_AFTER', 15)
+    if sync_after is None or job.status != ReportJob.PENDING:
+        return job
+    if job.created_at > timezone.now() - timedelta(seconds=sync_after):
+        return job
+    claimed = ReportJob.objects.filter(pk=job.pk, status=ReportJob.PENDING).update(
+        status=ReportJob.RUNNING, started_at=timezone.now(), progress=0,
+    )
+    job.refresh_from_db()
+    if not claimed:
+        return job
+    return run_job(job)
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """Remet en attente les jobs RUNNING abandonnés. Retourne leur nombre."""
+    return ReportJob.objects.filter(
+        status=ReportJob.RUNNING, started_at__lt=timezone.now() - older_than,
+    ).update(status=ReportJob.PENDING, progress=0)
+
+
+def _progress_callback(job):
+    """Met à jour job.progress, au plus une écriture par point de pourcentage."""
+    last = {'percent': job.progress}
+
+    def progress(done, total):
+        percent = min(99, done * 100 // total) if total else 0
+        if percent != last['percent']:
+            last['percent'] = percent
+            ReportJob.objects.filter(pk=job.pk).update(progress=percent)
+
+    return progress
+
+
+def run_job(job):
+    """Génère le fichier du job (déjà passé RUNNING) et l'enregistre."""
+    service = AccountingService(job.shop)
+    period_name = f"{job.period} ({job.start_date or ''} - {job.end_date or ''})"
+    try:
+        data = service.get_financial_summary(job.start_date, job.end_date)
+        if job.report_type == 'excel':
+            data.update(service.get_querysets(job.start_date, job.end_date))
+            output = ExportManager.to_excel(data, period_name, progress=_progress_callback(job))
+            extension = 'xlsx'
+        else:
+            output = ExportManager.to_pdf(data, period_name)
+            extension = 'pdf'
+        with output:
+            job.file.save(f"{job.fingerprint}.{extension}", File(output), save=False)
+    except Exception:
+        logger.exception("Échec de l'export comptable #%s", job.pk)
+        job.status = ReportJob.FAILED
+        job.error = traceback.format_exc(limit=5)
+    else:
+        job.status = ReportJob.DONE
+        job.progress = 100
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'status', 'progress', 'error', 'finished_at'])
+    return job
+
+
+def process_queue(limit=None):
+    """Traite les jobs en attente (au plus `limit`). Retourne le nombre traité."""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
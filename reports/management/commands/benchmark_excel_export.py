@@ -0,0 +1,97 @@
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Shop
+from products.models import Category, Product
+from reports.services import AccountingService
+from reports.utils import ExportManager
+from sales.models import Sale, SaleItem
+
+
+LINES_PER_SALE = 5
+BATCH = 10000
+
+
+class Command(BaseCommand):
+    help = "Mesure l'export Excel en flux sur des ventes factices (annulées à la fin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1000000, help='Nombre de lignes de vente générées')
+        parser.add_argument('--products', type=int, default=500, help='Nombre de produits générés')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Mesurer le pic mémoire Python (tracemalloc, export nettement plus lent)')
+
+    def _generate(self, lines, product_count):
+        rng = random.Random(42)
+        user = User.objects.create_user(username=f'benchmark-export-{time.time_ns()}')
+        shop = Shop.objects.create(name='Benchmark export', created_by=user)
+        category = Category.objects.create(name='Benchmark export', shop=shop)
+        products = Product.objects.bulk_create(
+            Product(
+                name=f'Article {index}',
+                barcode=f'BENCH-EXPORT-{index}',
+                category=category,
+                shop=shop,
+                selling_price=Decimal('1500.00'),
+                purchase_price=Decimal('700.00'),
+                is_active=False,
+            )
+            for index in range(product_count)
+        )
+
+        remaining = lines
+        while remaining:
+            sale_count = min(BATCH // LINES_PER_SALE, -(-remaining // LINES_PER_SALE))
+            sales = Sale.objects.bulk_create(
+                Sale(shop=shop, cashier=user, total=Decimal('0.00')) for _ in range(sale_count)
+            )
+            items = []
+            for sale in sales:
+                for _ in range(min(LINES_PER_SALE, remaining - len(items))):
+                    product = rng.choice(products)
+                    quantity = rng.randint(1, 4)
+                    items.append(SaleItem(
+                        sale=sale, product=product, quantity=quantity,
+                        unit_price=product.selling_price, subtotal=quantity * product.selling_price,
+                    ))
+            SaleItem.objects.bulk_create(items, batch_size=2000)
+            remaining -= len(items)
+        return shop
+
+    def handle(self, *args, **options):
+        lines = options['lines']
+
+        with transaction.atomic():
+            start = time.perf_counter()
+            shop = self._generate(lines, options['products'])
+            self.stdout.write(f"Données : {lines} lignes de vente en {time.perf_counter() - start:.1f} s")
+
+            service = AccountingService(shop)
+            data = service.get_financial_summary()
+            data.update(service.get_querysets())
+
+            with tempfile.TemporaryFile() as output:
+                if options['trace_memory']:
+                    tracemalloc.start()
+                start = time.perf_counter()
+                ExportManager.to_excel(data, 'benchmark', output=output)
+                elapsed = time.perf_counter() - start
+                size = os.fstat(output.fileno()).st_size
+                self.stdout.write(
+                    f"Export : {elapsed:.1f} s ({lines / elapsed:,.0f} lignes/s) · fichier {size / 1024 / 1024:.1f} Mo"
+                )
+                if options['trace_memory']:
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    self.stdout.write(f"Pic mémoire Python pendant l'export : {peak / 1024 / 1024:.1f} Mo")
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("✅ Mesure terminée (données annulées)"))
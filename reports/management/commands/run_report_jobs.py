@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reports.jobs import process_queue, requeue_stale
+
+
+class Command(BaseCommand):
+    help = "Worker des exports comptables : traite les ReportJob en attente (en boucle, ou une passe avec --once)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Traiter les jobs en attente puis quitter')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Secondes entre deux scrutations de la file')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"⚠️ {requeued} job(s) abandonné(s) remis en attente"))
+
+        if options['once']:
+            processed = process_queue()
+            self.stdout.write(self.style.SUCCESS(f"✅ {processed} export(s) traité(s)"))
+            return
+
+        self.stdout.write("Worker des exports comptables démarré (Ctrl+C pour arrêter)")
+        try:
+            while True:
+                processed = process_queue()
+                if processed:
+                    self.stdout.write(f"{processed} export(s) traité(s)")
+                else:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS("✅ Worker arrêté"))
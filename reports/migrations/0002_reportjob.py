@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_userprofile_address_and_more'),
+        ('reports', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_type', models.CharField(choices=[('excel', 'Excel'), ('pdf', 'PDF')], max_length=10, verbose_name='Format')),
+                ('period', models.CharField(blank=True, max_length=20, verbose_name='Période')),
+                ('start_date', models.DateField(blank=True, null=True, verbose_name='Du')),
+                ('end_date', models.DateField(blank=True, null=True, verbose_name='Au')),
+                ('fingerprint', models.CharField(db_index=True, max_length=64, verbose_name='Empreinte')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('done', 'Terminé'), ('failed', 'Échec')], default='pending', max_length=10, verbose_name='Statut')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='Progression (%)')),
+                ('file', models.FileField(blank=True, upload_to='reports/', verbose_name='Fichier')),
+                ('error', models.TextField(blank=True, verbose_name='Erreur')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Demandé par')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_jobs', to='accounts.shop')),
+            ],
+            options={
+                'verbose_name': 'Export comptable',
+                'verbose_name_plural': 'Exports comptables',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='reports_rep_status_051565_idx')],
+            },
+        ),
+    ]
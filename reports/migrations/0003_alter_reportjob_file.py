@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 13:10
+
+import reports.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_reportjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportjob',
+            name='file',
+            field=models.FileField(blank=True, storage=reports.models.report_storage, upload_to='reports/', verbose_name='Fichier'),
+        ),
+    ]
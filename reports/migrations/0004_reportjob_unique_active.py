@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+def fail_duplicate_active_jobs(apps, schema_editor):
+    """Doublons créés avant la contrainte : seul le plus ancien job actif reste dans la file."""
+    ReportJob = apps.get_model('reports', 'ReportJob')
+    seen = set()
+    active = ReportJob.objects.filter(status__in=['pending', 'running']).order_by('created_at', 'id')
+    for job in active.only('id', 'shop_id', 'fingerprint'):
+        key = (job.shop_id, job.fingerprint)
+        if key in seen:
+            ReportJob.objects.filter(pk=job.pk).update(status='failed', error='Doublon d\'un export déjà en file')
+        seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_alter_reportjob_file'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reportjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('shop', 'fingerprint'), name='unique_active_report_job'),
+        ),
+    ]
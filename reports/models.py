@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.db import models
 from django.contrib.auth.models import User
 from accounts.models import Shop
@@ -43,3 +45,78 @@ class Expense(models.Model):
 
     def __str__(self):
         return f"{self.title} - {self.amount} FC ({self.date})"
+
+
+CLOUDINARY_MEDIA_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+
+
+def report_storage():
+    """
+    Stockage des exports. Avec Cloudinary, le stockage média envoie en
+    `resource_type='image'` et refuse les .xlsx : les exports partent en « raw ».
+    """
+    if settings.STORAGES['default']['BACKEND'] == CLOUDINARY_MEDIA_STORAGE:
+        from cloudinary_storage.storage import RawMediaCloudinaryStorage
+        return RawMediaCloudinaryStorage()
+    return default_storage
+
+
+class ReportJob(models.Model):
+    """
+    Export comptable (Excel/PDF) généré en arrière-plan par la commande
+    `run_report_jobs`. Le fichier produit est réutilisé par toute demande
+    de même empreinte (boutique, type, période, version des données).
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'En attente'),
+        (RUNNING, 'En cours'),
+        (DONE, 'Terminé'),
+        (FAILED, 'Échec'),
+    ]
+    TYPE_CHOICES = [
+        ('excel', 'Excel'),
+        ('pdf', 'PDF'),
+    ]
+
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='report_jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, verbose_name="Demandé par")
+    report_type = models.CharField(max_length=10, choices=TYPE_CHOICES, verbose_name="Format")
+    period = models.CharField(max_length=20, blank=True, verbose_name="Période")
+    start_date = models.DateField(null=True, blank=True, verbose_name="Du")
+    end_date = models.DateField(null=True, blank=True, verbose_name="Au")
+    fingerprint = models.CharField(max_length=64, db_index=True, verbose_name="Empreinte")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Statut")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="Progression (%)")
+    file = models.FileField(upload_to='reports/', storage=report_storage, blank=True, verbose_name="Fichier")
+    error = models.TextField(blank=True, verbose_name="Erreur")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Export comptable"
+        verbose_name_plural = "Exports comptables"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            # Un seul job actif par empreinte : deux clics simultanés ne lancent pas deux exports
+            models.UniqueConstraint(
+                fields=['shop', 'fingerprint'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_active_report_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Export {self.get_report_type_display()} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def filename(self):
+        extension = 'xlsx' if self.report_type == 'excel' else 'pdf'
+        return f"Bilan_MKARIBU_{self.period or 'periode'}.{extension}"
@@ -1,65 +1,189 @@
-from django.db.models import Sum, F
+import calendar
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum, F
 from django.utils import timezone
-from datetime import datetime, date, timedelta
-from sales.models import Sale
+from datetime import datetime, date, time, timedelta
+from sales.models import DailyShopSales, Sale, SaleItem
 from purchases.models import Purchase
+from .cache import SEGMENT_KEY, SEGMENT_TTL, get_summary_version
 from .models import Expense, ExpenseCategory
 
+
+# Totaux du résumé par table : (clé, agrégat, champ)
+SUMMARY_TOTALS = {
+    'daily_sales': [
+        ('revenue', Sum, 'revenue'), ('cost_of_goods_sold', Sum, 'cost'), ('sales_count', Sum, 'sale_count'),
+    ],
+    'purchases': [('stock_costs', Sum, 'total'), ('purchases_count', Count, 'id')],
+    'expenses': [('operating_expenses', Sum, 'amount'), ('expenses_count', Count, 'id')],
+}
+# Champ daté de chaque table ; les DateTimeField sont filtrés sur des bornes
+# de journée locale [début, fin[ et non sur `__date` (qui empêche l'index)
+DATE_FIELDS = {
+    'sales': ('sale_date', True),
+    'sale_items': ('sale__sale_date', True),
+    'daily_sales': ('date', False),
+    'purchases': ('purchase_date', True),
+    'expenses': ('date', False),
+}
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def date_range_q(field, is_datetime, start_date=None, end_date=None):
+    """Condition (indexable) sur `field` pour les jours [start_date, end_date]."""
+    if not is_datetime:
+        lookups = {f'{field}__gte': start_date, f'{field}__lte': end_date}
+    else:
+        lookups = {
+            f'{field}__gte': day_start(start_date) if start_date else None,
+            f'{field}__lt': day_start(end_date + timedelta(days=1)) if end_date else None,
+        }
+    return Q(**{lookup: value for lookup, value in lookups.items() if value is not None})
+
+
+def split_period(start_date, end_date, today):
+    """
+    Découpe [start_date, end_date] (None = sans borne) en segments
+    (libellé, début, fin) : mois complets et jours isolés avant `today`,
+    mémorisables, puis le segment en cours (libellé None) à recalculer.
+    Sans date de début, le passé est un seul segment « jusqu'à hier ».
+    """
+    segments = []
+    last_closed = today - timedelta(days=1)
+    closed_end = min(end_date, last_closed) if end_date else last_closed
+    if start_date is None:
+        segments.append((f'until:{closed_end}', None, closed_end))
+    else:
+        day = start_date
+        while day <= closed_end:
+            month_end = day.replace(day=calendar.monthrange(day.year, day.month)[1])
+            if day.day == 1 and month_end <= closed_end:
+                segments.append((f'month:{day:%Y-%m}', day, month_end))
+                day = month_end + timedelta(days=1)
+            else:
+                segments.append((f'day:{day}', day, day))
+                day += timedelta(days=1)
+    if end_date is None or end_date >= today:
+        segments.append((None, max(start_date, today) if start_date else today, end_date))
+    return segments
+
+
 class AccountingService:
     def __init__(self, shop):
         self.shop = shop
 
+    def get_querysets(self, start_date=None, end_date=None):
+        """
+        Querysets de la période (non tronqués) : ventes validées, lignes de
+        ces ventes, agrégats journaliers, achats et charges.
+        """
+        querysets = {
+            'sales': Sale.objects.filter(shop=self.shop, is_cancelled=False),
+            'sale_items': SaleItem.objects.filter(sale__shop=self.shop, sale__is_cancelled=False),
+            'daily_sales': DailyShopSales.objects.filter(shop=self.shop),
+            'purchases': Purchase.objects.filter(shop=self.shop),
+            'expenses': Expense.objects.filter(shop=self.shop),
+        }
+        return {
+            name: queryset.filter(date_range_q(*DATE_FIELDS[name], start_date, end_date))
+            for name, queryset in querysets.items()
+        }
+
+    def _compute_segments(self, querysets, segments):
+        """
+        Totaux de chaque segment : une requête par table, une somme
+        conditionnelle (FILTER / CASE) par segment et par total.
+        """
+        results = [{} for _ in segments]
+        for table, totals in SUMMARY_TOTALS.items():
+            field, is_datetime = DATE_FIELDS[table]
+            aggregates = {}
+            for index, (_, first, last) in enumerate(segments):
+                condition = date_range_q(field, is_datetime, first, last)
+                for key, function, column in totals:
+                    aggregates[f'{key}_{index}'] = function(column, filter=condition)
+            row = querysets[table].aggregate(**aggregates)
+            for index, result in enumerate(results):
+                for key, _, _ in totals:
+                    result[key] = row[f'{key}_{index}'] or 0
+        return results
+
+    def get_period_totals(self, start_date=None, end_date=None):
+        """
+        Totaux de la période (revenus, achats, charges et leurs nombres).
+        Les segments clos sont lus dans le cache (voir reports/cache.py) ;
+        les manquants et le jour en cours sont calculés en une passe.
+        """
+        segments = split_period(start_date, end_date, timezone.localdate())
+        version = get_summary_version(self.shop.pk)
+        keys = {
+            label: SEGMENT_KEY.format(shop_id=self.shop.pk, version=version, segment=label)
+            for label, _, _ in segments if label is not None
+        }
+        cached = cache.get_many(list(keys.values()))
+        missing = [segment for segment in segments if keys.get(segment[0]) not in cached]
+
+        totals = [cached[key] for key in keys.values() if key in cached]
+        if missing:
+            computed = self._compute_segments(self.get_querysets(start_date, end_date), missing)
+            totals.extend(computed)
+            closed = {keys[label]: result for (label, _, _), result in zip(missing, computed) if label is not None}
+            if closed:
+                # Lu dans une transaction, un total peut inclure des écritures
+                # non validées : partagé seulement après le commit.
+                transaction.on_commit(partial(cache.set_many, closed, timeout=SEGMENT_TTL))
+
+        summed = {key: 0 for totals in SUMMARY_TOTALS.values() for key, _, _ in totals}
+        for result in totals:
+            for key, value in result.items():
+                summed[key] += value
+        return summed
+
     def get_financial_summary(self, start_date=None, end_date=None):
         """
         Récupère le résumé financier (Revenus, Achats, Frais, Bénéfice) 
         pour une période donnée.
         """
-        # Filtrage par dates si fournies
-        sales_qs = Sale.objects.filter(shop=self.shop, is_cancelled=False)
-        purchases_qs = Purchase.objects.filter(shop=self.shop)
-        expenses_qs = Expense.objects.filter(shop=self.shop)
-
-        if start_date:
-            sales_qs = sales_qs.filter(sale_date__date__gte=start_date)
-            purchases_qs = purchases_qs.filter(purchase_date__date__gte=start_date)
-            expenses_qs = expenses_qs.filter(date__gte=start_date)
-        
-        if end_date:
-            sales_qs = sales_qs.filter(sale_date__date__lte=end_date)
-            purchases_qs = purchases_qs.filter(purchase_date__date__lte=end_date)
-            expenses_qs = expenses_qs.filter(date__lte=end_date)
-
-        # Calcul des agrégations
-        revenue = sales_qs.aggregate(total=Sum('total'))['total'] or 0
-        stock_costs = purchases_qs.aggregate(total=Sum('total'))['total'] or 0
-        operating_expenses = expenses_qs.aggregate(total=Sum('amount'))['total'] or 0
-
-        total_costs = stock_costs + operating_expenses
+        totals = self.get_period_totals(start_date, end_date)
+        querysets = self.get_querysets(start_date, end_date)
+
+        revenue = totals['revenue']
+        # Coût des marchandises vendues : coûts figés sur les lignes de vente.
+        # Les achats de la période (stock_costs) sont une sortie de trésorerie,
+        # pas une charge du résultat.
+        cost_of_goods_sold = totals['cost_of_goods_sold']
+        gross_margin = revenue - cost_of_goods_sold
+        stock_costs = totals['stock_costs']
+        operating_expenses = totals['operating_expenses']
+        total_costs = cost_of_goods_sold + operating_expenses
         net_profit = revenue - total_costs
 
         return {
             'revenue': revenue,
+            'cost_of_goods_sold': cost_of_goods_sold,
+            'gross_margin': gross_margin,
             'stock_costs': stock_costs,
             'operating_expenses': operating_expenses,
             'total_costs': total_costs,
             'net_profit': net_profit,
-            'sales_count': sales_qs.count(),
-            'purchases_count': purchases_qs.count(),
-            'expenses_count': expenses_qs.count(),
-            # Données pour les détails
-            'sales': sales_qs.order_by('-sale_date')[:50],  # Limite pour le dash
-            'purchases': purchases_qs.order_by('-purchase_date')[:50],
-            'expenses': expenses_qs.order_by('-date')[:50],
+            'sales_count': totals['sales_count'],
+            'purchases_count': totals['purchases_count'],
+            'expenses_count': totals['expenses_count'],
+            # Données pour les détails (évaluées seulement si affichées)
+            'sales': querysets['sales'].order_by('-sale_date')[:50],  # Limite pour le dash
+            'purchases': querysets['purchases'].order_by('-purchase_date')[:50],
+            'expenses': querysets['expenses'].order_by('-date')[:50],
         }
 
     def get_expense_breakdown(self, start_date=None, end_date=None):
         """Répartition des dépenses par catégorie."""
-        expenses_qs = Expense.objects.filter(shop=self.shop)
-        if start_date:
-            expenses_qs = expenses_qs.filter(date__gte=start_date)
-        if end_date:
-            expenses_qs = expenses_qs.filter(date__lte=end_date)
-            
+        expenses_qs = self.get_querysets(start_date, end_date)['expenses']
         return expenses_qs.values('category__name', 'category__icon').annotate(
             total=Sum('amount')
         ).order_by('-total')
@@ -67,7 +191,7 @@ class AccountingService:
     @staticmethod
     def get_date_range(period):
         """Helper pour obtenir les plages de dates prédéfinies."""
-        today = timezone.now().date()
+        today = timezone.localdate()
         if period == 'day':
             return today, today
         elif period == 'month':
@@ -0,0 +1,33 @@
+"""
+Signaux Django de la comptabilité.
+Une charge ou un achat daté d'un jour passé (création, modification,
+suppression) invalide les résumés mis en cache des périodes closes.
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from purchases.models import Purchase
+from .cache import invalidate_closed_periods, touches_closed_period
+from .models import Expense
+
+
+DATE_FIELDS = {Expense: 'date', Purchase: 'purchase_date'}
+
+
+@receiver(post_init, sender=Expense)
+@receiver(post_init, sender=Purchase)
+def remember_loaded_date(sender, instance, **kwargs):
+    instance._accounting_date = instance.__dict__.get(DATE_FIELDS[sender])
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Purchase)
+def invalidate_closed_summaries(sender, instance, raw=False, **kwargs):
+    if raw:
+        return  # chargement de fixtures
+    day = instance.__dict__.get(DATE_FIELDS[sender])
+    if touches_closed_period(day, instance._accounting_date):
+        invalidate_closed_periods([instance.shop_id])
+    instance._accounting_date = day
@@ -14,4 +14,6 @@ urlpatterns = [
     
     # Exports
     path('accounting/export/<str:format>/', views.ExportAccountingView.as_view(), name='export'),
+    path('accounting/exports/<int:pk>/', views.ReportJobDetailView.as_view(), name='job_detail'),
+    path('accounting/exports/<int:pk>/download/', views.ReportJobDownloadView.as_view(), name='job_download'),
 ]
\ No newline at end of file
@@ -1,20 +1,72 @@
 import io
+import tempfile
 from datetime import datetime
-from django.http import HttpResponse
+from django.utils import timezone
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Border, Side, PatternFill
+from openpyxl.utils import get_column_letter
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from sales.models import Sale
+
+# Lignes lues par aller-retour base pendant l'export Excel
+EXPORT_CHUNK_SIZE = 2000
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Onglets de détail : (titre, clé dans `data`, en-têtes, colonnes lues, ordre)
+DETAIL_SHEETS = [
+    ("Ventes", 'sales',
+     ["ID", "Date", "Caissier", "Mode Paiement", "Montant (FC)"],
+     ('id', 'sale_date', 'cashier__username', 'payment_method', 'total'),
+     ('sale_date', 'id')),
+    ("Lignes de vente", 'sale_items',
+     ["Vente", "Date", "Produit", "Code-barres", "Quantité", "Prix unitaire (FC)", "Sous-total (FC)"],
+     ('sale_id', 'sale__sale_date', 'product__name', 'product__barcode', 'quantity', 'unit_price', 'subtotal'),
+     ('sale__sale_date', 'sale_id', 'id')),
+    ("Achats", 'purchases',
+     ["ID", "Date", "Fournisseur", "N° Facture", "Reçu", "Montant (FC)"],
+     ('id', 'purchase_date', 'supplier', 'invoice_number', 'is_received', 'total'),
+     ('purchase_date', 'id')),
+    ("Charges", 'expenses',
+     ["Date", "Catégorie", "Intitulé", "Montant (FC)"],
+     ('date', 'category__name', 'title', 'amount'),
+     ('date', 'id')),
+]
+
+
+def _excel_row(row, tz):
+    """Excel ne connaît pas les fuseaux : dates ramenées à l'heure locale."""
+    return [
+        value.astimezone(tz).replace(tzinfo=None)
+        if isinstance(value, datetime) and value.tzinfo is not None else value
+        for value in row
+    ]
+
 
 class ExportManager:
     @staticmethod
-    def to_excel(data, period_name="Rapport"):
-        """Génère un fichier Excel stylisé."""
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Résumé Financier"
+    def to_excel(data, period_name="Rapport", output=None, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+        """
+        Génère un fichier Excel stylisé, en flux.
+
+        Classeur `write_only` : chaque ligne part sur disque dès qu'elle est
+        écrite, et les querysets de `data` ('sales', 'sale_items',
+        'purchases', 'expenses', voir AccountingService.get_querysets) sont
+        lus par paquets de `chunk_size` lignes. La mémoire ne dépend pas du
+        nombre de lignes exportées.
+
+        `progress(lignes écrites, lignes totales)` est appelé après chaque
+        paquet (un COUNT par onglet pour connaître le total).
+
+        Retourne `output` (fichier temporaire par défaut), repositionné au début.
+        """
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Résumé Financier")
+        ws.column_dimensions['A'].width = 36
+        ws.column_dimensions['B'].width = 20
 
         # Styles
         header_fill = PatternFill(start_color="1F4E78", end_color="1F4E78", fill_type="solid")
@@ -23,51 +75,77 @@ class ExportManager:
             left=Side(style='thin'), right=Side(style='thin'),
             top=Side(style='thin'), bottom=Side(style='thin')
         )
-        
+
+        def styled(value, header=False):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.border = border
+            if header:
+                cell.fill = header_fill
+                cell.font = header_font
+            return cell
+
         # En-tête du document
-        ws.merge_cells('A1:D1')
-        ws['A1'] = f"MKARIBU - BILAN COMPTABLE ({period_name.upper()})"
-        ws['A1'].font = Font(size=14, bold=True)
-        ws['A1'].alignment = Alignment(horizontal='center')
-        
-        ws.append([]) # Ligne vide
+        heading = WriteOnlyCell(ws, value=f"MKARIBU - BILAN COMPTABLE ({period_name.upper()})")
+        heading.font = Font(size=14, bold=True)
+        ws.append([heading])
+        ws.append([])  # Ligne vide
 
         # Section Résumé
-        ws.append(["Indicateur", "Valeur (FC)"])
+        ws.append([styled("Indicateur", header=True), styled("Valeur (FC)", header=True)])
         summary_rows = [
             ("Total Revenus (Ventes)", data['revenue']),
-            ("Coûts Stock (Achats)", data['stock_costs']),
+            ("Coût des Marchandises Vendues", data['cost_of_goods_sold']),
+            ("Marge Brute", data['gross_margin']),
             ("Frais Fonctionnement (Charges)", data['operating_expenses']),
-            ("Bénéfice Net", data['net_profit'])
+            ("Bénéfice Net", data['net_profit']),
+            ("Achats de Stock (Trésorerie)", data['stock_costs']),
         ]
-        
-        for row in summary_rows:
-            ws.append(row)
-        
-        # Mise en forme Résumé
-        for row in ws.iter_rows(min_row=3, max_row=7, min_col=1, max_col=2):
-            for cell in row:
-                cell.border = border
-                if cell.row == 3:
-                    cell.fill = header_fill
-                    cell.font = header_font
-
-        # Onglet Détails Ventes
-        ws_sales = wb.create_sheet("Détails Ventes")
-        ws_sales.append(["ID", "Date", "Mode Paiement", "Montant (FC)"])
-        for sale in data['sales']:
-            ws_sales.append([sale.id, sale.sale_date.strftime('%d/%m/%Y'), sale.get_payment_method_display(), sale.total])
-            
-        # Onglet Détails Dépenses
-        ws_exp = wb.create_sheet("Détails Charges")
-        ws_exp.append(["Date", "Catégorie", "Intitulé", "Montant (FC)"])
-        for exp in data['expenses']:
-            ws_exp.append([exp.date.strftime('%d/%m/%Y'), exp.category.name, exp.title, exp.amount])
-
-        # Finalisation réponse
-        output = io.BytesIO()
+        for label, value in summary_rows:
+            ws.append([styled(label), styled(value)])
+
+        # Onglets de détail, lus en flux
+        payment_methods = dict(Sale.PAYMENT_METHODS)
+        tz = timezone.get_current_timezone()
+        total = done = 0
+        if progress is not None:
+            total = sum(data[key].count() for _, key, *_ in DETAIL_SHEETS if data.get(key) is not None)
+            progress(done, total)
+        for title, key, headers, columns, ordering in DETAIL_SHEETS:
+            queryset = data.get(key)
+            if queryset is None:
+                continue
+            sheet = wb.create_sheet(title)
+            sheet.freeze_panes = 'A2'
+            for index in range(len(headers)):
+                sheet.column_dimensions[get_column_letter(index + 1)].width = 18
+            header_cells = []
+            for header in headers:
+                cell = WriteOnlyCell(sheet, value=header)
+                cell.fill = header_fill
+                cell.font = header_font
+                header_cells.append(cell)
+            sheet.append(header_cells)
+
+            rows = queryset.order_by(*ordering).values_list(*columns).iterator(chunk_size=chunk_size)
+            for row in rows:
+                row = _excel_row(row, tz)
+                if key == 'sales':
+                    row[3] = payment_methods.get(row[3], row[3])
+                elif key == 'sale_items' and row[2] is None:
+                    row[2] = "Produit supprimé"
+                elif key == 'purchases':
+                    row[4] = "Oui" if row[4] else "Non"
+                sheet.append(row)
+                done += 1
+                if progress is not None and done % chunk_size == 0:
+                    progress(done, total)
+
+        # Finalisation : zip écrit dans le fichier de sortie
+        output = output if output is not None else tempfile.TemporaryFile()
         wb.save(output)
         output.seek(0)
+        if progress is not None:
+            progress(total, total)
         return output
 
     @staticmethod
@@ -88,9 +166,11 @@ class ExportManager:
         table_data = [
             ['INDICATEUR', 'MONTANT (FC)'],
             ['Revenus Totaux', f"{data['revenue']:,.2f}"],
-            ['Coûts de Stock', f"{data['stock_costs']:,.2f}"],
+            ['Coût des Marchandises Vendues', f"{data['cost_of_goods_sold']:,.2f}"],
+            ['Marge Brute', f"{data['gross_margin']:,.2f}"],
             ['Charges de Fonctionnement', f"{data['operating_expenses']:,.2f}"],
-            ['BÉNÉFICE NET', f"{data['net_profit']:,.2f}"]
+            ['BÉNÉFICE NET', f"{data['net_profit']:,.2f}"],
+            ['Achats de Stock (Trésorerie)', f"{data['stock_costs']:,.2f}"],
         ]
         
         t = Table(table_data, colWidths=[200, 150])
@@ -102,8 +182,8 @@ class ExportManager:
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
             ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTNAME', (0, 4), (-1, 4), 'Helvetica-Bold'),
-            ('TEXTCOLOR', (0, 4), (1, 4), colors.red if data['net_profit'] < 0 else colors.green),
+            ('FONTNAME', (0, 5), (-1, 5), 'Helvetica-Bold'),
+            ('TEXTCOLOR', (0, 5), (1, 5), colors.red if data['net_profit'] < 0 else colors.green),
         ]))
         elements.append(t)
         
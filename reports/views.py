@@ -1,13 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, View
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, JsonResponse
 from django.utils.decorators import method_decorator
 from accounts.decorators import manager_required
-from .models import Expense, ExpenseCategory
+from .jobs import request_report, run_if_unclaimed
+from .models import Expense, ExpenseCategory, ReportJob
 from .services import AccountingService
-from .utils import ExportManager
+from .utils import EXCEL_CONTENT_TYPE
 from datetime import datetime
 
 @method_decorator(manager_required, name='dispatch')
@@ -92,27 +93,49 @@ class ExpenseCategoryCreateView(CreateView):
 
 @method_decorator(manager_required, name='dispatch')
 class ExportAccountingView(View):
+    """
+    Met l'export en file (commande `run_report_jobs`) : redirige vers le
+    fichier s'il existe déjà pour ces données, sinon vers la page de suivi.
+    """
     def get(self, request, format):
-        service = AccountingService(request.user.profile.shop)
+        if format not in dict(ReportJob.TYPE_CHOICES):
+            return redirect('reports:dashboard')
+        shop = request.user.profile.shop
         period = request.GET.get('period', 'month')
-        start_date, end_date = service.get_date_range(period)
-        
-        data = service.get_financial_summary(start_date, end_date)
-        period_name = f"{period} ({start_date or ''} - {end_date or ''})"
-        
-        if format == 'excel':
-            output = ExportManager.to_excel(data, period_name)
-            response = HttpResponse(
-                output.read(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename=Bilan_MKARIBU_{period}.xlsx'
-            return response
-            
-        elif format == 'pdf':
-            buffer = ExportManager.to_pdf(data, period_name)
-            response = HttpResponse(buffer, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename=Bilan_MKARIBU_{period}.pdf'
-            return response
-            
-        return redirect('reports:dashboard')
+        start_date, end_date = AccountingService(shop).get_date_range(period)
+
+        job = request_report(shop, format, period, start_date, end_date, user=request.user)
+        if job.status == ReportJob.DONE:
+            return redirect('reports:job_download', pk=job.pk)
+        return redirect('reports:job_detail', pk=job.pk)
+
+
+@method_decorator(manager_required, name='dispatch')
+class ReportJobDetailView(View):
+    """Page de suivi d'un export ; `?format=json` pour la progression."""
+    template_name = 'reports/report_job.html'
+
+    def get(self, request, pk):
+        job = run_if_unclaimed(get_object_or_404(ReportJob, pk=pk, shop=request.user.profile.shop))
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'status': job.status,
+                'status_display': job.get_status_display(),
+                'progress': job.progress,
+                'download_url': reverse('reports:job_download', args=[job.pk]) if job.status == ReportJob.DONE else None,
+            })
+        return render(request, self.template_name, {'job': job})
+
+
+@method_decorator(manager_required, name='dispatch')
+class ReportJobDownloadView(View):
+    def get(self, request, pk):
+        job = get_object_or_404(ReportJob, pk=pk, shop=request.user.profile.shop, status=ReportJob.DONE)
+        if not job.file:
+            raise Http404("Fichier d'export introuvable")
+        return FileResponse(
+            job.file.open('rb'),
+            as_attachment=True,
+            filename=job.filename,
+            content_type=EXCEL_CONTENT_TYPE if job.report_type == 'excel' else 'application/pdf',
+        )
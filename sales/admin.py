@@ -1,7 +1,15 @@
 # sales/admin.py
 
 from django.contrib import admin
-from .models import Sale, SaleItem
+from .models import OfflinePriceConflict, Sale, SaleItem
+from .rollups import rebuild_daily_sales, sale_day
+
+
+def _rebuild_sale_day(sale):
+    """Lignes modifiées à la main : agrégats du jour recalculés depuis les ventes."""
+    if sale.shop_id:
+        day = sale_day(sale)
+        rebuild_daily_sales(start=day, end=day, shop=sale.shop)
 
 
 class SaleItemInline(admin.TabularInline):
@@ -33,6 +41,18 @@ class SaleAdmin(admin.ModelAdmin):
             'fields': ('notes', 'is_cancelled')
         }),
     )
+    
+    def save_formset(self, request, form, formset, change):
+        """Saisie manuelle : les lignes mettent à jour stock et total"""
+        if formset.model is not SaleItem:
+            return super().save_formset(request, form, formset, change)
+        instances = formset.save(commit=False)
+        for obj in formset.deleted_objects:
+            obj.delete()
+        for instance in instances:
+            instance.save(apply_side_effects=True)
+        formset.save_m2m()
+        _rebuild_sale_day(form.instance)
 
 
 @admin.register(SaleItem)
@@ -41,3 +61,21 @@ class SaleItemAdmin(admin.ModelAdmin):
     list_filter = ['sale__sale_date']
     search_fields = ['product__name', 'sale__id']
     readonly_fields = ['subtotal']
+    
+    def save_model(self, request, obj, form, change):
+        obj.save(apply_side_effects=True)
+        _rebuild_sale_day(obj.sale)
+
+    def delete_model(self, request, obj):
+        sale = obj.sale
+        super().delete_model(request, obj)
+        _rebuild_sale_day(sale)
+
+
+@admin.register(OfflinePriceConflict)
+class OfflinePriceConflictAdmin(admin.ModelAdmin):
+    list_display = ['sale', 'product', 'quantity', 'offline_price', 'booked_price', 'created_at', 'is_reviewed']
+    list_filter = ['is_reviewed', 'created_at']
+    list_editable = ['is_reviewed']
+    search_fields = ['product__name', 'sale__id', 'sale__cashier__username']
+    readonly_fields = ['sale', 'product', 'quantity', 'offline_price', 'booked_price', 'created_at']
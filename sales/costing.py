@@ -0,0 +1,69 @@
+"""
+Reprise du coût de revient des lignes de vente antérieures au coût figé.
+
+Les nouvelles lignes reçoivent leur coût à l'écriture (coût moyen pondéré
+du produit, voir StockService.receive). Pour l'historique, le coût moyen
+de l'époque n'est pas connu : on prend le prix de la dernière réception
+d'achat du produit avant la vente, à défaut son coût actuel.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from purchases.models import PurchaseItem
+from .models import SaleItem
+
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+def _receipts(product_ids):
+    """{product_id: ([dates de réception], [prix])} triés par date."""
+    receipts = defaultdict(lambda: ([], []))
+    rows = (
+        PurchaseItem.objects.filter(product_id__in=product_ids, purchase__is_received=True)
+        .order_by('purchase__purchase_date', 'id')
+        .values_list('product_id', 'purchase__purchase_date', 'purchase_price')
+    )
+    for product_id, received_at, price in rows:
+        receipts[product_id][0].append(received_at)
+        receipts[product_id][1].append(price)
+    return receipts
+
+
+def historical_unit_cost(item, receipts):
+    if item.product is None:
+        return Decimal('0.00')
+    dates, prices = receipts.get(item.product_id, ([], []))
+    index = bisect_right(dates, item.sale.sale_date)
+    return prices[index - 1] if index else item.product.unit_cost
+
+
+def backfill_sale_costs(chunk_size=BACKFILL_CHUNK_SIZE, progress=None):
+    """
+    Renseigne unit_cost et cost des lignes qui n'en ont pas, par paquets de
+    `chunk_size` (trois requêtes chacun : lignes, réceptions, `bulk_update`).
+    `progress(lignes traitées)` est appelé après chaque paquet.
+    Retourne le nombre de lignes mises à jour.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        chunk = list(
+            SaleItem.objects.filter(unit_cost__isnull=True, id__gt=last_id)
+            .select_related('sale', 'product')
+            .only('id', 'quantity', 'product_id', 'sale__sale_date',
+                  'product__average_cost', 'product__purchase_price')
+            .order_by('id')[:chunk_size]
+        )
+        if not chunk:
+            return updated
+        receipts = _receipts({item.product_id for item in chunk if item.product_id})
+        for item in chunk:
+            item.unit_cost = historical_unit_cost(item, receipts)
+            item.cost = item.quantity * item.unit_cost
+        SaleItem.objects.bulk_update(chunk, ['unit_cost', 'cost'])
+        updated += len(chunk)
+        last_id = chunk[-1].id
+        if progress is not None:
+            progress(updated)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from sales.costing import BACKFILL_CHUNK_SIZE, backfill_sale_costs
+from sales.rollups import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = "Renseigne le coût de revient des lignes de vente historiques, puis recalcule les agrégats journaliers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE, help='Lignes traitées par paquet')
+        parser.add_argument('--no-rebuild', action='store_true', help='Ne pas recalculer les agrégats journaliers')
+
+    def handle(self, *args, **options):
+        updated = backfill_sale_costs(
+            chunk_size=options['chunk_size'],
+            progress=lambda count: self.stdout.write(f"{count} ligne(s) reprise(s)..."),
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ {updated} ligne(s) de vente reprise(s)"))
+
+        if updated and not options['no_rebuild']:
+            count = rebuild_daily_sales()
+            self.stdout.write(self.style.SUCCESS(f"✅ {count} ligne(s) d'agrégat recalculée(s)"))
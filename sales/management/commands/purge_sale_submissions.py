@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sales.models import SaleSubmission
+
+
+class Command(BaseCommand):
+    help = "Supprime les clés d'idempotence de caisse plus anciennes que N jours"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Durée de conservation (jours)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = SaleSubmission.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"✅ {deleted} clé(s) supprimée(s)"))
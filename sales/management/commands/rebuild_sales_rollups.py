@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Shop
+from sales.rollups import rebuild_daily_sales
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise CommandError(f"Date invalide : {value} (format AAAA-MM-JJ)")
+
+
+class Command(BaseCommand):
+    help = "Recalcule les agrégats journaliers des ventes sur une période (tout l'historique par défaut)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Premier jour (AAAA-MM-JJ)')
+        parser.add_argument('--end', help='Dernier jour inclus (AAAA-MM-JJ)')
+        parser.add_argument('--shop', type=int, help='Limiter à une boutique (id)')
+
+    def handle(self, *args, **options):
+        start, end = _parse_date(options['start']), _parse_date(options['end'])
+        shop = None
+        if options['shop']:
+            try:
+                shop = Shop.objects.get(pk=options['shop'])
+            except Shop.DoesNotExist:
+                raise CommandError(f"Boutique {options['shop']} introuvable")
+        count = rebuild_daily_sales(start=start, end=end, shop=shop)
+        self.stdout.write(self.style.SUCCESS(f"✅ {count} ligne(s) d'agrégat écrite(s)"))
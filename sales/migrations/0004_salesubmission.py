@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 13:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0003_saleitem_product_setnull'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleSubmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, verbose_name="Clé d'idempotence")),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Reçue le')),
+                ('cashier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sale_submissions', to=settings.AUTH_USER_MODEL, verbose_name='Caissier')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='sales.sale', verbose_name='Vente')),
+            ],
+            options={
+                'verbose_name': 'Soumission de vente',
+                'verbose_name_plural': 'Soumissions de vente',
+                'indexes': [models.Index(fields=['created_at'], name='sales_sales_created_467001_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cashier', 'key'), name='unique_sale_submission_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 6.0 on 2026-10-18 13:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Agrégats des ventes existantes (même calcul que sales.rollups.rebuild_daily_sales)."""
+    Sale = apps.get_model('sales', 'Sale')
+    SaleItem = apps.get_model('sales', 'SaleItem')
+    DailyProductSales = apps.get_model('sales', 'DailyProductSales')
+    DailyShopSales = apps.get_model('sales', 'DailyShopSales')
+
+    cost = ExpressionWrapper(F('quantity') * F('product__purchase_price'), output_field=DecimalField())
+    items = SaleItem.objects.filter(sale__is_cancelled=False, sale__shop__isnull=False).annotate(
+        day=TruncDate('sale__sale_date')
+    )
+    DailyProductSales.objects.bulk_create(
+        (
+            DailyProductSales(
+                shop_id=row['sale__shop_id'], product_id=row['product_id'], date=row['day'],
+                quantity=row['sold'], revenue=row['sales_revenue'], cost=row['sales_cost'] or 0,
+            )
+            for row in items.filter(product__isnull=False)
+            .values('sale__shop_id', 'product_id', 'day')
+            .annotate(sold=Sum('quantity'), sales_revenue=Sum('subtotal'), sales_cost=Sum(cost))
+        ),
+        batch_size=1000,
+    )
+
+    shop_rows = {
+        (row['shop_id'], row['cashier_id'], row['day']): DailyShopSales(
+            shop_id=row['shop_id'], cashier_id=row['cashier_id'], date=row['day'], sale_count=row['sale_count'],
+        )
+        for row in Sale.objects.filter(is_cancelled=False, shop__isnull=False)
+        .annotate(day=TruncDate('sale_date'))
+        .values('shop_id', 'cashier_id', 'day')
+        .annotate(sale_count=Count('id'))
+    }
+    for row in items.values('sale__shop_id', 'sale__cashier_id', 'day').annotate(
+        sold=Sum('quantity'), sales_revenue=Sum('subtotal'), sales_cost=Sum(cost)
+    ):
+        shop_row = shop_rows[(row['sale__shop_id'], row['sale__cashier_id'], row['day'])]
+        shop_row.item_count = row['sold']
+        shop_row.revenue = row['sales_revenue']
+        shop_row.cost = row['sales_cost'] or 0
+    DailyShopSales.objects.bulk_create(shop_rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_userprofile_address_and_more'),
+        ('products', '0018_product_search_trgm'),
+        ('sales', '0004_salesubmission'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Jour')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Quantité vendue')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name="Chiffre d'affaires")),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name="Coût d'achat")),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product', verbose_name='Produit')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_product_sales', to='accounts.shop', verbose_name='Boutique')),
+            ],
+            options={
+                'verbose_name': 'Ventes journalières (produit)',
+                'verbose_name_plural': 'Ventes journalières (produits)',
+                'indexes': [models.Index(fields=['shop', 'date'], name='sales_daily_shop_id_13c760_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'date'), name='unique_daily_product_sales')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyShopSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Jour')),
+                ('sale_count', models.IntegerField(default=0, verbose_name='Nombre de ventes')),
+                ('item_count', models.IntegerField(default=0, verbose_name='Articles vendus')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name="Chiffre d'affaires")),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name="Coût d'achat")),
+                ('cashier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to=settings.AUTH_USER_MODEL, verbose_name='Caissier')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='accounts.shop', verbose_name='Boutique')),
+            ],
+            options={
+                'verbose_name': 'Ventes journalières (boutique)',
+                'verbose_name_plural': 'Ventes journalières (boutiques)',
+                'indexes': [models.Index(fields=['shop', 'date'], name='sales_daily_shop_id_a9cbd0_idx'), models.Index(fields=['cashier', 'date'], name='sales_daily_cashier_055d75_idx')],
+                'constraints': [models.UniqueConstraint(fields=('shop', 'cashier', 'date'), name='unique_daily_shop_sales')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
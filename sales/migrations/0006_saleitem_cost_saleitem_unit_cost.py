@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_daily_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='cost',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Coût de revient'),
+        ),
+        migrations.AddField(
+            model_name='saleitem',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Coût unitaire'),
+        ),
+    ]
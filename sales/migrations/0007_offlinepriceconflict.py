@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 18:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0023_productpricechange'),
+        ('sales', '0006_saleitem_cost_saleitem_unit_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfflinePriceConflict',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Quantité')),
+                ('offline_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Prix envoyé par la caisse')),
+                ('booked_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Prix enregistré')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Signalé le')),
+                ('is_reviewed', models.BooleanField(default=False, verbose_name='Contrôlé')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offline_price_conflicts', to='products.product', verbose_name='Produit')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_conflicts', to='sales.sale', verbose_name='Vente')),
+            ],
+            options={
+                'verbose_name': 'Écart de prix hors ligne',
+                'verbose_name_plural': 'Écarts de prix hors ligne',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['is_reviewed', '-created_at'], name='sales_offli_is_revi_19e90f_idx')],
+            },
+        ),
+    ]
@@ -4,6 +4,8 @@ from django.core.validators import MinValueValidator
 from decimal import Decimal
 from products.models import Product
 from accounts.models import Shop
+from inventory.models import StockMovement
+from inventory.services import StockService
 
 
 class Sale(models.Model):
@@ -123,6 +125,22 @@ class SaleItem(models.Model):
         validators=[MinValueValidator(Decimal('0.01'))],
         verbose_name="Sous-total"
     )
+    # Coût de revient figé à la vente (coût moyen pondéré du produit) ;
+    # vide pour les lignes antérieures tant que `backfill_sale_costs` n'est pas passé
+    unit_cost = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name="Coût unitaire"
+    )
+    cost = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name="Coût de revient"
+    )
     
     class Meta:
         verbose_name = "Ligne de vente"
@@ -132,20 +150,191 @@ class SaleItem(models.Model):
         product_name = self.product.name if self.product else "Produit supprimé"
         return f"{product_name} x{self.quantity} - {self.subtotal} FC"
     
-    def save(self, *args, **kwargs):
-        """Calcule automatiquement le sous-total et met à jour le stock"""
-        # Calculer le sous-total
+    def save(self, *args, apply_side_effects=False, **kwargs):
+        """
+        Calcule automatiquement le sous-total.
+        
+        Avec apply_side_effects=True (saisie manuelle, admin), déduit aussi le
+        stock et recalcule le total de la vente. La caisse passe par
+        sales.services.SaleBuilder, qui fait tout cela en une fois.
+        """
+        # Calculer le sous-total et figer le coût de revient
         self.subtotal = self.quantity * self.unit_price
+        if self.unit_cost is None:
+            self.unit_cost = self.product.unit_cost if self.product else Decimal('0.00')
+        self.cost = self.quantity * self.unit_cost
         
         # Sauvegarder l'item
         is_new = self.pk is None
         super().save(*args, **kwargs)
         
+        if not apply_side_effects:
+            return
+        
         # Déduire du stock si c'est une nouvelle vente
         if is_new and not self.sale.is_cancelled and self.product:
-            self.product.current_stock -= self.quantity
-            self.product.save()
+            new_stock = StockService.decrement(
+                [(self.product_id, self.quantity)], reason=StockMovement.SALE, reference=f"Vente #{self.sale_id}",
+                respect_reservations=True,
+            )
+            self.product.current_stock = new_stock[self.product_id]
         
         # Recalculer le total de la vente
-        self.sale.calculate_total()
         self.sale.save()
+
+
+class SaleSubmission(models.Model):
+    """
+    Clé d'idempotence envoyée par la caisse avec chaque validation.
+    Un double clic ou une relance après coupure renvoie la vente déjà créée
+    au lieu d'en créer une seconde.
+    """
+    
+    key = models.CharField(
+        max_length=64,
+        verbose_name="Clé d'idempotence"
+    )
+    cashier = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='sale_submissions',
+        verbose_name="Caissier"
+    )
+    sale = models.ForeignKey(
+        Sale,
+        on_delete=models.CASCADE,
+        related_name='submissions',
+        verbose_name="Vente"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Reçue le"
+    )
+    
+    class Meta:
+        verbose_name = "Soumission de vente"
+        verbose_name_plural = "Soumissions de vente"
+        constraints = [
+            models.UniqueConstraint(fields=['cashier', 'key'], name='unique_sale_submission_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} → Vente #{self.sale_id}"
+
+
+class OfflinePriceConflict(models.Model):
+    """
+    Ligne de vente hors ligne dont le prix envoyé par la caisse ne correspond
+    à aucun prix en vigueur pendant la coupure. La ligne est enregistrée au
+    prix en vigueur à l'heure de la vente ; l'écart reste ici, à contrôler
+    par un manager.
+    """
+
+    sale = models.ForeignKey(
+        Sale,
+        on_delete=models.CASCADE,
+        related_name='price_conflicts',
+        verbose_name="Vente"
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='offline_price_conflicts',
+        verbose_name="Produit"
+    )
+    quantity = models.IntegerField(verbose_name="Quantité")
+    offline_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Prix envoyé par la caisse")
+    booked_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Prix enregistré")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Signalé le")
+    is_reviewed = models.BooleanField(default=False, verbose_name="Contrôlé")
+
+    class Meta:
+        verbose_name = "Écart de prix hors ligne"
+        verbose_name_plural = "Écarts de prix hors ligne"
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['is_reviewed', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Vente #{self.sale_id} · {self.product} : {self.offline_price} → {self.booked_price}"
+
+
+class DailyProductSales(models.Model):
+    """
+    Agrégat journalier des ventes d'un produit (ventes non annulées).
+    Tenu à jour dans la transaction de chaque vente (sales/rollups.py) ;
+    les graphiques et le Cerveau lisent ici au lieu de re-sommer les SaleItem.
+    """
+    
+    shop = models.ForeignKey(
+        Shop,
+        on_delete=models.CASCADE,
+        related_name='daily_product_sales',
+        verbose_name="Boutique"
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='daily_sales',
+        verbose_name="Produit"
+    )
+    date = models.DateField(verbose_name="Jour")
+    quantity = models.IntegerField(default=0, verbose_name="Quantité vendue")
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Chiffre d'affaires")
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Coût d'achat")
+    
+    class Meta:
+        verbose_name = "Ventes journalières (produit)"
+        verbose_name_plural = "Ventes journalières (produits)"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='unique_daily_product_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['shop', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} {self.date} : {self.quantity}"
+
+
+class DailyShopSales(models.Model):
+    """
+    Agrégat journalier des ventes d'une boutique, par caissier (ventes non
+    annulées). Les totaux boutique somment les quelques caissiers du jour.
+    """
+    
+    shop = models.ForeignKey(
+        Shop,
+        on_delete=models.CASCADE,
+        related_name='daily_sales',
+        verbose_name="Boutique"
+    )
+    cashier = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='daily_sales',
+        verbose_name="Caissier"
+    )
+    date = models.DateField(verbose_name="Jour")
+    sale_count = models.IntegerField(default=0, verbose_name="Nombre de ventes")
+    item_count = models.IntegerField(default=0, verbose_name="Articles vendus")
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Chiffre d'affaires")
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Coût d'achat")
+    
+    class Meta:
+        verbose_name = "Ventes journalières (boutique)"
+        verbose_name_plural = "Ventes journalières (boutiques)"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'cashier', 'date'], name='unique_daily_shop_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['shop', 'date']),
+            models.Index(fields=['cashier', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.shop_id}/{self.cashier_id} {self.date} : {self.revenue}"
@@ -0,0 +1,196 @@
+"""
+Agrégats journaliers des ventes (DailyProductSales, DailyShopSales).
+
+Ils sont mis à jour dans la transaction qui crée ou annule les ventes :
+un lot de ventes = une lecture verrouillée des lignes concernées, un
+`bulk_update` et un `bulk_create` par table, quel que soit le nombre de
+ventes. `rebuild_daily_sales` les recalcule depuis les ventes brutes.
+
+Le jour d'une vente est sa date locale (TIME_ZONE). Les ventes sans
+boutique (anciennes données) ne sont pas agrégées.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from reports.cache import invalidate_closed_periods
+from .models import DailyProductSales, DailyShopSales, Sale, SaleItem
+
+
+PRODUCT_FIELDS = ['quantity', 'revenue', 'cost']
+SHOP_FIELDS = ['sale_count', 'item_count', 'revenue', 'cost']
+
+
+def sale_day(sale):
+    return timezone.localdate(sale.sale_date)
+
+
+def _item_cost(item):
+    """Coût figé de la ligne ; à défaut (ligne non reprise), coût actuel du produit."""
+    if item.cost is not None:
+        return item.cost
+    return item.quantity * item.product.unit_cost if item.product else Decimal('0.00')
+
+
+def _deltas(sales, items, sign):
+    product_deltas = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')])
+    shop_deltas = defaultdict(lambda: [0, 0, Decimal('0.00'), Decimal('0.00')])
+    sales_by_id = {sale.id: sale for sale in sales if sale.shop_id}
+
+    for sale in sales_by_id.values():
+        shop_deltas[(sale.shop_id, sale.cashier_id, sale_day(sale))][0] += sign
+    for item in items:
+        sale = sales_by_id.get(item.sale_id)
+        if sale is None:
+            continue
+        day = sale_day(sale)
+        cost = _item_cost(item)
+        shop_row = shop_deltas[(sale.shop_id, sale.cashier_id, day)]
+        shop_row[1] += sign * item.quantity
+        shop_row[2] += sign * item.subtotal
+        shop_row[3] += sign * cost
+        if item.product_id:
+            product_row = product_deltas[(sale.shop_id, item.product_id, day)]
+            product_row[0] += sign * item.quantity
+            product_row[1] += sign * item.subtotal
+            product_row[2] += sign * cost
+    return product_deltas, shop_deltas
+
+
+def _apply(model, dimension, fields, deltas):
+    """Ajoute les deltas {(shop_id, dimension_id, jour): valeurs} aux lignes de `model`."""
+    if not deltas:
+        return
+    keys = list(deltas)
+    existing = model.objects.select_for_update().filter(
+        shop_id__in={key[0] for key in keys},
+        date__in={key[2] for key in keys},
+        **{f'{dimension}__in': {key[1] for key in keys}},
+    ).order_by('pk')
+    rows = {(row.shop_id, getattr(row, dimension), row.date): row for row in existing}
+
+    to_update, to_create = [], []
+    for key, values in deltas.items():
+        row = rows.get(key)
+        if row is None:
+            row = model(shop_id=key[0], date=key[2], **{dimension: key[1]})
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        for field, value in zip(fields, values):
+            setattr(row, field, getattr(row, field) + value)
+
+    if to_update:
+        model.objects.bulk_update(to_update, fields)
+    if to_create:
+        model.objects.bulk_create(to_create)
+
+
+def record_sales(sales, items=None, sign=1):
+    """
+    Ajoute (sign=1) ou retire (sign=-1) des ventes des agrégats.
+    `items` : lignes des ventes avec leur produit chargé ; relues sinon.
+    À appeler dans la transaction qui écrit les ventes.
+    """
+    sales = [sale for sale in sales if sale.shop_id]
+    if not sales:
+        return
+    if items is None:
+        items = SaleItem.objects.filter(sale__in=sales).select_related('product')
+    product_deltas, shop_deltas = _deltas(sales, list(items), sign)
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                _apply(DailyProductSales, 'product_id', PRODUCT_FIELDS, product_deltas)
+                _apply(DailyShopSales, 'cashier_id', SHOP_FIELDS, shop_deltas)
+            break
+        except IntegrityError:
+            # Ligne du jour créée en parallèle par une autre caisse : on relit.
+            if attempt:
+                raise
+
+    # Vente annulée ou synchronisée après coup : les totaux en cache des jours passés changent
+    today = timezone.localdate()
+    invalidate_closed_periods(shop_id for shop_id, _, day in shop_deltas if day < today)
+
+
+def _range_filter(prefix, start, end, shop):
+    filters = {f'{prefix}shop__isnull': False}
+    if start:
+        filters[f'{prefix}sale_date__date__gte'] = start
+    if end:
+        filters[f'{prefix}sale_date__date__lte'] = end
+    if shop is not None:
+        filters[f'{prefix}shop'] = shop
+    return filters
+
+
+@transaction.atomic
+def rebuild_daily_sales(start=None, end=None, shop=None):
+    """
+    Recalcule les agrégats des jours [start, end] (bornes incluses, None =
+    sans limite) depuis les ventes brutes. Retourne le nombre de lignes écrites.
+    """
+    rollup_filter = {}
+    if start:
+        rollup_filter['date__gte'] = start
+    if end:
+        rollup_filter['date__lte'] = end
+    if shop is not None:
+        rollup_filter['shop'] = shop
+    shop_ids = set(DailyShopSales.objects.filter(**rollup_filter).values_list('shop_id', flat=True).distinct())
+    DailyProductSales.objects.filter(**rollup_filter).delete()
+    DailyShopSales.objects.filter(**rollup_filter).delete()
+
+    cost = Coalesce(
+        'cost',
+        ExpressionWrapper(
+            F('quantity') * Coalesce('product__average_cost', 'product__purchase_price'),
+            output_field=DecimalField(),
+        ),
+        output_field=DecimalField(),
+    )
+    items = (
+        SaleItem.objects.filter(sale__is_cancelled=False, **_range_filter('sale__', start, end, shop))
+        .annotate(day=TruncDate('sale__sale_date'))
+    )
+
+    product_rows = [
+        DailyProductSales(
+            shop_id=row['sale__shop_id'], product_id=row['product_id'], date=row['day'],
+            quantity=row['sold'], revenue=row['sales_revenue'], cost=row['sales_cost'] or 0,
+        )
+        for row in items.filter(product__isnull=False)
+        .values('sale__shop_id', 'product_id', 'day')
+        .annotate(sold=Sum('quantity'), sales_revenue=Sum('subtotal'), sales_cost=Sum(cost))
+    ]
+
+    shop_rows = {}
+    sales = (
+        Sale.objects.filter(is_cancelled=False, **_range_filter('', start, end, shop))
+        .annotate(day=TruncDate('sale_date'))
+        .values('shop_id', 'cashier_id', 'day')
+        .annotate(sale_count=Count('id'))
+    )
+    for row in sales:
+        shop_rows[(row['shop_id'], row['cashier_id'], row['day'])] = DailyShopSales(
+            shop_id=row['shop_id'], cashier_id=row['cashier_id'], date=row['day'], sale_count=row['sale_count'],
+        )
+    for row in (
+        items.values('sale__shop_id', 'sale__cashier_id', 'day')
+        .annotate(sold=Sum('quantity'), sales_revenue=Sum('subtotal'), sales_cost=Sum(cost))
+    ):
+        shop_row = shop_rows[(row['sale__shop_id'], row['sale__cashier_id'], row['day'])]
+        shop_row.item_count = row['sold']
+        shop_row.revenue = row['sales_revenue']
+        shop_row.cost = row['sales_cost'] or 0
+
+    DailyProductSales.objects.bulk_create(product_rows, batch_size=1000)
+    DailyShopSales.objects.bulk_create(shop_rows.values(), batch_size=1000)
+    invalidate_closed_periods(shop_ids | {key[0] for key in shop_rows})
+    return len(product_rows) + len(shop_rows)
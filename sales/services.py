@@ -0,0 +1,435 @@
+"""
+Service de création des ventes (caisse)
+Une vente de N lignes = un nombre fixe de requêtes, quel que soit N.
+"""
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from inventory.models import StockMovement
+from inventory.services import InsufficientStock, StockService
+from products.models import Product, ProductPriceChange
+from .models import OfflinePriceConflict, Sale, SaleItem, SaleSubmission
+from .rollups import record_sales
+
+
+class SaleBuilder:
+    """
+    Construit une vente en une passe :
+    - produits chargés en une requête (`in_bulk`) ;
+    - stock vérifié et décrémenté en un seul UPDATE (StockService) ;
+    - Sale écrite une fois avec son total, SaleItem en `bulk_create` ;
+    - agrégats journaliers mis à jour dans la même transaction (sales/rollups.py).
+
+    Les effets de bord de SaleItem.save (stock, recalcul du total) ne sont pas
+    déclenchés : tout est fait ici, une seule fois.
+
+    Avec une clé d'idempotence (générée par la caisse), une même soumission
+    rejouée renvoie la vente déjà créée (`replayed` passe à True) au lieu d'en
+    créer une seconde, y compris si les deux requêtes arrivent en même temps.
+
+    Usage:
+        builder = SaleBuilder(shop=shop, cashier=user, payment_method='CASH')
+        builder.add(product_id, 2)
+        sale = builder.build()
+    """
+
+    def __init__(self, shop, cashier, payment_method='CASH', notes=None, idempotency_key=None):
+        self.shop = shop
+        self.cashier = cashier
+        self.payment_method = payment_method
+        self.notes = notes
+        self.idempotency_key = idempotency_key or None
+        self.lines = OrderedDict()
+        self.replayed = False
+
+    def add(self, product_id, quantity):
+        """Ajoute une ligne ; un même produit ajouté deux fois est regroupé."""
+        product_id = int(product_id)
+        quantity = int(quantity)
+        if quantity < 1:
+            raise ValueError(f"Quantité invalide pour le produit {product_id}")
+        self.lines[product_id] = self.lines.get(product_id, 0) + quantity
+        return self
+
+    def build(self):
+        """
+        Crée la vente. Lève Product.DoesNotExist si un produit est introuvable,
+        InsufficientStock si le stock ne suffit pas (rien n'est alors écrit).
+        """
+        previous = self._submitted_sale()
+        if previous is not None:
+            self.replayed = True
+            return previous
+
+        if not self.lines:
+            raise ValueError("Le panier est vide")
+
+        products = Product.objects.in_bulk(list(self.lines.keys()))
+        missing = [product_id for product_id in self.lines if product_id not in products]
+        if missing:
+            raise Product.DoesNotExist(f"Produit(s) introuvable(s) : {', '.join(map(str, missing))}")
+
+        items = []
+        total = Decimal('0.00')
+        for product_id, quantity in self.lines.items():
+            product = products[product_id]
+            subtotal = quantity * product.selling_price
+            total += subtotal
+            items.append(SaleItem(
+                product=product,
+                quantity=quantity,
+                unit_price=product.selling_price,
+                subtotal=subtotal,
+                unit_cost=product.unit_cost,
+                cost=quantity * product.unit_cost,
+            ))
+
+        try:
+            with transaction.atomic():
+                sale = Sale.objects.create(
+                    shop=self.shop,
+                    cashier=self.cashier,
+                    payment_method=self.payment_method,
+                    notes=self.notes,
+                    total=total,
+                )
+                # Clé réservée avant le stock : un doublon concurrent bute sur
+                # la contrainte unique (en attendant le commit de l'original)
+                # au lieu de perdre la course au stock.
+                if self.idempotency_key:
+                    SaleSubmission.objects.create(key=self.idempotency_key, cashier=self.cashier, sale=sale)
+                # Les unités réservées par les commandes en ligne ne sont pas vendables
+                new_stock = StockService.decrement(
+                    self.lines.items(), reason=StockMovement.SALE, reference=f"Vente #{sale.pk}",
+                    respect_reservations=True,
+                )
+                for item in items:
+                    item.sale = sale
+                SaleItem.objects.bulk_create(items)
+                record_sales([sale], items)
+        except (IntegrityError, InsufficientStock):
+            # Même clé validée en parallèle : notre transaction (stock compris)
+            # est annulée, on renvoie la vente de l'autre requête.
+            previous = self._submitted_sale()
+            if previous is None:
+                raise
+            self.replayed = True
+            return previous
+
+        for product_id, stock in new_stock.items():
+            products[product_id].current_stock = stock
+        return sale
+
+    def _submitted_sale(self):
+        if not self.idempotency_key:
+            return None
+        submission = (
+            SaleSubmission.objects.select_related('sale')
+            .filter(cashier=self.cashier, key=self.idempotency_key)
+            .first()
+        )
+        return submission.sale if submission else None
+
+
+class _PriceTimeline:
+    """
+    Prix de vente en vigueur à une date, reconstitué depuis le journal
+    ProductPriceChange (une requête pour tout le lot, bornée à la période).
+    """
+
+    def __init__(self, products, since):
+        self.products = products
+        self.changes = defaultdict(list)
+        rows = (
+            ProductPriceChange.objects.filter(product_id__in=list(products), changed_at__gt=since)
+            .order_by('changed_at', 'id')
+            .values_list('product_id', 'changed_at', 'previous_price', 'selling_price')
+        )
+        for product_id, changed_at, previous_price, selling_price in rows:
+            self.changes[product_id].append((changed_at, previous_price, selling_price))
+
+    def price_at(self, product_id, moment):
+        for changed_at, previous_price, _ in self.changes[product_id]:
+            if changed_at > moment:
+                return previous_price
+        return self.products[product_id].selling_price
+
+    def prices_between(self, product_id, start, end):
+        """Prix en vigueur à un moment quelconque de [start, end]."""
+        prices = {self.price_at(product_id, start)}
+        prices.update(
+            selling_price for changed_at, _, selling_price in self.changes[product_id]
+            if start < changed_at <= end
+        )
+        return prices
+
+
+class OfflineSaleSync:
+    """
+    Applique en une transaction un lot de ventes faites hors ligne par la caisse.
+
+    Le coût ne dépend pas du nombre de ventes : une requête pour les clés déjà
+    connues, une pour les produits, un verrou + un UPDATE pour tout le stock,
+    puis des `bulk_create` pour Sale, SaleItem et SaleSubmission.
+
+    Une vente hors ligne a déjà eu lieu (la marchandise est sortie) : elle est
+    enregistrée même si le stock devient négatif ou passe sous les unités
+    réservées par les commandes en ligne, et le produit est signalé en
+    conflit pour recomptage.
+
+    Le prix unitaire encaissé hors ligne (`unit_price` de chaque ligne) est
+    enregistré s'il a été en vigueur entre le catalogue chargé par la caisse
+    (`snapshot_at`, au plus SNAPSHOT_MAX_AGE avant la vente) et la vente. Un
+    autre prix n'est pas cru : la ligne prend le prix en vigueur à l'heure
+    de la vente, et l'écart est enregistré (OfflinePriceConflict, visible
+    dans l'admin) et renvoyé dans `price_conflicts`. Une ligne sans prix
+    (ancienne file) prend le prix en vigueur à l'heure de la vente.
+
+    Chaque vente reçoit un statut : 'created', 'replayed' (clé déjà reçue),
+    ou 'invalid' (données illisibles, produit inconnu).
+    """
+
+    MAX_BATCH_SIZE = 500
+    # Âge maximal accordé au catalogue local de la caisse pour le contrôle des prix
+    SNAPSHOT_MAX_AGE = timedelta(days=7)
+
+    def __init__(self, shop, cashier):
+        self.shop = shop
+        self.cashier = cashier
+
+    @staticmethod
+    def _parse_date(value, now):
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+        if parsed is None:
+            return None
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        # Horloge de la caisse en avance : on ne date pas une vente dans le futur
+        return min(parsed, now)
+
+    @staticmethod
+    def _parse_price(value, product_id):
+        if value is None:
+            return None
+        try:
+            price = Decimal(str(value)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError(f"Prix invalide pour le produit {product_id}")
+        if price < 0:
+            raise ValueError(f"Prix invalide pour le produit {product_id}")
+        return price
+
+    def _parse(self, entry, now):
+        key = str(entry.get('idempotency_key') or '').strip()
+        if not key or len(key) > 64:
+            raise ValueError("Clé d'idempotence manquante ou invalide")
+        lines = OrderedDict()
+        prices = {}
+        for line in entry.get('cart') or []:
+            product_id = int(line['product_id'])
+            quantity = int(line['quantity'])
+            if quantity < 1:
+                raise ValueError(f"Quantité invalide pour le produit {product_id}")
+            lines[product_id] = lines.get(product_id, 0) + quantity
+            price = self._parse_price(line.get('unit_price'), product_id)
+            if price is not None:
+                if prices.setdefault(product_id, price) != price:
+                    raise ValueError(f"Prix contradictoires pour le produit {product_id}")
+        if not lines:
+            raise ValueError("Panier vide")
+        payment_method = entry.get('payment_method') or 'CASH'
+        if payment_method not in dict(Sale.PAYMENT_METHODS):
+            raise ValueError(f"Mode de paiement inconnu : {payment_method}")
+        return {
+            'key': key,
+            'lines': lines,
+            'prices': prices,
+            'payment_method': payment_method,
+            'sale_date': self._parse_date(entry.get('created_at'), now),
+            'snapshot_at': self._parse_date(entry.get('snapshot_at'), now),
+        }
+
+    def _book_prices(self, to_create, products, now):
+        """
+        Fixe `booked` ({product_id: prix enregistré}) et `rejected_prices` de
+        chaque vente ; retourne les écarts pour la réponse.
+        """
+        windows = {}
+        for sale_data in to_create:
+            end = sale_data['sale_date'] or now
+            start = min(max(sale_data['snapshot_at'] or end, end - self.SNAPSHOT_MAX_AGE), end)
+            windows[sale_data['key']] = (start, end)
+        since = min((start for start, _ in windows.values()), default=now)
+        timeline = _PriceTimeline(products, since)
+
+        conflicts = []
+        for sale_data in to_create:
+            start, end = windows[sale_data['key']]
+            sale_data['booked'] = {}
+            sale_data['rejected_prices'] = []
+            for product_id in sale_data['lines']:
+                offline_price = sale_data['prices'].get(product_id)
+                if offline_price is not None and offline_price in timeline.prices_between(product_id, start, end):
+                    sale_data['booked'][product_id] = offline_price
+                    continue
+                booked = timeline.price_at(product_id, end)
+                sale_data['booked'][product_id] = booked
+                if offline_price is not None and offline_price != booked:
+                    sale_data['rejected_prices'].append(product_id)
+                    conflicts.append({
+                        'idempotency_key': sale_data['key'],
+                        'product_id': product_id,
+                        'name': products[product_id].name,
+                        'unit_price': offline_price,
+                        'price': booked,
+                    })
+        return conflicts
+
+    def apply(self, entries):
+        """
+        Args:
+            entries: liste de dicts {idempotency_key, cart, payment_method, created_at, snapshot_at},
+                cart = [{product_id, quantity, unit_price}]
+
+        Returns:
+            dict: {'results': [...], 'conflicts': [...], 'price_conflicts': [...],
+                   'stock': {product_id: stock}}
+        """
+        if len(entries) > self.MAX_BATCH_SIZE:
+            raise ValueError(f"Lot trop volumineux (max {self.MAX_BATCH_SIZE} ventes)")
+
+        now = timezone.now()
+        results = []
+        parsed = []
+        for entry in entries:
+            try:
+                sale_data = self._parse(entry, now)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                key = entry.get('idempotency_key') if isinstance(entry, dict) else None
+                results.append({'idempotency_key': key, 'status': 'invalid', 'error': str(e)})
+                continue
+            results.append({'idempotency_key': sale_data['key']})
+            sale_data['result'] = results[-1]
+            parsed.append(sale_data)
+
+        with transaction.atomic():
+            submitted = dict(
+                SaleSubmission.objects.filter(
+                    cashier=self.cashier,
+                    key__in=[sale_data['key'] for sale_data in parsed],
+                ).values_list('key', 'sale_id')
+            )
+            product_ids = {product_id for sale_data in parsed for product_id in sale_data['lines']}
+            products = Product.objects.in_bulk(list(product_ids))
+
+            to_create = []
+            created_by_key = {}
+            repeated = []
+            for sale_data in parsed:
+                result = sale_data['result']
+                if sale_data['key'] in submitted:
+                    result['status'] = 'replayed'
+                    result['sale_id'] = submitted[sale_data['key']]
+                    continue
+                if sale_data['key'] in created_by_key:
+                    # Même clé deux fois dans le lot
+                    result['status'] = 'replayed'
+                    repeated.append(sale_data)
+                    continue
+                missing = [product_id for product_id in sale_data['lines'] if product_id not in products]
+                if missing:
+                    result['status'] = 'invalid'
+                    result['error'] = f"Produit(s) introuvable(s) : {', '.join(map(str, missing))}"
+                    continue
+                created_by_key[sale_data['key']] = sale_data
+                to_create.append(sale_data)
+
+            deltas = defaultdict(int)
+            for sale_data in to_create:
+                for product_id, quantity in sale_data['lines'].items():
+                    deltas[product_id] -= quantity
+            new_stock = StockService.apply(
+                deltas, allow_negative=True, reason=StockMovement.SALE,
+                reference=f"Synchronisation hors ligne ({len(to_create)} vente(s))",
+            )
+            # Ventes déjà faites : elles passent, mais entamer les réservations
+            # des commandes en ligne est signalé comme un manque de stock.
+            reserved = StockService._reserved(list(new_stock))
+
+            price_conflicts = self._book_prices(to_create, products, now)
+
+            sales = []
+            for sale_data in to_create:
+                total = sum(
+                    (quantity * sale_data['booked'][product_id]
+                     for product_id, quantity in sale_data['lines'].items()),
+                    Decimal('0.00'),
+                )
+                sale_data['sale'] = Sale(
+                    shop=self.shop,
+                    cashier=self.cashier,
+                    payment_method=sale_data['payment_method'],
+                    notes='Vente hors ligne synchronisée',
+                    total=total,
+                )
+                sales.append(sale_data['sale'])
+            Sale.objects.bulk_create(sales)
+
+            # sale_date est en auto_now_add : on remet l'heure réelle de la vente
+            dated = []
+            for sale_data in to_create:
+                if sale_data['sale_date'] is not None:
+                    sale_data['sale'].sale_date = sale_data['sale_date']
+                    dated.append(sale_data['sale'])
+            if dated:
+                Sale.objects.bulk_update(dated, ['sale_date'])
+
+            items = []
+            submissions = []
+            for sale_data in to_create:
+                sale = sale_data['sale']
+                for product_id, quantity in sale_data['lines'].items():
+                    product = products[product_id]
+                    unit_price = sale_data['booked'][product_id]
+                    items.append(SaleItem(
+                        sale=sale,
+                        product=product,
+                        quantity=quantity,
+                        unit_price=unit_price,
+                        subtotal=quantity * unit_price,
+                        unit_cost=product.unit_cost,
+                        cost=quantity * product.unit_cost,
+                    ))
+                submissions.append(SaleSubmission(key=sale_data['key'], cashier=self.cashier, sale=sale))
+                sale_data['result'].update({'status': 'created', 'sale_id': sale.id, 'total': float(sale.total)})
+            SaleItem.objects.bulk_create(items)
+            SaleSubmission.objects.bulk_create(submissions)
+            OfflinePriceConflict.objects.bulk_create([
+                OfflinePriceConflict(
+                    sale=sale_data['sale'], product=products[product_id],
+                    quantity=sale_data['lines'][product_id],
+                    offline_price=sale_data['prices'][product_id],
+                    booked_price=sale_data['booked'][product_id],
+                )
+                for sale_data in to_create for product_id in sale_data['rejected_prices']
+            ])
+            record_sales([sale_data['sale'] for sale_data in to_create], items)
+            for sale_data in repeated:
+                sale_data['result']['sale_id'] = created_by_key[sale_data['key']]['sale'].id
+
+        conflicts = [
+            {
+                'product_id': product_id,
+                'name': products[product_id].name,
+                'stock': stock,
+                'reserved': reserved.get(product_id, 0),
+            }
+            for product_id, stock in new_stock.items()
+            if stock - reserved.get(product_id, 0) < 0
+        ]
+        return {'results': results, 'conflicts': conflicts, 'price_conflicts': price_conflicts, 'stock': new_stock}
@@ -0,0 +1,30 @@
+"""
+Signaux Django pour les ventes.
+Annulation (ou rétablissement) et suppression d'une vente : mise à jour des
+agrégats journaliers (sales/rollups.py).
+"""
+from django.db.models.signals import post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Sale
+from .rollups import record_sales
+
+
+@receiver(post_init, sender=Sale)
+def remember_cancelled_state(sender, instance, **kwargs):
+    instance._was_cancelled = instance.__dict__.get('is_cancelled')
+
+
+@receiver(post_save, sender=Sale)
+def update_rollups_on_cancel(sender, instance, created, **kwargs):
+    was_cancelled = getattr(instance, '_was_cancelled', None)
+    instance._was_cancelled = instance.is_cancelled
+    if created or was_cancelled is None or was_cancelled == instance.is_cancelled:
+        return
+    record_sales([instance], sign=-1 if instance.is_cancelled else 1)
+
+
+@receiver(pre_delete, sender=Sale)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    if not instance.is_cancelled:
+        record_sales([instance], sign=-1)
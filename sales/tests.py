@@ -1,3 +1,419 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Shop
+from products.models import Category, Product
+from purchases.models import Purchase, PurchaseItem
+from sales.costing import backfill_sale_costs
+from sales.models import DailyProductSales, DailyShopSales, OfflinePriceConflict, Sale, SaleItem, SaleSubmission
+from sales.rollups import rebuild_daily_sales
+from sales.services import SaleBuilder
+
+
+class ValidateSaleTests(TestCase):
+    def setUp(self):
+        cashier_group, _ = Group.objects.get_or_create(name='Cashier')
+        self.cashier = User.objects.create_user(username='caisse', password='secret123')
+        self.cashier.groups.add(cashier_group)
+        self.shop = Shop.objects.create(name='Boutique Test', created_by=self.cashier)
+        self.cashier.profile.shop = self.shop
+        self.cashier.profile.save()
+        self.client.force_login(self.cashier)
+
+        category = Category.objects.create(name='Caisse')
+        self.first = Product.objects.create(
+            name='Produit A', category=category, shop=self.shop,
+            selling_price=Decimal('1000.00'), purchase_price=Decimal('500.00'), current_stock=5,
+        )
+        self.second = Product.objects.create(
+            name='Produit B', category=category, shop=self.shop,
+            selling_price=Decimal('2000.00'), purchase_price=Decimal('800.00'), current_stock=1,
+        )
+
+    def _validate(self, cart):
+        return self.client.post(
+            reverse('sales:validate_sale'),
+            data=json.dumps({'cart': cart, 'payment_method': 'CASH'}),
+            content_type='application/json',
+        )
+
+    def test_sale_deducts_stock_and_computes_total(self):
+        response = self._validate([
+            {'product_id': self.first.id, 'quantity': 2},
+            {'product_id': self.second.id, 'quantity': 1},
+        ])
+
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(response.json()['total'], 4000.0)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.current_stock, self.second.current_stock), (3, 0))
+
+    def test_replayed_idempotency_key_returns_original_sale(self):
+        cart = [{'product_id': self.first.id, 'quantity': 2}]
+        first = self.client.post(
+            reverse('sales:validate_sale'),
+            data=json.dumps({'cart': cart, 'payment_method': 'CASH'}),
+            content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY='caisse-1-abc',
+        ).json()
+        replay = self.client.post(
+            reverse('sales:validate_sale'),
+            data=json.dumps({'cart': cart, 'payment_method': 'CASH', 'idempotency_key': 'caisse-1-abc'}),
+            content_type='application/json',
+        ).json()
+
+        self.assertTrue(replay['success'])
+        self.assertTrue(replay['replayed'])
+        self.assertEqual(replay['sale_id'], first['sale_id'])
+        self.assertEqual(Sale.objects.count(), 1)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.current_stock, 3)
+
+    def test_insufficient_stock_cancels_whole_sale(self):
+        response = self._validate([
+            {'product_id': self.first.id, 'quantity': 2},
+            {'product_id': self.second.id, 'quantity': 2},
+        ])
+
+        self.assertFalse(response.json()['success'])
+        self.assertIn('Produit B', response.json()['error'])
+        self.assertFalse(Sale.objects.exists())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.current_stock, 5)
+
+
+class SaleBuilderTests(TestCase):
+    def setUp(self):
+        self.cashier = User.objects.create_user(username='caisse', password='secret123')
+        self.shop = Shop.objects.create(name='Boutique Test', created_by=self.cashier)
+        category = Category.objects.create(name='Panier')
+        self.products = [
+            Product.objects.create(
+                name=f'Produit {index}', category=category, shop=self.shop,
+                selling_price=Decimal('100.00') + index, purchase_price=Decimal('50.00'), current_stock=10,
+            )
+            for index in range(20)
+        ]
+
+    def _build(self, products):
+        builder = SaleBuilder(shop=self.shop, cashier=self.cashier)
+        for product in products:
+            builder.add(product.id, 2)
+        return builder.build()
+
+    def _count_queries(self, products):
+        with CaptureQueriesContext(connection) as ctx:
+            self._build(products)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_basket_size(self):
+        self.assertEqual(self._count_queries(self.products[:1]), self._count_queries(self.products[1:]))
+
+    def test_sale_total_items_and_stock(self):
+        sale = self._build(self.products[:3])
+
+        self.assertEqual(sale.total, Decimal('606.00'))
+        self.assertEqual(sale.items.count(), 3)
+        self.assertEqual(sale.item_count, 6)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].current_stock, 8)
+
+    def test_repeated_product_lines_are_merged(self):
+        builder = SaleBuilder(shop=self.shop, cashier=self.cashier)
+        builder.add(self.products[0].id, 1).add(self.products[0].id, 2)
+        sale = builder.build()
+
+        self.assertEqual(sale.items.get().quantity, 3)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].current_stock, 7)
+
+    def test_concurrent_duplicate_gets_original_sale_back(self):
+        original = SaleBuilder(shop=self.shop, cashier=self.cashier, idempotency_key='k1').add(self.products[0].id, 10).build()
+
+        # Doublon qui a fait sa vérification avant le commit de l'original
+        duplicate = SaleBuilder(shop=self.shop, cashier=self.cashier, idempotency_key='k1').add(self.products[0].id, 10)
+        real_lookup = duplicate._submitted_sale
+        with mock.patch.object(duplicate, '_submitted_sale', side_effect=[None, real_lookup()]):
+            sale = duplicate.build()
+
+        self.assertEqual(sale.id, original.id)
+        self.assertTrue(duplicate.replayed)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].current_stock, 0)
+
+    def test_idempotency_key_is_scoped_to_cashier(self):
+        other = User.objects.create_user(username='caisse2', password='secret123')
+        first = SaleBuilder(shop=self.shop, cashier=self.cashier, idempotency_key='k1').add(self.products[0].id, 1).build()
+        second = SaleBuilder(shop=self.shop, cashier=other, idempotency_key='k1').add(self.products[0].id, 1).build()
+
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(SaleSubmission.objects.count(), 2)
+
+
+class OfflineSyncTests(TestCase):
+    def setUp(self):
+        cashier_group, _ = Group.objects.get_or_create(name='Cashier')
+        self.cashier = User.objects.create_user(username='caisse', password='secret123')
+        self.cashier.groups.add(cashier_group)
+        self.shop = Shop.objects.create(name='Boutique Test', created_by=self.cashier)
+        self.cashier.profile.shop = self.shop
+        self.cashier.profile.save()
+        self.client.force_login(self.cashier)
+
+        category = Category.objects.create(name='Hors ligne')
+        self.products = [
+            Product.objects.create(
+                name=f'Produit {index}', category=category, shop=self.shop,
+                selling_price=Decimal('100.00'), purchase_price=Decimal('50.00'), current_stock=100,
+            )
+            for index in range(5)
+        ]
+
+    def _sync(self, sales):
+        return self.client.post(
+            reverse('sales:sync'),
+            data=json.dumps({'sales': sales}),
+            content_type='application/json',
+        )
+
+    def _offline_sale(self, key, product, quantity=1, created_at='2026-01-05T10:15:00+01:00'):
+        return {
+            'idempotency_key': key,
+            'cart': [{'product_id': product.id, 'quantity': quantity}],
+            'payment_method': 'CASH',
+            'created_at': created_at,
+        }
+
+    def test_batch_is_applied_with_statuses(self):
+        SaleBuilder(shop=self.shop, cashier=self.cashier, idempotency_key='deja-recue').add(self.products[0].id, 1).build()
+
+        response = self._sync([
+            self._offline_sale('k1', self.products[1], 2),
+            self._offline_sale('deja-recue', self.products[0]),
+            {'idempotency_key': 'k3', 'cart': [{'product_id': 999999, 'quantity': 1}]},
+            self._offline_sale('k1', self.products[1], 2),
+        ])
+        report = response.json()
+
+        self.assertTrue(report['success'])
+        statuses = [result['status'] for result in report['results']]
+        self.assertEqual(statuses, ['created', 'replayed', 'invalid', 'replayed'])
+        self.assertEqual(report['results'][3]['sale_id'], report['results'][0]['sale_id'])
+
+        sale = Sale.objects.get(id=report['results'][0]['sale_id'])
+        self.assertEqual(sale.total, Decimal('200.00'))
+        self.assertEqual(sale.sale_date.date().isoformat(), '2026-01-05')
+        self.products[1].refresh_from_db()
+        self.assertEqual(self.products[1].current_stock, 98)
+
+    def test_negative_stock_is_recorded_and_reported(self):
+        report = self._sync([self._offline_sale('k1', self.products[0], 101)]).json()
+
+        self.assertEqual(report['results'][0]['status'], 'created')
+        self.assertEqual(report['conflicts'], [{'product_id': self.products[0].id, 'name': 'Produit 0', 'stock': -1, 'reserved': 0}])
+
+    def test_offline_price_in_force_during_outage_is_kept(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.selling_price = Decimal('120.00')
+        product.save()
+        sale = self._offline_sale('k1', product, 2, created_at=timezone.now().isoformat())
+        # Catalogue de la caisse chargé avant le changement de prix
+        sale['snapshot_at'] = (timezone.now() - timedelta(hours=1)).isoformat()
+        sale['cart'][0]['unit_price'] = '100.00'
+
+        report = self._sync([sale]).json()
+
+        item = SaleItem.objects.get(sale_id=report['results'][0]['sale_id'])
+        self.assertEqual((item.unit_price, item.subtotal), (Decimal('100.00'), Decimal('200.00')))
+        self.assertEqual(report['price_conflicts'], [])
+        self.assertFalse(OfflinePriceConflict.objects.exists())
+
+    def test_unknown_offline_price_is_capped_and_recorded(self):
+        sale = self._offline_sale('k1', self.products[0], 2)
+        sale['cart'][0]['unit_price'] = '1.00'
+        sale['cart'].append({'product_id': self.products[1].id, 'quantity': 1, 'unit_price': 100})
+
+        report = self._sync([sale]).json()
+
+        item = SaleItem.objects.get(sale_id=report['results'][0]['sale_id'], product=self.products[0])
+        self.assertEqual((item.unit_price, item.subtotal), (Decimal('100.00'), Decimal('200.00')))
+        self.assertEqual(item.sale.total, Decimal('300.00'))
+        self.assertEqual(report['price_conflicts'], [{
+            'idempotency_key': 'k1', 'product_id': self.products[0].id, 'name': 'Produit 0',
+            'unit_price': '1.00', 'price': '100.00',
+        }])
+        conflict = OfflinePriceConflict.objects.get()
+        self.assertEqual((conflict.sale_id, conflict.product_id, conflict.quantity), (item.sale_id, self.products[0].id, 2))
+        self.assertEqual((conflict.offline_price, conflict.booked_price), (Decimal('1.00'), Decimal('100.00')))
+        self.assertFalse(conflict.is_reviewed)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def count(prefix, size):
+            sales = [self._offline_sale(f'{prefix}-{i}', self.products[i % 5]) for i in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                self._sync(sales)
+            return len(ctx.captured_queries)
+
+        # Lignes d'agrégat du jour déjà présentes pour tous les produits
+        count('warm', 5)
+        self.assertEqual(count('small', 2), count('large', 50))
+
+    def test_pos_page_and_offline_assets_render(self):
+        self.assertContains(self.client.get(reverse('sales:pos')), 'PosOffline.init')
+        worker = self.client.get(reverse('sales:pos_service_worker'))
+        self.assertEqual(worker['Content-Type'], 'application/javascript')
+        snapshot = self.client.get(reverse('sales:pos_snapshot')).json()
+        self.assertEqual(len(snapshot['products']), 5)
+
+
+class DailySalesRollupTests(TestCase):
+    def setUp(self):
+        manager_group, _ = Group.objects.get_or_create(name='Manager')
+        self.cashier = User.objects.create_user(username='caisse', password='secret123')
+        self.cashier.groups.add(manager_group)
+        self.shop = Shop.objects.create(name='Boutique Test', created_by=self.cashier)
+        self.cashier.profile.shop = self.shop
+        self.cashier.profile.save()
+        category = Category.objects.create(name='Agrégats')
+        self.first = Product.objects.create(
+            name='Produit A', category=category, shop=self.shop,
+            selling_price=Decimal('1000.00'), purchase_price=Decimal('600.00'), current_stock=50,
+        )
+        self.second = Product.objects.create(
+            name='Produit B', category=category, shop=self.shop,
+            selling_price=Decimal('200.00'), purchase_price=Decimal('50.00'), current_stock=50,
+        )
+
+    def _sell(self, *lines):
+        builder = SaleBuilder(shop=self.shop, cashier=self.cashier)
+        for product, quantity in lines:
+            builder.add(product.id, quantity)
+        return builder.build()
+
+    def _snapshot(self):
+        return (
+            sorted(DailyProductSales.objects.values_list('product_id', 'date', 'quantity', 'revenue', 'cost')),
+            sorted(DailyShopSales.objects.values_list('cashier_id', 'date', 'sale_count', 'item_count', 'revenue', 'cost')),
+        )
+
+    def test_sales_update_rollups_and_match_rebuild(self):
+        self._sell((self.first, 2), (self.second, 1))
+        self._sell((self.first, 1))
+
+        row = DailyProductSales.objects.get(product=self.first)
+        self.assertEqual((row.quantity, row.revenue, row.cost), (3, Decimal('3000.00'), Decimal('1800.00')))
+        shop_row = DailyShopSales.objects.get()
+        self.assertEqual((shop_row.sale_count, shop_row.item_count, shop_row.revenue), (2, 4, Decimal('3200.00')))
+
+        incremental = self._snapshot()
+        rebuild_daily_sales()
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_cancel_and_delete_remove_sale_from_rollups(self):
+        sale = self._sell((self.first, 2))
+        self._sell((self.second, 1))
+
+        sale.is_cancelled = True
+        sale.save()
+        shop_row = DailyShopSales.objects.get()
+        self.assertEqual((shop_row.sale_count, shop_row.revenue), (1, Decimal('200.00')))
+        self.assertEqual(DailyProductSales.objects.get(product=self.first).quantity, 0)
+
+        sale.is_cancelled = False
+        sale.save()
+        self.assertEqual(DailyShopSales.objects.get().sale_count, 2)
+
+        sale.delete()
+        self.assertEqual(DailyShopSales.objects.get().revenue, Decimal('200.00'))
+
+    def test_history_totals_ignore_cancelled_sales_with_any_filter(self):
+        sale = self._sell((self.first, 2))
+        self._sell((self.second, 1))
+        sale.is_cancelled = True
+        sale.save()
+        self.client.force_login(self.cashier)
+        today = timezone.localdate().isoformat()
+
+        for filters in ({}, {'payment_method': 'CASH'}, {'start_date': today, 'end_date': today, 'payment_method': 'CASH'}):
+            response = self.client.get(reverse('sales:sales_history'), filters)
+            self.assertEqual(response.context['total_sales'], 1, filters)
+            self.assertEqual(response.context['total_amount'], Decimal('200.00'), filters)
+
+    def test_product_history_reads_rollup_in_one_query(self):
+        self._sell((self.first, 4))
+        self.client.force_login(self.cashier)
+        url = reverse('inventory:api_history', args=[self.first.id])
+
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(url).json()
+
+        self.assertEqual(data['quantities'][-1], 4)
+        self.assertEqual(len(data['quantities']), 31)
+        self.assertEqual(sum('sales_daily' in query['sql'] for query in ctx.captured_queries), 1)
+
+
+class SaleCostTests(TestCase):
+    """Coût moyen pondéré à la réception et coût figé sur les lignes de vente"""
+
+    def setUp(self):
+        self.cashier = User.objects.create_user(username='caisse', password='secret123')
+        self.shop = Shop.objects.create(name='Boutique Test', created_by=self.cashier)
+        category = Category.objects.create(name='Coûts')
+        self.product = Product.objects.create(
+            name='Produit A', category=category, shop=self.shop,
+            selling_price=Decimal('1000.00'), purchase_price=Decimal('400.00'), current_stock=10,
+        )
+
+    def _receive(self, quantity, price):
+        purchase = Purchase.objects.create(shop=self.shop, supplier='Grossiste', is_received=True)
+        PurchaseItem.objects.create(purchase=purchase, product=self.product, quantity=quantity, purchase_price=price)
+
+    def _sell(self, quantity):
+        return SaleBuilder(shop=self.shop, cashier=self.cashier).add(self.product.id, quantity).build()
+
+    def test_receipts_maintain_weighted_average_cost(self):
+        self._receive(10, Decimal('600.00'))
+        self.product.refresh_from_db()
+        # (10 × 400 + 10 × 600) / 20
+        self.assertEqual(self.product.average_cost, Decimal('500.00'))
+
+        self._sell(15)
+        self._receive(5, Decimal('800.00'))
+        self.product.refresh_from_db()
+        # Les ventes ne changent pas le coût : (5 × 500 + 5 × 800) / 10
+        self.assertEqual(self.product.average_cost, Decimal('650.00'))
+
+    def test_sale_lines_keep_cost_at_sale_time(self):
+        self._receive(10, Decimal('600.00'))
+        sale = self._sell(2)
+        self._receive(10, Decimal('2000.00'))
+
+        item = sale.items.get()
+        self.assertEqual((item.unit_cost, item.cost), (Decimal('500.00'), Decimal('1000.00')))
+        incremental = DailyShopSales.objects.get().cost
+        self.assertEqual(incremental, Decimal('1000.00'))
+        rebuild_daily_sales()
+        self.assertEqual(DailyShopSales.objects.get().cost, incremental)
+
+    def test_backfill_uses_last_receipt_before_each_sale(self):
+        old_sale = self._sell(1)
+        self._receive(10, Decimal('600.00'))
+        new_sale = self._sell(1)
+        SaleItem.objects.update(unit_cost=None, cost=None)
 
-# Create your tests here.
+        self.assertEqual(backfill_sale_costs(chunk_size=1), 2)
+        # Aucune réception avant la première vente : coût moyen actuel, (9 × 400 + 10 × 600) / 19
+        self.assertEqual(old_sale.items.get().unit_cost, Decimal('505.26'))
+        self.assertEqual(new_sale.items.get().cost, Decimal('600.00'))
+        self.assertFalse(SaleItem.objects.filter(cost=None).exists())
@@ -14,6 +14,11 @@ urlpatterns = [
     # Valider une vente
     path('api/validate-sale/', views.validate_sale, name='validate_sale'),
     
+    # Mode hors ligne : synchronisation des ventes en attente, catalogue, service worker
+    path('sync/', views.sync_sales, name='sync'),
+    path('api/snapshot/', views.pos_snapshot, name='pos_snapshot'),
+    path('sw.js', views.pos_service_worker, name='pos_service_worker'),
+    
     # Ticket de caisse
     path('receipt/<int:sale_id>/', views.receipt_view, name='receipt'),
     
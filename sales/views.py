@@ -4,15 +4,28 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.db import transaction
-from django.db.models import Q, Sum
+from django.views.decorators.http import require_POST
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Upper
 from django.contrib import messages
 from django.utils import timezone
 from accounts.decorators import cashier_required
 from products.models import Product
-from .models import Sale, SaleItem
+from products.barcode_index import lookup_barcode, normalize_barcode
+from products.search import ProductSearch
+from inventory.services import InsufficientStock
+from .models import DailyShopSales, Sale, SaleItem
+from .services import OfflineSaleSync, SaleBuilder
 import json
 
+try:
+    # Disponible à la vente : stock moins les réservations des commandes en ligne
+    from store.reservations import available_to_promise
+except ImportError:
+    def available_to_promise(stocks):
+        return dict(stocks)
+
 
 @cashier_required
 def pos_view(request):
@@ -24,7 +37,10 @@ def pos_view(request):
 
     user_shop = request.user.profile.shop
     # Récupérer tous les produits actifs pour la recherche
-    products = Product.objects.filter(shop=user_shop, is_active=True).select_related('category')
+    products = list(Product.objects.filter(shop=user_shop, is_active=True).select_related('category'))
+    available = available_to_promise({product.id: product.current_stock for product in products})
+    for product in products:
+        product.available_stock = available[product.id]
     categories = Category.objects.filter(shop=user_shop)
     
     context = {
@@ -50,19 +66,25 @@ def search_products(request):
         return JsonResponse({'products': []})
     
     if exact_match:
-        # Recherche exacte par code-barres uniquement (pour le scanner)
-        products = Product.objects.filter(shop=user_shop, is_active=True, barcode__iexact=query)
+        # Recherche exacte par code-barres (scanner) : index en mémoire de la boutique
+        product = lookup_barcode(user_shop.id, query) if user_shop else None
+        if product is not None:
+            product['stock'] = available_to_promise({product['id']: product['stock']})[product['id']]
+            return JsonResponse({'products': [product]})
+        # Produit créé dans la transaction en cours, ou boutique absente :
+        # requête servie par l'index (shop, UPPER(barcode))
+        products = Product.objects.annotate(barcode_upper=Upper('barcode')).filter(
+            shop=user_shop, is_active=True, barcode_upper=normalize_barcode(query),
+        )
     else:
-        # Recherche standard (Nom ou Code-barres partiel)
-        products = Product.objects.filter(
-            shop=user_shop,
-            is_active=True,
-        ).filter(
-            Q(name__icontains=query) | Q(barcode__icontains=query)
+        # Recherche standard (Nom ou Code-barres partiel), classée
+        products = ProductSearch(query, fields=('name', 'barcode')).apply(
+            Product.objects.filter(shop=user_shop, is_active=True)
         )
     
     # Limiter à 10 résultats
-    products = products.select_related('category')[:10]
+    products = list(products.select_related('category')[:10])
+    available = available_to_promise({p.id: p.current_stock for p in products})
     
     # Convertir en JSON
     products_data = [{
@@ -71,7 +93,7 @@ def search_products(request):
         'barcode': p.barcode,
         'category': p.category.name if p.category else '',
         'price': float(p.selling_price),
-        'stock': p.current_stock,
+        'stock': available[p.id],
         'image': p.image.url if p.image else None,
     } for p in products]
     
@@ -96,47 +118,36 @@ def validate_sale(request):
         if not cart_items:
             return JsonResponse({'success': False, 'error': 'Le panier est vide'})
         
-        # Créer la vente
-        sale = Sale.objects.create(
+        # Créer la vente en une passe (tout ou rien : une rupture annule la vente)
+        # Clé générée par la caisse : une relance (double clic, timeout) renvoie
+        # la vente déjà créée au lieu d'en créer une seconde.
+        idempotency_key = (request.headers.get('Idempotency-Key') or data.get('idempotency_key') or '').strip()
+        if len(idempotency_key) > 64:
+            return JsonResponse({'success': False, 'error': "Clé d'idempotence invalide"}, status=400)
+        
+        builder = SaleBuilder(
             shop=request.user.profile.shop,
             cashier=request.user,
             payment_method=payment_method,
-            total=0  # Sera calculé automatiquement
+            idempotency_key=idempotency_key,
         )
-        
-        # Créer les lignes de vente
-        total = 0
-        for item in cart_items:
-            product = get_object_or_404(Product, id=item['product_id'])
-            quantity = int(item['quantity'])
-            
-            # Vérifier le stock
-            if product.current_stock < quantity:
-                sale.delete()  # Annuler la vente
-                return JsonResponse({
-                    'success': False,
-                    'error': f'Stock insuffisant pour {product.name} (disponible: {product.current_stock})'
-                })
-            
-            # Créer la ligne de vente
-            SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                quantity=quantity,
-                unit_price=product.selling_price,
-                subtotal=quantity * product.selling_price
-            )
-            
-            total += quantity * product.selling_price
-        
-        # Le total et la déduction du stock sont gérés automatiquement par le modèle
-        sale.refresh_from_db()
+        try:
+            for item in cart_items:
+                builder.add(item['product_id'], item['quantity'])
+            sale = builder.build()
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse({'success': False, 'error': 'Données invalides'}, status=400)
+        except Product.DoesNotExist as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=404)
+        except InsufficientStock as e:
+            return JsonResponse({'success': False, 'error': str(e)})
         
         return JsonResponse({
             'success': True,
             'sale_id': sale.id,
             'total': float(sale.total),
-            'redirect_url': reverse('sales:receipt', args=[sale.id])
+            'redirect_url': reverse('sales:receipt', args=[sale.id]),
+            'replayed': builder.replayed,
         })
         
     except json.JSONDecodeError:
@@ -147,6 +158,62 @@ def validate_sale(request):
         return JsonResponse({'success': False, 'error': f"Erreur serveur: {str(e)}"}, status=500)
 
 
+@cashier_required
+@require_POST
+def sync_sales(request):
+    """
+    Synchronisation des ventes faites hors ligne (file d'attente de la caisse).
+    Reçoit un lot de ventes et les applique en une seule transaction.
+    """
+    try:
+        data = json.loads(request.body)
+        entries = data.get('sales', [])
+        if not isinstance(entries, list):
+            raise ValueError
+    except (json.JSONDecodeError, AttributeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Données invalides'}, status=400)
+    
+    sync = OfflineSaleSync(shop=request.user.profile.shop, cashier=request.user)
+    try:
+        report = sync.apply(entries)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except IntegrityError:
+        # Une clé du lot a été enregistrée en parallèle : le lot entier est
+        # annulé, la caisse le renverra et obtiendra 'replayed'.
+        return JsonResponse({'success': False, 'error': 'Lot en conflit, réessayez'}, status=409)
+    
+    return JsonResponse({'success': True, **report})
+
+
+@cashier_required
+def pos_snapshot(request):
+    """Catalogue de la caisse (prix, stock) pour le mode hors ligne"""
+    products = list(
+        Product.objects.filter(shop=request.user.profile.shop, is_active=True)
+        .values('id', 'name', 'barcode', 'selling_price', 'current_stock', 'category_id')
+    )
+    available = available_to_promise({p['id']: p['current_stock'] for p in products})
+    return JsonResponse({
+        'generated_at': timezone.now().isoformat(),
+        'products': [{
+            'id': p['id'],
+            'name': p['name'],
+            'barcode': p['barcode'],
+            'price': float(p['selling_price']),
+            'stock': available[p['id']],
+            'category': p['category_id'],
+        } for p in products],
+    })
+
+
+def pos_service_worker(request):
+    """Service worker de la caisse (servi sous /pos/ pour couvrir tout l'écran de caisse)"""
+    response = render(request, 'sales/pos_sw.js', content_type='application/javascript')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
 @cashier_required
 def receipt_view(request, sale_id):
     """
@@ -198,31 +265,43 @@ def receipt_view(request, sale_id):
 def sales_history_view(request):
     """Historique des ventes avec filtres"""
     from django.contrib.auth.models import User
-    from datetime import datetime, timedelta
+    from datetime import datetime
+    from reports.services import date_range_q
     
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
     cashier_id = request.GET.get('cashier')
     payment_method = request.GET.get('payment_method')
+    start_day = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+    end_day = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
     
     user_shop = request.user.profile.shop
     
     # Filter by Shop
     sales = Sale.objects.filter(shop=user_shop).select_related('cashier').prefetch_related('items__product')
     
-    if start_date:
-        sales = sales.filter(sale_date__gte=start_date)
-    if end_date:
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-        sales = sales.filter(sale_date__lt=end_date_obj)
+    # Journées locales, comme les agrégats journaliers
+    sales = sales.filter(date_range_q('sale_date', True, start_day, end_day))
     if cashier_id:
         sales = sales.filter(cashier_id=cashier_id)
     if payment_method:
         sales = sales.filter(payment_method=payment_method)
     
     sales = sales.order_by('-sale_date')
-    total_sales = sales.count()
-    total_amount = sales.aggregate(total=Sum('total'))['total'] or 0
+    # Les totaux, quel que soit le chemin, excluent les ventes annulées
+    if payment_method:
+        totals = sales.filter(is_cancelled=False).aggregate(count=Count('id'), total=Sum('total'))
+        total_sales = totals['count']
+        total_amount = totals['total'] or 0
+    else:
+        # Totaux lus sur les agrégats journaliers (ventes non annulées)
+        daily = DailyShopSales.objects.filter(shop=user_shop)
+        daily = daily.filter(date_range_q('date', False, start_day, end_day))
+        if cashier_id:
+            daily = daily.filter(cashier_id=cashier_id)
+        totals = daily.aggregate(count=Sum('sale_count'), total=Sum('revenue'))
+        total_sales = totals['count'] or 0
+        total_amount = totals['total'] or 0
     
     # Filter cashiers by shop
     cashiers = User.objects.filter(profile__shop=user_shop)
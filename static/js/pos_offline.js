@@ -0,0 +1,250 @@
+/**
+ * Caisse hors ligne
+ * - Copie locale (IndexedDB) du catalogue de la caisse : prix et stock.
+ * - File d'attente des ventes faites sans connexion, envoyée par lots à
+ *   /pos/sync/ dès que le réseau revient.
+ * Chaque vente garde sa clé d'idempotence : une vente envoyée deux fois (timeout
+ * puis file d'attente) n'est enregistrée qu'une fois côté serveur.
+ */
+(function (window) {
+    'use strict';
+
+    const DB_NAME = 'redpos-pos';
+    const DB_VERSION = 1;
+    const SYNC_BATCH_SIZE = 200;
+    const SYNC_INTERVAL_MS = 30000;
+    // Date du catalogue local : le serveur vérifie les prix hors ligne avec
+    const SNAPSHOT_AT_KEY = 'redpos-pos-snapshot-at';
+
+    let config = {};
+    let dbPromise = null;
+    let syncing = false;
+
+    function openDb() {
+        if (dbPromise) return dbPromise;
+        dbPromise = new Promise((resolve, reject) => {
+            if (!window.indexedDB) {
+                reject(new Error('IndexedDB indisponible'));
+                return;
+            }
+            const request = indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                if (!db.objectStoreNames.contains('products')) {
+                    db.createObjectStore('products', { keyPath: 'id' });
+                }
+                if (!db.objectStoreNames.contains('queue')) {
+                    db.createObjectStore('queue', { keyPath: 'idempotency_key' });
+                }
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+        return dbPromise;
+    }
+
+    function tx(storeName, mode, work) {
+        return openDb().then(db => new Promise((resolve, reject) => {
+            const transaction = db.transaction(storeName, mode);
+            const store = transaction.objectStore(storeName);
+            const result = work(store);
+            transaction.oncomplete = () => resolve(result && 'result' in result ? result.result : result);
+            transaction.onerror = () => reject(transaction.error);
+        }));
+    }
+
+    function getAll(storeName) {
+        return tx(storeName, 'readonly', store => store.getAll());
+    }
+
+    // ------------------------------------------
+    // Catalogue local
+    // ------------------------------------------
+    function saveSnapshot(products) {
+        return tx('products', 'readwrite', store => {
+            store.clear();
+            products.forEach(product => store.put(product));
+        });
+    }
+
+    function refreshSnapshot() {
+        return fetch(config.snapshotUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => response.ok ? response.json() : Promise.reject(response.status))
+            .then(data => saveSnapshot(data.products).then(() => {
+                try { window.localStorage.setItem(SNAPSHOT_AT_KEY, data.generated_at); } catch (e) { /* mode privé */ }
+                return data.products;
+            }));
+    }
+
+    function adjustLocalStock(lines) {
+        return tx('products', 'readwrite', store => {
+            lines.forEach(line => {
+                const request = store.get(line.product_id);
+                request.onsuccess = () => {
+                    if (request.result) {
+                        request.result.stock -= line.quantity;
+                        store.put(request.result);
+                    }
+                };
+            });
+        });
+    }
+
+    // Stock affiché = dernier catalogue connu
+    function renderStock(products) {
+        const byId = {};
+        products.forEach(product => { byId[product.id] = product; });
+        document.querySelectorAll('.pos-product-card').forEach(card => {
+            const product = byId[parseInt(card.dataset.id)];
+            if (!product) return;
+            const stock = Math.max(product.stock, 0);
+            card.dataset.stock = stock;
+            card.dataset.price = product.price;
+            card.classList.toggle('opacity-50', stock === 0);
+            const badge = card.querySelector('.pos-stock-badge');
+            if (badge) badge.textContent = 'Stock: ' + stock;
+        });
+    }
+
+    function findByBarcode(barcode) {
+        const wanted = (barcode || '').trim().toUpperCase();
+        return getAll('products').then(products =>
+            products.find(product => (product.barcode || '').toUpperCase() === wanted) || null
+        );
+    }
+
+    // ------------------------------------------
+    // File d'attente
+    // ------------------------------------------
+    function snapshotAt() {
+        try { return window.localStorage.getItem(SNAPSHOT_AT_KEY); } catch (e) { return null; }
+    }
+
+    function queueSale(cart, paymentMethod, idempotencyKey) {
+        // Prix affiché à la caisse au moment de la vente : c'est celui encaissé
+        const lines = cart.map(item => ({ product_id: item.product_id, quantity: item.quantity, unit_price: item.price }));
+        const entry = {
+            idempotency_key: idempotencyKey,
+            cart: lines,
+            payment_method: paymentMethod,
+            created_at: new Date().toISOString(),
+            snapshot_at: snapshotAt()
+        };
+        return tx('queue', 'readwrite', store => store.put(entry))
+            .then(() => adjustLocalStock(lines))
+            .then(() => getAll('products'))
+            .then(renderStock)
+            .then(updateStatus);
+    }
+
+    function postBatch(entries) {
+        return fetch(config.syncUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': config.csrfToken(),
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: JSON.stringify({ sales: entries })
+        }).then(response => {
+            if (!response.ok) return Promise.reject(response.status);
+            return response.json();
+        });
+    }
+
+    function removeFromQueue(keys) {
+        return tx('queue', 'readwrite', store => keys.forEach(key => store.delete(key)));
+    }
+
+    function flush() {
+        if (syncing || !navigator.onLine) return Promise.resolve();
+        syncing = true;
+
+        return getAll('queue')
+            .then(entries => {
+                if (!entries.length) return null;
+                entries.sort((a, b) => a.created_at.localeCompare(b.created_at));
+
+                let chain = Promise.resolve();
+                const conflicts = [];
+                const priceConflicts = [];
+                let invalid = 0;
+                for (let i = 0; i < entries.length; i += SYNC_BATCH_SIZE) {
+                    const batch = entries.slice(i, i + SYNC_BATCH_SIZE);
+                    chain = chain
+                        .then(() => postBatch(batch))
+                        .then(report => {
+                            conflicts.push(...report.conflicts);
+                            priceConflicts.push(...(report.price_conflicts || []));
+                            invalid += report.results.filter(result => result.status === 'invalid').length;
+                            // Toutes les ventes du lot ont une réponse définitive
+                            return removeFromQueue(batch.map(entry => entry.idempotency_key));
+                        });
+                }
+                return chain.then(() => {
+                    if (typeof showToast === 'function') {
+                        showToast('success', 'Synchronisation', `${entries.length} vente(s) hors ligne envoyée(s)`);
+                        if (conflicts.length) {
+                            const names = conflicts.map(conflict => conflict.name).join(', ');
+                            showToast('warning', 'Stock négatif', `À recompter : ${names}`);
+                        }
+                        if (priceConflicts.length) {
+                            const names = [...new Set(priceConflicts.map(conflict => conflict.name))].join(', ');
+                            showToast('warning', 'Prix corrigé', `Prix hors ligne non reconnu, à contrôler : ${names}`);
+                        }
+                        if (invalid) {
+                            showToast('error', 'Synchronisation', `${invalid} vente(s) rejetée(s) (produit inconnu ou données invalides)`);
+                        }
+                    }
+                    return refreshSnapshot().then(renderStock);
+                });
+            })
+            .catch(err => console.warn('[POS] Synchronisation reportée', err))
+            .then(() => { syncing = false; return updateStatus(); });
+    }
+
+    function updateStatus() {
+        const badge = document.getElementById('posSyncStatus');
+        if (!badge) return Promise.resolve();
+        return getAll('queue').then(entries => {
+            if (!navigator.onLine) {
+                badge.className = 'badge bg-danger ms-2';
+                badge.textContent = `Hors ligne${entries.length ? ' · ' + entries.length + ' en attente' : ''}`;
+            } else if (entries.length) {
+                badge.className = 'badge bg-warning text-dark ms-2';
+                badge.textContent = `${entries.length} vente(s) à synchroniser`;
+            } else {
+                badge.className = 'badge bg-success ms-2 d-none';
+                badge.textContent = 'En ligne';
+            }
+        }).catch(() => null);
+    }
+
+    function init(options) {
+        config = options;
+
+        if ('serviceWorker' in navigator && config.serviceWorkerUrl) {
+            navigator.serviceWorker.register(config.serviceWorkerUrl).catch(err => console.warn('[POS] Service worker', err));
+        }
+
+        const ready = navigator.onLine
+            ? refreshSnapshot().catch(() => getAll('products'))
+            : getAll('products');
+        ready
+            .then(renderStock)
+            .catch(err => console.warn('[POS] Catalogue local indisponible', err))
+            .then(flush);
+
+        window.addEventListener('online', flush);
+        window.addEventListener('offline', updateStatus);
+        setInterval(flush, SYNC_INTERVAL_MS);
+    }
+
+    window.PosOffline = {
+        init: init,
+        queueSale: queueSale,
+        flush: flush,
+        findByBarcode: findByBarcode,
+        isAvailable: () => !!window.indexedDB
+    };
+})(window);
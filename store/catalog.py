@@ -0,0 +1,326 @@
+"""
+Snapshot versionné du catalogue boutique.
+
+Le JSON des produits injecté dans chaque page SPA (catalogue, panier, checkout,
+fiche produit, studio...) est construit une seule fois, stocké avec un numéro de
+version dans le cache partagé, puis réutilisé tel quel par `get_spa_context`.
+
+- Les signaux (voir store/signals.py) incrémentent la version dès qu'un produit,
+  une catégorie, une promotion ou une config Atelier change, et demandent une
+  reconstruction en arrière-plan après le commit.
+- Chaque worker garde aussi une copie locale : tant que la version partagée ne
+  bouge pas, une page vue ne touche ni l'ORM ni `json.dumps`.
+- Le snapshot expire de lui-même à la prochaine borne de promotion (début ou fin),
+  pour que les prix affichés changent à l'heure exacte sans écriture en base.
+- Le stock n'en fait pas partie : chaque vente ou réception le ferait
+  reconstruire. Le snapshot garde le JSON de chaque produit sans `stock` ni
+  `badge`, complétés à chaque page depuis la carte des stocks (versionnée à
+  part, rechargée en une requête après un mouvement de stock) et les
+  compteurs de réservations (store/reservations.py).
+"""
+import json
+import logging
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from products.models import Product
+from products.services import CustomizationService
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'store:catalog:version'
+SNAPSHOT_KEY = 'store:catalog:snapshot'
+STOCK_VERSION_KEY = 'store:catalog:stock:version'
+STOCK_KEY = 'store:catalog:stock:{version}'
+STOCK_TTL = 600
+LOCK_KEY = 'store:catalog:lock'
+LOCK_TIMEOUT = 60
+
+_local_snapshot = None
+_rebuild_requested = threading.Event()
+_worker_lock = threading.Lock()
+_worker = None
+
+
+def _snapshot_ttl():
+    return getattr(settings, 'STORE_CATALOG_SNAPSHOT_TTL', 600)
+
+
+def get_catalog_version():
+    """Version courante du catalogue (initialisée à l'horodatage si absente du cache)."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Un compteur recréé après éviction ne doit jamais retomber sur une
+        # ancienne valeur : on part de l'horodatage en millisecondes.
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalide le snapshot courant pour tous les workers."""
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return get_catalog_version()
+
+
+def _stock_version():
+    version = cache.get(STOCK_VERSION_KEY)
+    if version is None:
+        cache.add(STOCK_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(STOCK_VERSION_KEY)
+    return version
+
+
+def _bump_stock_version():
+    try:
+        cache.incr(STOCK_VERSION_KEY)
+    except ValueError:
+        _stock_version()
+
+
+def invalidate_catalog_stock():
+    """À appeler après un mouvement de stock : seule la carte des stocks est rechargée."""
+    _bump_stock_version()
+    transaction.on_commit(_bump_stock_version)
+
+
+def catalog_stock():
+    """{product_id: current_stock} des produits actifs, depuis le cache (une requête sinon)."""
+    key = STOCK_KEY.format(version=_stock_version())
+    stock = cache.get(key)
+    if stock is None:
+        stock = dict(Product.objects.filter(is_active=True).values_list('id', 'current_stock'))
+        # Lue dans une transaction, la carte peut refléter des écritures non
+        # validées : partagée seulement après le commit.
+        transaction.on_commit(partial(cache.set, key, stock, timeout=STOCK_TTL))
+    return stock
+
+
+def _is_fresh(snapshot, version, now):
+    if not snapshot or snapshot.get('version') != version or 'fragments' not in snapshot:
+        return False
+    if now - snapshot['built_at'] > _snapshot_ttl():
+        return False
+    expires_at = snapshot.get('expires_at')
+    return expires_at is None or now < expires_at
+
+
+def serialize_catalog_product(product, pricing=None, available=None):
+    """
+    Représentation JSON d'un produit pour le SPA boutique.
+    `available` : disponible à la vente (stock - réservations), stock actuel par défaut.
+    """
+    stock = product.current_stock if available is None else available
+    product_obj = {
+        'id': str(product.id),
+        'name': product.name,
+        'price': float(product.selling_price),
+        'image': product.image.url if product.image else '',
+        'secondary_image': product.secondary_image.url if product.secondary_image else '',
+        'mockup_image': product.mockup_image.url if product.mockup_image else '',
+        'category': product.category.name if product.category else 'Divers',
+        'color_choice': product.color_choice,
+        'custom_color': product.custom_color or '',
+        'color': product.custom_color if product.color_choice == 'autre' and product.custom_color else product.get_color_choice_display(),
+        'material': 'Standard',
+        'customizable': product.is_customizable,
+        'engraving_mode': product.engraving_mode,
+        'engraving_price': float(product.engraving_price),
+        'customization_rules': CustomizationService.get_product_rules(product),
+        'production_delay': product.production_delay_days,
+        'stock': stock,
+        'badge': 'Nouveau' if stock > 0 else 'Épuisé'
+    }
+
+    if pricing is not None:
+        product_obj['pricing'] = {
+            'original_price': float(pricing['original_price']),
+            'discounted_price': float(pricing['discounted_price']),
+            'discount_percent': float(pricing['discount_percent']),
+            'has_promotion': pricing['has_promotion']
+        }
+
+    return product_obj
+
+
+def _next_promotion_boundary(now):
+    """Prochaine date (timestamp) à laquelle une promotion active commence ou se termine."""
+    try:
+        from promotions.index import get_promotion_index
+    except ImportError:
+        return None
+
+    boundary = get_promotion_index().next_boundary(now)
+    return boundary.timestamp() if boundary else None
+
+
+def build_catalog_payload(available=None):
+    """
+    Construit la liste des produits actifs sérialisés (requêtes ORM incluses).
+    `available` : {product_id: disponible}, calculé depuis la base par défaut.
+    """
+    products_qs = (
+        Product.objects.filter(is_active=True)
+        .select_related('category', 'customization_template', 'customization_config')
+        .order_by('-id')
+    )
+
+    products = list(products_qs)
+
+    try:
+        from promotions.utils import price_catalog
+        pricing = price_catalog(products)
+    except ImportError:
+        pricing = {}
+
+    if available is None:
+        from .reservations import available_to_promise
+        available = available_to_promise({product.id: product.current_stock for product in products})
+
+    return [
+        serialize_catalog_product(product, pricing.get(product.id), available.get(product.id, 0))
+        for product in products
+    ]
+
+
+def _fragment(product_obj):
+    """JSON du produit sans stock ni badge, accolade fermante retirée (complété par `_with_stock`)."""
+    product_obj = {key: value for key, value in product_obj.items() if key not in ('stock', 'badge')}
+    return json.dumps(product_obj)[:-1]
+
+
+_BADGES = {True: json.dumps('Nouveau'), False: json.dumps('Épuisé')}
+
+
+def _with_stock(fragments, available):
+    return '[' + ', '.join(
+        f'{fragment}, "stock": {available.get(product_id, 0)}, "badge": {_BADGES[available.get(product_id, 0) > 0]}}}'
+        for product_id, fragment in fragments
+    ) + ']'
+
+
+def rebuild_catalog_snapshot(version=None):
+    """Reconstruit le snapshot et le publie dans le cache partagé."""
+    if version is None:
+        version = get_catalog_version()
+    now = timezone.now()
+
+    payload = build_catalog_payload(available={})
+    snapshot = {
+        'version': version,
+        'built_at': time.time(),
+        'expires_at': _next_promotion_boundary(now),
+        'fragments': [(int(product_obj['id']), _fragment(product_obj)) for product_obj in payload],
+    }
+    # Construit dans une transaction, le snapshot peut contenir des écritures
+    # non validées : il n'est publié qu'après le commit.
+    transaction.on_commit(partial(_publish_snapshot, snapshot))
+    return snapshot
+
+
+def _publish_snapshot(snapshot):
+    global _local_snapshot
+
+    cache.set(SNAPSHOT_KEY, snapshot, timeout=_snapshot_ttl())
+    _local_snapshot = snapshot
+
+
+def _current_snapshot():
+    """
+    Lecture locale si la version n'a pas bougé, puis cache partagé, puis
+    reconstruction. Si un autre worker reconstruit déjà, l'ancien snapshot est
+    servi le temps que le nouveau soit publié.
+    """
+    global _local_snapshot
+
+    version = get_catalog_version()
+    now = time.time()
+
+    if _is_fresh(_local_snapshot, version, now):
+        return _local_snapshot
+
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if _is_fresh(snapshot, version, now):
+        _local_snapshot = snapshot
+        return snapshot
+
+    acquired = cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT)
+    if not acquired and snapshot is not None:
+        return snapshot
+
+    try:
+        return rebuild_catalog_snapshot(version)
+    finally:
+        if acquired:
+            cache.delete(LOCK_KEY)
+
+
+def get_catalog_json():
+    """JSON du catalogue prêt à injecter dans le template, disponible à la vente à jour."""
+    from .reservations import available_to_promise
+
+    snapshot = _current_snapshot()
+    return _with_stock(snapshot['fragments'], available_to_promise(catalog_stock()))
+
+
+def _rebuild_worker():
+    while True:
+        _rebuild_requested.wait()
+        _rebuild_requested.clear()
+        close_old_connections()
+        try:
+            version = get_catalog_version()
+            if _is_fresh(cache.get(SNAPSHOT_KEY), version, time.time()):
+                continue
+            if not cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+                continue
+            try:
+                rebuild_catalog_snapshot(version)
+            finally:
+                cache.delete(LOCK_KEY)
+        except Exception:
+            logger.exception('Catalog snapshot rebuild failed')
+        finally:
+            close_old_connections()
+
+
+def _request_background_rebuild():
+    global _worker
+
+    if not getattr(settings, 'STORE_CATALOG_BACKGROUND_REBUILD', True):
+        return
+
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_rebuild_worker, name='catalog-snapshot', daemon=True)
+            _worker.start()
+    _rebuild_requested.set()
+
+
+def _on_catalog_commit():
+    # Second incrément : un snapshot reconstruit par un autre worker pendant la
+    # transaction (donc sans nos écritures) ne doit pas rester valide.
+    bump_catalog_version()
+    _request_background_rebuild()
+
+
+def invalidate_catalog_snapshot():
+    """
+    À appeler après toute écriture qui change le contenu du catalogue
+    (produits, catégories, prix, règles), pas après un mouvement de stock.
+    La carte des stocks est rechargée aussi (produit ajouté ou désactivé).
+    La reconstruction est lancée une fois la transaction validée ; plusieurs
+    invalidations rapprochées ne déclenchent qu'une seule reconstruction.
+    """
+    bump_catalog_version()
+    invalidate_catalog_stock()
+    transaction.on_commit(_on_catalog_commit)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = "Libère par lots les réservations de stock expirées des commandes en ligne (à lancer toutes les quelques minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Réservations supprimées par transaction')
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"✅ {released} réservation(s) expirée(s) libérée(s)"))
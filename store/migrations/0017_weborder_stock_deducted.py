@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+def mark_existing_orders(apps, schema_editor):
+    # Les commandes déjà payées n'ont jamais touché au stock : on les marque
+    # comme traitées pour qu'un changement de statut ne les déduise pas après coup.
+    WebOrder = apps.get_model('store', 'WebOrder')
+    WebOrder.objects.filter(status__in=['paid', 'shipped', 'delivered']).update(stock_deducted=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_weborder_delivery_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weborder',
+            name='stock_deducted',
+            field=models.BooleanField(default=False, verbose_name='Stock déduit'),
+        ),
+        migrations.RunPython(mark_existing_orders, migrations.RunPython.noop),
+    ]
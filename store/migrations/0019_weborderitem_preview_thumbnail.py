@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weborderitem',
+            name='preview_thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='order_previews/thumbs/', verbose_name="Miniature de l'aperçu"),
+        ),
+    ]
@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from products.models import Product
+from inventory.models import StockMovement
+from inventory.services import StockService
 
 class StoreSettings(models.Model):
     """
@@ -151,6 +153,8 @@ class WebOrder(models.Model):
         ('shipped', 'Expédié'),
         ('delivered', 'Livré'),
     ]
+    # Statuts pour lesquels les articles sont sortis du stock
+    STOCK_DEDUCTED_STATUSES = {'paid', 'shipped', 'delivered'}
     
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     full_name = models.CharField(max_length=255)
@@ -168,6 +172,7 @@ class WebOrder(models.Model):
     
     total_amount = models.DecimalField(max_digits=12, decimal_places=2)
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='pending_payment')
+    stock_deducted = models.BooleanField(default=False, verbose_name="Stock déduit")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -201,6 +206,40 @@ class WebOrder(models.Model):
     def _build_delivery_confirmation_code(self):
         return get_random_string(8, allowed_chars='23456789ABCDEFGHJKLMNPQRSTUVWXYZ')
 
+    def sync_stock(self):
+        """
+        Sort les articles du stock quand la commande passe payée (ou au-delà),
+        les restitue si elle en ressort (annulation). Idempotent : la ligne de la
+        commande est verrouillée pour qu'une double validation ne déduise pas
+        deux fois. Lève InsufficientStock si le stock ne suffit plus.
+        Les réservations de la commande sont libérées dès qu'elle sort du
+        stock ou est annulée.
+        """
+        should_deduct = self.status in self.STOCK_DEDUCTED_STATUSES
+        with transaction.atomic():
+            if should_deduct or self.status == 'cancelled':
+                from .reservations import release_order
+                release_order(self)
+            deducted = type(self).objects.select_for_update().values_list('stock_deducted', flat=True).get(pk=self.pk)
+            if deducted == should_deduct:
+                self.stock_deducted = deducted
+                return
+
+            items = [
+                (product_id, quantity)
+                for product_id, quantity in self.items.values_list('product_id', 'quantity')
+                if product_id
+            ]
+            reference = f"Commande {self.order_number or self.pk}"
+            if should_deduct:
+                # Réservations de la commande déjà libérées : seules celles des autres commandes comptent
+                StockService.decrement(items, reason=StockMovement.WEB_ORDER, reference=reference,
+                                       respect_reservations=True)
+            else:
+                StockService.increment(items, reason=StockMovement.CANCELLATION, reference=reference)
+            type(self).objects.filter(pk=self.pk).update(stock_deducted=should_deduct)
+            self.stock_deducted = should_deduct
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
@@ -286,13 +325,19 @@ class WebOrderItem(models.Model):
         verbose_name="Données personnalisation"
     )
     
-    # Preview sauvegardée
+    # Preview sauvegardée (WebP d'affichage) et sa miniature
     preview_image = models.ImageField(
         upload_to='order_previews/',
         blank=True,
         null=True,
         verbose_name="Aperçu personnalisation"
     )
+    preview_thumbnail = models.ImageField(
+        upload_to='order_previews/thumbs/',
+        blank=True,
+        null=True,
+        verbose_name="Miniature de l'aperçu"
+    )
 
     # Photo client originale
     client_image = models.ImageField(
@@ -326,6 +371,30 @@ class WebOrderItem(models.Model):
         super().save(*args, **kwargs)
 
 
+class StockReservation(models.Model):
+    """
+    Quantité mise de côté pour une commande en ligne pas encore payée.
+    Disponible à la vente (ATP) = stock actuel - réservations en cours ;
+    voir store/reservations.py.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations', verbose_name="Produit")
+    order = models.ForeignKey(WebOrder, on_delete=models.CASCADE, related_name='reservations', verbose_name="Commande")
+    quantity = models.PositiveIntegerField(verbose_name="Quantité")
+    expires_at = models.DateTimeField(verbose_name="Expire le")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Réservation de stock"
+        verbose_name_plural = "Réservations de stock"
+        indexes = [
+            models.Index(fields=['expires_at']),
+            models.Index(fields=['product', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} pour {self.order_id}"
+
+
 class AdminNotification(models.Model):
     """Notification interne visible dans la cloche d'administration."""
 
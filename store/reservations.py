@@ -0,0 +1,186 @@
+"""
+Réservations de stock des commandes en ligne et disponible à la vente (ATP).
+
+- `reserve_order` met de côté les articles d'une commande au checkout, après
+  avoir vérifié, produits verrouillés, que stock - réservations suffit.
+- Les réservations disparaissent quand la commande sort du stock (payée),
+  est annulée ou son paiement rejeté, ou à expiration : `release_expired`
+  (commande `release_reservations`) les supprime par lots.
+- La quantité réservée de chaque produit est un compteur du cache partagé,
+  rangé sous la version de ce produit : lire l'ATP (JSON boutique, caisse)
+  ne fait pas de SUM sur les réservations à chaque requête. Une écriture
+  n'incrémente que la version des produits touchés, maintenant et après le
+  commit : une commande ne fait pas recalculer les compteurs du catalogue
+  entier. Le JSON boutique lit ces compteurs à chaque page :
+  une réservation ne reconstruit pas le snapshot catalogue.
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from inventory.services import InsufficientStock
+from products.models import Product
+from .models import StockReservation
+
+
+VERSION_KEY = 'store:reservations:{product_id}:version'
+COUNTER_KEY = 'store:reservations:{product_id}:{version}'
+# Une réservation expirée reste comptée au plus ce temps si le lot de
+# libération n'est pas encore passé.
+COUNTER_TTL = 600
+RELEASE_BATCH_SIZE = 500
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STORE_RESERVATION_TTL', 48 * 3600))
+
+
+def get_reservations_versions(product_ids):
+    """{product_id: version des réservations du produit} (un get_many)."""
+    keys = {product_id: VERSION_KEY.format(product_id=product_id) for product_id in product_ids}
+    cached = cache.get_many(list(keys.values()))
+    versions = {}
+    for product_id, key in keys.items():
+        version = cached.get(key)
+        if version is None:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            version = cache.get(key)
+        versions[product_id] = version
+    return versions
+
+
+def _bump_versions(product_ids):
+    for product_id in product_ids:
+        try:
+            cache.incr(VERSION_KEY.format(product_id=product_id))
+        except ValueError:
+            get_reservations_versions([product_id])
+
+
+def invalidate_reservations(product_ids):
+    """À appeler après toute écriture sur les réservations des produits `product_ids`."""
+    product_ids = set(product_ids)
+    _bump_versions(product_ids)
+    transaction.on_commit(partial(_bump_versions, product_ids))
+
+
+def _sum_reserved(product_ids, now=None):
+    """{product_id: quantité réservée non expirée}, lu en base (une requête)."""
+    return dict(
+        StockReservation.objects.filter(product_id__in=list(product_ids), expires_at__gt=now or timezone.now())
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .values_list('product_id', 'total')
+    )
+
+
+def reserved_quantities(product_ids):
+    """
+    {product_id: quantité réservée}, depuis les compteurs du cache ; les
+    compteurs absents sont recalculés ensemble (une requête groupée).
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    versions = get_reservations_versions(product_ids)
+    keys = {
+        product_id: COUNTER_KEY.format(product_id=product_id, version=version)
+        for product_id, version in versions.items()
+    }
+    cached = cache.get_many(list(keys.values()))
+    reserved = {product_id: cached[key] for product_id, key in keys.items() if key in cached}
+
+    missing = [product_id for product_id in product_ids if product_id not in reserved]
+    if missing:
+        totals = _sum_reserved(missing)
+        counters = {product_id: totals.get(product_id, 0) for product_id in missing}
+        reserved.update(counters)
+        # Lu dans une transaction, le total peut inclure des réservations non
+        # validées : les compteurs ne sont partagés qu'après le commit.
+        transaction.on_commit(partial(
+            cache.set_many,
+            {keys[product_id]: value for product_id, value in counters.items()},
+            timeout=COUNTER_TTL,
+        ))
+    return reserved
+
+
+def available_to_promise(stocks):
+    """{product_id: stock - réservé} pour `stocks` = {product_id: current_stock}."""
+    reserved = reserved_quantities(stocks.keys())
+    return {product_id: stock - reserved.get(product_id, 0) for product_id, stock in stocks.items()}
+
+
+@transaction.atomic
+def reserve_order(order, ttl=None):
+    """
+    Réserve les articles de la commande (remplace ses réservations
+    éventuelles). Lève InsufficientStock si le disponible ne suffit pas :
+    rien n'est alors réservé.
+    """
+    lines = defaultdict(int)
+    for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+        if product_id:
+            lines[product_id] += quantity
+    previous = set(StockReservation.objects.filter(order=order).values_list('product_id', flat=True))
+    if previous:
+        StockReservation.objects.filter(order=order).delete()
+        invalidate_reservations(previous - set(lines))
+    if not lines:
+        return []
+
+    # Même ordre de verrouillage que StockService : pas d'interblocage avec la caisse
+    products = Product.objects.select_for_update().filter(id__in=list(lines)).only('id', 'name', 'current_stock')
+    products = {product.id: product for product in products.order_by('id')}
+    now = timezone.now()
+    reserved = _sum_reserved(lines.keys(), now=now)
+    for product_id, quantity in lines.items():
+        product = products[product_id]
+        available = product.current_stock - reserved.get(product_id, 0)
+        if quantity > available:
+            raise InsufficientStock(product, quantity, max(available, 0))
+
+    expires_at = now + (ttl or reservation_ttl())
+    reservations = StockReservation.objects.bulk_create([
+        StockReservation(product_id=product_id, order=order, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in lines.items()
+    ])
+    invalidate_reservations(lines)
+    return reservations
+
+
+def release_order(order):
+    """Libère les réservations de la commande. Retourne le nombre supprimé."""
+    product_ids = set(StockReservation.objects.filter(order=order).values_list('product_id', flat=True))
+    if not product_ids:
+        return 0
+    released, _ = StockReservation.objects.filter(order=order).delete()
+    invalidate_reservations(product_ids)
+    return released
+
+
+def release_expired(now=None, batch_size=RELEASE_BATCH_SIZE):
+    """
+    Supprime les réservations expirées par lots de `batch_size` (une
+    transaction chacun). Retourne le nombre supprimé.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        expired = list(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .order_by('id')
+            .values_list('id', 'product_id')[:batch_size]
+        )
+        if not expired:
+            return released
+        with transaction.atomic():
+            released += StockReservation.objects.filter(id__in=[pk for pk, _ in expired]).delete()[0]
+            invalidate_reservations(product_id for _, product_id in expired)
@@ -1,8 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.db.models import Q
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
+from products.models import Category, CustomizableComponent, CustomizationFont, Product, ProductCustomizationConfig
+
+from .catalog import invalidate_catalog_snapshot
 from .models import AdminNotification, WebOrder
 
 
@@ -33,3 +36,38 @@ def create_new_order_notifications(sender, instance, created, **kwargs):
 
     if notifications:
         AdminNotification.objects.bulk_create(notifications)
+
+
+# ==========================================
+# Invalidation du snapshot catalogue
+# ==========================================
+
+CATALOG_SOURCE_MODELS = [Product, Category, ProductCustomizationConfig, CustomizableComponent, CustomizationFont]
+CATALOG_SOURCE_M2M = [
+    ProductCustomizationConfig.allowed_components.through,
+    ProductCustomizationConfig.allowed_fonts.through,
+]
+
+try:
+    from promotions.models import Promotion
+    CATALOG_SOURCE_MODELS.append(Promotion)
+    CATALOG_SOURCE_M2M += [Promotion.products.through, Promotion.categories.through]
+except ImportError:
+    pass
+
+
+def invalidate_catalog_on_change(sender, **kwargs):
+    invalidate_catalog_snapshot()
+
+
+def invalidate_catalog_on_m2m_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_catalog_snapshot()
+
+
+for model in CATALOG_SOURCE_MODELS:
+    post_save.connect(invalidate_catalog_on_change, sender=model, dispatch_uid=f'catalog_save_{model._meta.label}')
+    post_delete.connect(invalidate_catalog_on_change, sender=model, dispatch_uid=f'catalog_delete_{model._meta.label}')
+
+for through in CATALOG_SOURCE_M2M:
+    m2m_changed.connect(invalidate_catalog_on_m2m_change, sender=through, dispatch_uid=f'catalog_m2m_{through._meta.label}')
@@ -6,11 +6,13 @@ import tempfile
 from django.contrib.auth.models import Group, User
 from django.core import mail
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from products.models import Category, Product
-from store.models import AdminNotification, CustomerProfile, ManualPayment, WebOrder
+from store.models import AdminNotification, CustomerProfile, ManualPayment, WebOrder, WebOrderItem
 
 
 class MainContentNestingParser(HTMLParser):
@@ -187,6 +189,231 @@ class ManualPaymentFlowTests(TestCase):
         self.assertEqual(self.order.status, 'awaiting_verification')
 
 
+class WebOrderStockTests(TestCase):
+    def setUp(self):
+        manager_group, _ = Group.objects.get_or_create(name='Manager')
+        self.manager = User.objects.create_user(username='manager', password='secret123', is_staff=True)
+        self.manager.groups.add(manager_group)
+        self.client.force_login(self.manager)
+
+        category = Category.objects.create(name='Bijoux')
+        self.product = Product.objects.create(
+            name='Bracelet',
+            category=category,
+            selling_price=Decimal('10000.00'),
+            purchase_price=Decimal('5000.00'),
+            current_stock=5,
+        )
+        self.order = WebOrder.objects.create(
+            full_name='Client Test',
+            email='client@example.com',
+            phone='+243000000000',
+            address='Adresse test',
+            city='Kinshasa',
+            total_amount=Decimal('20000.00'),
+            status='awaiting_verification',
+        )
+
+    def _add_item(self, quantity):
+        WebOrderItem.objects.create(
+            order=self.order,
+            product=self.product,
+            product_name=self.product.name,
+            quantity=quantity,
+            price=self.product.selling_price,
+        )
+
+    def _set_status(self, status):
+        return self.client.post(
+            reverse('store:admin_weborder_update_status', args=[self.order.id]),
+            {'status': status},
+        )
+
+    def test_stock_is_deducted_once_and_restored_on_cancel(self):
+        self._add_item(2)
+
+        self._set_status('paid')
+        self._set_status('shipped')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 3)
+
+        self._set_status('cancelled')
+        self.product.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 5)
+        self.assertFalse(self.order.stock_deducted)
+
+    def test_insufficient_stock_keeps_previous_status(self):
+        self._add_item(6)
+
+        self._set_status('paid')
+
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.order.status, 'awaiting_verification')
+        self.assertEqual(self.product.current_stock, 5)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        category = Category.objects.create(name='Réservations')
+        self.product = Product.objects.create(
+            name='Gourmette',
+            category=category,
+            selling_price=Decimal('8000.00'),
+            purchase_price=Decimal('4000.00'),
+            current_stock=5,
+        )
+
+    def _order(self, quantity):
+        order = WebOrder.objects.create(
+            full_name='Client Réservation',
+            email='reservation@example.com',
+            phone='+243000000001',
+            address='Adresse test',
+            city='Kinshasa',
+            total_amount=Decimal('8000.00') * quantity,
+            status='awaiting_verification',
+        )
+        WebOrderItem.objects.create(
+            order=order, product=self.product, product_name=self.product.name,
+            quantity=quantity, price=self.product.selling_price,
+        )
+        return order
+
+    def _available(self):
+        from store.reservations import available_to_promise
+
+        self.product.refresh_from_db()
+        return available_to_promise({self.product.id: self.product.current_stock})[self.product.id]
+
+    def test_reservation_blocks_overselling_until_released(self):
+        from inventory.services import InsufficientStock
+        from store.reservations import release_order, reserve_order
+
+        first = self._order(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_order(first)
+        self.assertEqual(self._available(), 2)
+
+        second = self._order(3)
+        with self.assertRaises(InsufficientStock):
+            reserve_order(second)
+        self.assertFalse(second.reservations.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_order(first)
+        self.assertEqual(self._available(), 5)
+
+    def test_paid_order_consumes_its_reservation(self):
+        from store.reservations import reserve_order
+
+        order = self._order(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_order(order)
+            order.status = 'paid'
+            order.save()
+            order.sync_stock()
+
+        self.assertFalse(order.reservations.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 3)
+        self.assertEqual(self._available(), 3)
+
+    def test_pos_cannot_sell_units_reserved_online(self):
+        from accounts.models import Shop
+        from inventory.services import InsufficientStock
+        from sales.services import SaleBuilder
+        from store.reservations import reserve_order
+
+        order = self._order(4)
+        reserve_order(order)
+        cashier = User.objects.create_user(username='caisse', password='secret123')
+        shop = Shop.objects.create(name='Boutique Réservations', created_by=cashier)
+
+        with self.assertRaises(InsufficientStock) as raised:
+            SaleBuilder(shop=shop, cashier=cashier).add(self.product.id, 2).build()
+        self.assertEqual(raised.exception.available, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 5)
+
+        SaleBuilder(shop=shop, cashier=cashier).add(self.product.id, 1).build()
+        order.status = 'paid'
+        order.save()
+        order.sync_stock()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 0)
+
+    def test_expired_reservations_are_released_in_batches(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from store.models import StockReservation
+        from store.reservations import release_expired, reserve_order
+
+        for _ in range(3):
+            reserve_order(self._order(1))
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(release_expired(batch_size=2), 3)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self._available(), 5)
+
+    def test_reserved_counter_is_read_from_cache(self):
+        from store.reservations import reserve_order, reserved_quantities
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_order(self._order(2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reserved_quantities([self.product.id]), {self.product.id: 2})
+        with self.assertNumQueries(0):
+            self.assertEqual(reserved_quantities([self.product.id]), {self.product.id: 2})
+
+    def test_reservation_only_invalidates_its_products(self):
+        from store.reservations import release_order, reserve_order, reserved_quantities
+
+        other = Product.objects.create(
+            name='Collier', category=self.product.category, selling_price=Decimal('5000.00'),
+            purchase_price=Decimal('2000.00'), current_stock=3,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            reserved_quantities([self.product.id, other.id])
+
+        order = self._order(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_order(order)
+        # Seul le compteur du produit commandé est recalculé
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reserved_quantities([self.product.id, other.id]), {self.product.id: 2, other.id: 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_order(order)
+        self.assertEqual(reserved_quantities([self.product.id]), {self.product.id: 0})
+        with self.assertNumQueries(0):
+            self.assertEqual(reserved_quantities([other.id]), {other.id: 0})
+
+    def test_checkout_refuses_cart_beyond_available_stock(self):
+        from store.reservations import reserve_order
+
+        reserve_order(self._order(4))
+        user = User.objects.create_user(username='acheteur', password='secret123', email='acheteur@example.com')
+        self.client.force_login(user)
+        session = self.client.session
+        session['cart'] = {str(self.product.id): {'product_id': str(self.product.id), 'quantity': 2}}
+        session.save()
+
+        response = self.client.post(reverse('store:checkout'), {
+            'payment_method': 'delivery-cash', 'first_name': 'Ache', 'last_name': 'Teur',
+            'email': 'acheteur@example.com', 'phone': '+243970000002', 'address': 'Avenue', 'city': 'Kinshasa',
+        })
+
+        self.assertRedirects(response, reverse('store:checkout'), fetch_redirect_response=False)
+        self.assertFalse(WebOrder.objects.filter(user=user).exists())
+
+
 class StorefrontAccessGuardTests(TestCase):
     def setUp(self):
         self.category = Category.objects.create(name='Bijoux test')
@@ -435,3 +662,174 @@ class CustomerOrderPortalTests(TestCase):
                 parser.main_inside_mobile_menu,
                 msg=f'Main content is nested inside mobile menu for {url}',
             )
+
+
+@override_settings(STORE_CATALOG_BACKGROUND_REBUILD=False)
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from store import catalog
+
+        cache.clear()
+        catalog._local_snapshot = None
+        self.category = Category.objects.create(name='Snapshot')
+        self.product = Product.objects.create(
+            name='Bracelet Snapshot',
+            category=self.category,
+            purchase_price=Decimal('10.00'),
+            selling_price=Decimal('25.00'),
+            current_stock=3,
+        )
+
+    def test_snapshot_is_reused_without_queries(self):
+        from store.catalog import get_catalog_json
+
+        # Le snapshot n'est publié qu'après le commit de la transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            first = get_catalog_json()
+        self.assertIn('Bracelet Snapshot', first)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog_json(), first)
+
+    def test_product_change_invalidates_snapshot(self):
+        import json
+        from store.catalog import get_catalog_json
+
+        get_catalog_json()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.selling_price = Decimal('30.00')
+            self.product.save()
+
+        products = json.loads(get_catalog_json())
+        self.assertEqual(products[0]['price'], 30.0)
+
+    def test_snapshot_expires_at_next_promotion_boundary(self):
+        import json
+        from datetime import timedelta
+        from django.utils import timezone
+        from unittest import mock
+        from promotions.models import Promotion
+        from store.catalog import get_catalog_json
+
+        starts_at = timezone.now() + timedelta(minutes=5)
+        Promotion.objects.create(
+            name='Flash',
+            discount_type='percentage',
+            discount_value=Decimal('20.00'),
+            scope='all_products',
+            start_date=starts_at,
+            end_date=starts_at + timedelta(hours=1),
+            is_active=True,
+        )
+        products = json.loads(get_catalog_json())
+        self.assertFalse(products[0]['pricing']['has_promotion'])
+
+        later = starts_at + timedelta(seconds=1)
+        with mock.patch('store.catalog.time.time', return_value=later.timestamp()), \
+                mock.patch('django.utils.timezone.now', return_value=later):
+            products = json.loads(get_catalog_json())
+        self.assertTrue(products[0]['pricing']['has_promotion'])
+        self.assertEqual(products[0]['pricing']['discounted_price'], 20.0)
+
+    def test_stock_movement_keeps_snapshot_and_updates_stock(self):
+        import json
+        from inventory.services import StockService
+        from store.catalog import get_catalog_json, get_catalog_version
+
+        with self.captureOnCommitCallbacks(execute=True):
+            get_catalog_json()
+        version = get_catalog_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockService.decrement([(self.product.id, 3)])
+
+        self.assertEqual(get_catalog_version(), version)
+        with CaptureQueriesContext(connection) as ctx:
+            products = json.loads(get_catalog_json())
+        self.assertEqual((products[0]['stock'], products[0]['badge']), (0, 'Épuisé'))
+        # Carte des stocks rechargée, catalogue (produits, règles, prix) réutilisé
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_catalog_page_embeds_snapshot(self):
+        from store.catalog import get_catalog_json
+
+        response = self.client.get(reverse('store:catalog'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['products_json'], get_catalog_json())
+
+
+class OrderPreviewDisplayTests(TestCase):
+    """Aperçus de commande affichés en miniature WebP"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        manager_group, _ = Group.objects.get_or_create(name='Manager')
+        self.manager = User.objects.create_user(username='atelier', password='secret123', is_staff=True)
+        self.manager.groups.add(manager_group)
+        self.client.force_login(self.manager)
+        self.order = WebOrder.objects.create(
+            full_name='Client Aperçu', email='apercu@example.com', phone='+243000000003',
+            address='Adresse test', city='Kinshasa', total_amount=Decimal('10000.00'),
+        )
+
+    def test_order_detail_links_thumbnail_instead_of_inline_preview(self):
+        from io import BytesIO
+        from PIL import Image
+        from products.previews import web_variants
+
+        client_preview = 'data:image/png;base64,' + 'A' * 5000
+        item = WebOrderItem.objects.create(
+            order=self.order, product_name='Plaque gravée', quantity=1, price=Decimal('10000.00'),
+            customization_data={'choices': {'engraving': 'Noa'}, 'preview': client_preview},
+        )
+        buffer = BytesIO()
+        Image.new('RGBA', (600, 300), 'white').save(buffer, format='PNG')
+        variants = web_variants(Image.open(buffer))
+        item.preview_image.save('plaque.webp', variants['display'], save=False)
+        item.preview_thumbnail.save('plaque.webp', variants['thumbnail'], save=False)
+        item.save()
+
+        response = self.client.get(reverse('store:admin_weborder_detail', args=[self.order.id]))
+
+        self.assertContains(response, item.preview_thumbnail.url)
+        self.assertContains(response, item.preview_image.url)
+        self.assertNotContains(response, client_preview)
+
+    def test_whatsapp_view_renders_missing_master_on_demand(self):
+        from io import BytesIO
+        from PIL import Image
+        from products.models import Category, CustomizationPreview, CustomizationTemplate, Product
+        from products.previews import queue_preview, render_pending
+        from store.views import WebOrderWhatsAppView
+
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), 'white').save(buffer, format='PNG')
+        template = CustomizationTemplate.objects.create(name='Gravure', rules={'zones': [{
+            'id': 'engraving', 'type': 'text', 'label': 'Gravure',
+            'preview_config': {'position': {'x': 50, 'y': 50}, 'size': 12},
+        }]})
+        product = Product.objects.create(
+            name='Plaque', category=Category.objects.create(name='Atelier'),
+            selling_price=Decimal('10000.00'), purchase_price=Decimal('5000.00'),
+            is_customizable=True, customization_template=template,
+            mockup_image=SimpleUploadedFile('plaque.png', buffer.getvalue(), content_type='image/png'),
+        )
+        preview = queue_preview(product, {'choices': {'engraving': 'Noa'}})
+        render_pending()
+        WebOrderItem.objects.create(
+            order=self.order, product=product, product_name='Plaque', quantity=1, price=Decimal('10000.00'),
+            customization_data={'choices': {'engraving': 'Noa'}, 'preview_id': preview.pk},
+        )
+        self.assertFalse(CustomizationPreview.objects.get(pk=preview.pk).preview_image)
+
+        masters = WebOrderWhatsAppView()._preview_masters([self.order])
+
+        preview.refresh_from_db()
+        self.assertTrue(preview.preview_image.name.endswith('.png'))
+        self.assertEqual(masters, {preview.pk: preview.preview_image.url})
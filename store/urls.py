@@ -19,6 +19,7 @@ urlpatterns = [
     path('account/orders/<str:order_number>/', views.CustomerOrderDetailView.as_view(), name='account_order_detail'),
     path('account/orders/<str:order_number>/invoice/', views.CustomerOrderInvoiceView.as_view(), name='account_order_invoice'),
     path('api/sync-cart/', views.sync_cart, name='sync_cart'),
+    path('api/previews/<int:preview_id>/', views.preview_status, name='preview_status'),
     
     # API endpoints
     path('api/product/<int:product_id>/customization-data/', get_product_customization_data_public, name='get_customization_data'),
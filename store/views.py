@@ -1,4 +1,4 @@
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from django import forms as django_forms
 from django.utils import timezone
 from django.shortcuts import render, get_object_or_404, redirect
@@ -11,6 +11,8 @@ from .models import HeroSection, HeroCard, AboutSection, AboutStat, FooterConfig
 from accounts.models import Shop
 from .forms import HeroSectionForm, HeroCardForm, AboutSectionForm, AboutStatForm, FooterConfigForm, SocialLinkForm, FooterLinkForm, CategoryForm, UniverseForm, CollectionForm, ShopForm, ManualPaymentForm, CustomerAccountForm
 from .services import send_order_confirmation_email
+from .catalog import get_catalog_json
+from .reservations import release_order, reserve_order
 # Promotions
 try:
     from promotions.models import Promotion
@@ -25,7 +27,9 @@ from django.db.models import Count, Q
 from django.db.utils import OperationalError, ProgrammingError
 from products.models import Product
 from products.models import Product, Category
+from inventory.services import InsufficientStock
 from products.services import CustomizationService
+from products.search import ProductSearch
 import json
 
 
@@ -102,6 +106,9 @@ PAYMENT_METHOD_ALIASES = {
     'cash': 'cash',
 }
 
+# Aperçus de personnalisation suivis par session (store:preview_status)
+PREVIEW_SESSION_LIMIT = 50
+
 
 def _normalize_payment_method(value, default='m-pesa'):
     if value is None:
@@ -205,51 +212,10 @@ class SPAContextMixin:
         
         ctx = {}
         
-        # Products - Order by newest first
-        products_qs = _active_store_products_queryset()
-        products_data = []
-        
-        # Try to import pricing function
-        try:
-            from promotions.utils import calculate_product_price
-            has_promo = True
-        except ImportError:
-            has_promo = False
-        
-        for product in products_qs:
-            product_obj = {
-                'id': str(product.id),
-                'name': product.name,
-                'price': float(product.selling_price),
-                'image': product.image.url if product.image else '',
-                'secondary_image': product.secondary_image.url if product.secondary_image else '',
-                'mockup_image': product.mockup_image.url if product.mockup_image else '',
-                'category': product.category.name if product.category else 'Divers',
-                'color_choice': product.color_choice,
-                'custom_color': product.custom_color or '',
-                'color': product.custom_color if product.color_choice == 'autre' and product.custom_color else product.get_color_choice_display(),
-                'material': 'Standard', 
-                'customizable': product.is_customizable, 
-                'engraving_mode': product.engraving_mode,
-                'engraving_price': float(product.engraving_price),
-                'customization_rules': CustomizationService.get_product_rules(product),
-                'production_delay': product.production_delay_days,
-                'stock': product.current_stock,
-                'badge': 'Nouveau' if product.current_stock > 0 else 'Épuisé'
-            }
-            
-            # Add promotion pricing if available
-            if has_promo:
-                pricing = calculate_product_price(product)
-                product_obj['pricing'] = {
-                    'original_price': float(pricing['original_price']),
-                    'discounted_price': float(pricing['discounted_price']),
-                    'discount_percent': float(pricing['discount_percent']),
-                    'has_promotion': pricing['has_promotion']
-                }
-            
-            products_data.append(product_obj)
-        ctx['products_json'] = json.dumps(products_data)
+        # Products - snapshot pré-construit (voir store/catalog.py), sans requête ORM
+        # tant que la version du catalogue n'a pas changé ; le stock est complété
+        # depuis la carte des stocks (une requête après un mouvement de stock).
+        ctx['products_json'] = get_catalog_json()
 
         # Settings
         store_settings = StoreSettings.objects.first()
@@ -374,7 +340,7 @@ class StoreCatalogView(SPAContextMixin, ListView):
         query = self.request.GET.get('search')
         queryset = _active_store_products_queryset()
         if query:
-            return queryset.filter(Q(name__icontains=query) | Q(barcode=query))
+            return self.apply_price_filters(ProductSearch(query, fields=('name',)).apply(queryset))
         # Support filtering by category passed as query param (name or id)
         category_param = self.request.GET.get('category')
         if category_param:
@@ -390,6 +356,36 @@ class StoreCatalogView(SPAContextMixin, ListView):
                 except Exception:
                     # If anything goes wrong, fallback to full queryset
                     pass
+        return self.apply_price_filters(queryset)
+
+    def apply_price_filters(self, queryset):
+        """Filtres/tri sur le prix remisé, en SQL via la table des prix effectifs."""
+        try:
+            from promotions.effective_prices import annotate_effective_price, filter_on_sale
+        except ImportError:
+            return queryset
+
+        params = self.request.GET
+        if params.get('on_sale') in ('1', 'true', 'on'):
+            queryset = filter_on_sale(queryset)
+
+        min_price, max_price = params.get('min_price'), params.get('max_price')
+        sort = params.get('sort')
+        if not (min_price or max_price or sort in ('price_asc', 'price_desc')):
+            return queryset
+
+        queryset = annotate_effective_price(queryset)
+        try:
+            if min_price:
+                queryset = queryset.filter(effective_price__gte=Decimal(min_price))
+            if max_price:
+                queryset = queryset.filter(effective_price__lte=Decimal(max_price))
+        except InvalidOperation:
+            pass
+        if sort == 'price_asc':
+            queryset = queryset.order_by('effective_price', '-id')
+        elif sort == 'price_desc':
+            queryset = queryset.order_by('-effective_price', '-id')
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -622,25 +618,41 @@ class StoreCheckoutView(LoginRequiredMixin, SPAContextMixin, TemplateView):
                         if b64_preview and isinstance(b64_preview, str) and ';base64,' in b64_preview:
                             from django.core.files.base import ContentFile
                             import base64
+                            import io
+                            from PIL import Image
+                            from products.previews import web_variants
                             try:
                                 format, imgstr = b64_preview.split(';base64,')
-                                ext = format.split('/')[-1]
-                                data = ContentFile(base64.b64decode(imgstr), name=f"preview_order_{order.id}_{order_item.id}.{ext}")
-                                order_item.preview_image.save(data.name, data, save=True)
+                                raw = base64.b64decode(imgstr)
+                                name = f"preview_order_{order.id}_{order_item.id}"
+                                try:
+                                    # WebP d'affichage + miniature, depuis un seul décodage
+                                    variants = web_variants(Image.open(io.BytesIO(raw)))
+                                    order_item.preview_image.save(f"{name}.webp", variants['display'], save=False)
+                                    order_item.preview_thumbnail.save(f"{name}.webp", variants['thumbnail'], save=False)
+                                except Exception:
+                                    ext = format.split('/')[-1]
+                                    order_item.preview_image.save(f"{name}.{ext}", ContentFile(raw), save=False)
+                                order_item.save()
                                 preview_saved = True
                             except Exception as e:
                                 print(f"B64 Preview save failed: {e}")
 
                         if not preview_saved and customization.get('preview_id'):
                             from products.models import CustomizationPreview
+                            from products.previews import ensure_rendered
+                            import os
                             try:
-                                preview_obj = CustomizationPreview.objects.get(id=customization['preview_id'])
-                                if preview_obj.preview_image:
-                                    order_item.preview_image.save(
-                                        preview_obj.preview_image.name,
-                                        preview_obj.preview_image.file,
-                                        save=True
-                                    )
+                                preview_obj = ensure_rendered(CustomizationPreview.objects.get(id=customization['preview_id']))
+                                # Variantes WebP ; le PNG sans perte reste sur l'aperçu (atelier)
+                                copies = [('preview_image', preview_obj.display_image or preview_obj.preview_image)]
+                                if preview_obj.thumbnail:
+                                    copies.append(('preview_thumbnail', preview_obj.thumbnail))
+                                for field, source in copies:
+                                    if source:
+                                        with source.open('rb'):
+                                            getattr(order_item, field).save(os.path.basename(source.name), source.file, save=False)
+                                order_item.save()
                             except Exception:
                                 pass
 
@@ -671,6 +683,9 @@ class StoreCheckoutView(LoginRequiredMixin, SPAContextMixin, TemplateView):
 
                 total += final_price * qty
 
+            # Articles mis de côté jusqu'au paiement (ou expiration)
+            reserve_order(order)
+
             delivery_fee = Decimal('0.00')
             delivery_zone_name = ''
             
@@ -770,20 +785,24 @@ class StoreCheckoutView(LoginRequiredMixin, SPAContextMixin, TemplateView):
         delivery_type = request.POST.get('delivery_type', 'delivery').strip()  # 'pickup' or 'delivery'
         delivery_zone_id = request.POST.get('delivery_zone_id', '').strip()  # Only for delivery type
 
-        return self._process_checkout(
-            request,
-            cart,
-            selected_payment_method,
-            first_name,
-            last_name,
-            email,
-            phone,
-            address,
-            city,
-            zip_code,
-            delivery_type,
-            delivery_zone_id,
-        )
+        try:
+            return self._process_checkout(
+                request,
+                cart,
+                selected_payment_method,
+                first_name,
+                last_name,
+                email,
+                phone,
+                address,
+                city,
+                zip_code,
+                delivery_type,
+                delivery_zone_id,
+            )
+        except InsufficientStock as e:
+            messages.error(request, f"Commande non enregistrée : {e}")
+            return redirect('store:checkout')
 class StoreProductDetailView(SPAContextMixin, TemplateView):
     template_name = 'store/product_detail.html'
 
@@ -825,20 +844,23 @@ class StoreProductDetailView(SPAContextMixin, TemplateView):
                 is_active=True
             ).exclude(id=product.id).order_by('-id')[:4]
         
-        # Calculate pricing for each similar product
+        # Calculate pricing for all similar products in one pass
+        similar_products = list(similar_products)
+        try:
+            from promotions.utils import price_catalog
+            similar_pricing = price_catalog(similar_products)
+        except ImportError:
+            similar_pricing = {}
+
         similar_with_pricing = []
         for prod in similar_products:
-            try:
-                from promotions.utils import calculate_product_price
-                pricing = calculate_product_price(prod)
-            except ImportError:
-                pricing = {
-                    'original_price': float(prod.selling_price),
-                    'discounted_price': float(prod.selling_price),
-                    'discount_percent': 0,
-                    'has_promotion': False,
-                    'savings': 0
-                }
+            pricing = similar_pricing.get(prod.id) or {
+                'original_price': float(prod.selling_price),
+                'discounted_price': float(prod.selling_price),
+                'discount_percent': 0,
+                'has_promotion': False,
+                'savings': 0
+            }
             similar_with_pricing.append({
                 'product': prod,
                 'pricing': pricing
@@ -882,6 +904,7 @@ def add_to_cart(request, product_id):
         try:
             data = json.loads(request.body)
             user_customization = data.get('customization', {})
+            preview = None
             
             # Validate
             if product.is_customizable:
@@ -891,17 +914,8 @@ def add_to_cart(request, product_id):
                     extra_cost = CustomizationService.calculate_customization_price(product, user_customization)
                     user_customization['extra_cost'] = float(extra_cost)
                     
-                    # Generate Backend Preview
-                    preview_file = CustomizationService.generate_preview_image(product, user_customization)
-                    if preview_file:
-                        from products.models import CustomizationPreview
-                        preview_obj = CustomizationPreview.objects.create(
-                            product=product,
-                            customization_data=user_customization,
-                            preview_image=preview_file
-                        )
-                        user_customization['preview_url'] = preview_obj.preview_image.url
-                        user_customization['preview_id'] = preview_obj.id
+                    # Aperçu serveur rendu hors requête (products/previews.py)
+                    preview = _queue_cart_preview(request, product, user_customization)
                 except Exception as e:
                      return JsonResponse({'success': False, 'error': str(e)}, status=400)
             else:
@@ -929,7 +943,7 @@ def add_to_cart(request, product_id):
             request.session['cart'] = cart
             request.session.modified = True
             messages.success(request, f"{product.name} ajouté !")
-            return JsonResponse({'success': True})
+            return JsonResponse({'success': True, 'preview': _preview_payload(preview)})
 
         except json.JSONDecodeError:
             return JsonResponse({'success': False, 'error': "Invalid JSON"}, status=400)
@@ -951,6 +965,53 @@ def add_to_cart(request, product_id):
         messages.success(request, f"{product.name} ajouté au panier !")
         return redirect('store:catalog')
 
+def _queue_cart_preview(request, product, customization):
+    """
+    Met en file l'aperçu serveur d'une personnalisation du panier et retient
+    son id dans la session (seul ce client peut en suivre le rendu).
+    """
+    from products.previews import queue_preview
+
+    preview = queue_preview(product, customization)
+    if preview is None:
+        return None
+    customization['preview_id'] = preview.pk
+    preview_ids = request.session.get('preview_ids', [])
+    preview_ids.append(preview.pk)
+    # Seuls les aperçus récents restent consultables
+    request.session['preview_ids'] = preview_ids[-PREVIEW_SESSION_LIMIT:]
+    return preview
+
+
+def _preview_payload(preview):
+    if preview is None:
+        return None
+    return {
+        'id': preview.pk,
+        'status': preview.status,
+        'url': preview.display_image.url if preview.display_image else None,
+        'thumbnail_url': preview.thumbnail.url if preview.thumbnail else None,
+        'status_url': reverse('store:preview_status', args=[preview.pk]),
+    }
+
+
+def preview_status(request, preview_id):
+    """
+    API, état du rendu d'un aperçu du panier. Tant qu'il est en attente,
+    le front garde l'aperçu dessiné côté client.
+    """
+    from products.models import CustomizationPreview
+
+    from products.previews import touch_previews
+
+    if preview_id not in request.session.get('preview_ids', []):
+        return JsonResponse({'error': 'Aperçu introuvable'}, status=404)
+    preview = get_object_or_404(CustomizationPreview, pk=preview_id)
+    # Suivi par un panier ouvert : pas encore bon pour gc_previews
+    touch_previews([preview.pk])
+    return JsonResponse(_preview_payload(preview))
+
+
 def sync_cart(request):
     """
     API, update session cart from JS cart data before checkout.
@@ -969,7 +1030,10 @@ def sync_cart(request):
             cart_data = data.get('cart', [])
             
             # Rebuild session cart
+            previous_cart = request.session.get('cart', {})
             new_cart = {}
+            previews = {}
+            reused = []
             for item in cart_data:
                 # Handle complex item object: { productId, quantity, customization, id (optional) }
                 pid = str(item.get('productId'))
@@ -988,18 +1052,19 @@ def sync_cart(request):
                     cust_hash = hashlib.md5(cust_str.encode()).hexdigest()[:8]
                     cart_key = f"{pid}_{cust_hash}"
                     
-                    if customization and not customization.get('preview_url'):
-                        # Try to generate preview if missing
-                        preview_file = CustomizationService.generate_preview_image(product, customization)
-                        if preview_file:
-                            from products.models import CustomizationPreview
-                            preview_obj = CustomizationPreview.objects.create(
-                                product=product,
-                                customization_data=customization,
-                                preview_image=preview_file
-                            )
-                            customization['preview_url'] = preview_obj.preview_image.url
-                            customization['preview_id'] = preview_obj.id
+                    if customization and customization.get('preview_id'):
+                        reused.append(customization['preview_id'])
+                    elif customization:
+                        # Même personnalisation qu'à la synchronisation précédente : même aperçu
+                        previous = previous_cart.get(cart_key)
+                        previous_customization = previous.get('customization') if isinstance(previous, dict) else None
+                        if previous_customization and previous_customization.get('preview_id'):
+                            customization['preview_id'] = previous_customization['preview_id']
+                            reused.append(customization['preview_id'])
+                        else:
+                            preview = _queue_cart_preview(request, product, customization)
+                            if preview:
+                                previews[cart_key] = _preview_payload(preview)
 
                     new_cart[cart_key] = {
                         'product_id': pid,
@@ -1007,9 +1072,14 @@ def sync_cart(request):
                         'customization': customization
                     }
             
+            if reused:
+                # Le panier est en session, invisible pour gc_previews
+                from products.previews import touch_previews
+                touch_previews(reused)
+
             request.session['cart'] = new_cart
             request.session.modified = True
-            return JsonResponse({'status': 'ok'})
+            return JsonResponse({'status': 'ok', 'previews': previews})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     return JsonResponse({'status': 'error'}, status=405)
@@ -1830,10 +1900,15 @@ class WebOrderDetailView(TemplateView):
         # Préparer les items avec détails de personnalisation
         items_with_details = []
         for item in order.items.all():
+            details = self._parse_customization(item.customization_data, item.product)
+            if details and item.preview_image:
+                # Miniature stockée plutôt que l'aperçu base64 du client, incrusté dans la page
+                details['preview_full'] = item.preview_image.url
+                details['preview'] = (item.preview_thumbnail or item.preview_image).url
             item_data = {
                 'item': item,
                 'has_customization': bool(item.customization_data),
-                'customization_details': self._parse_customization(item.customization_data, item.product)
+                'customization_details': details
             }
             items_with_details.append(item_data)
         
@@ -1946,9 +2021,15 @@ def update_order_status(request, pk):
         new_status = request.POST.get('status')
         
         if new_status in dict(WebOrder.STATUS_CHOICES):
-            order.status = new_status
-            order.save()
-            messages.success(request, f"Statut de la commande #{order.id} mis à jour.")
+            try:
+                with transaction.atomic():
+                    order.status = new_status
+                    order.save()
+                    order.sync_stock()
+            except InsufficientStock as e:
+                messages.error(request, f"Statut non modifié : {e}")
+            else:
+                messages.success(request, f"Statut de la commande #{order.id} mis à jour.")
         else:
             messages.error(request, "Statut invalide.")
     
@@ -1972,6 +2053,7 @@ class WebOrderWhatsAppView(ListView):
         
         prepared_orders = []
         orders_json_list = []
+        masters = self._preview_masters(orders)
 
         for o in orders:
             has_custom = any(item.customization_data for item in o.items.all())
@@ -2012,7 +2094,10 @@ class WebOrderWhatsAppView(ListView):
                     'image': oi.product.image.url if oi.product and oi.product.image else None,
                     'custom': oi.customization_data,
                     'production': oi.production_data,
-                    'preview': oi.preview_image.url if oi.preview_image else None,
+                    'preview': (oi.preview_thumbnail or oi.preview_image).url if oi.preview_image else None,
+                    'preview_full': oi.preview_image.url if oi.preview_image else None,
+                    # PNG sans perte du rendu serveur, pour l'atelier
+                    'preview_master': masters.get(self._preview_id(oi)),
                     'client_photo': oi.client_image.url if oi.client_image else None
                 }
                 order_data['items'].append(item_data)
@@ -2024,6 +2109,35 @@ class WebOrderWhatsAppView(ListView):
         context['status_choices'] = WebOrder.STATUS_CHOICES
         return context
 
+    @staticmethod
+    def _preview_id(order_item):
+        data = order_item.customization_data
+        try:
+            return int(data.get('preview_id')) if isinstance(data, dict) else None
+        except (TypeError, ValueError):
+            return None
+
+    def _preview_masters(self, orders):
+        """
+        {id d'aperçu: URL du PNG sans perte}, en une requête pour toutes les
+        commandes. Un aperçu commandé sans PNG (rendu en file, commande
+        passée avec l'aperçu du navigateur) est rendu à la demande.
+        """
+        from products.models import CustomizationPreview
+        from products.previews import ensure_master
+
+        ids = {self._preview_id(item) for order in orders for item in order.items.all()}
+        ids.discard(None)
+        if not ids:
+            return {}
+        previews = CustomizationPreview.objects.filter(pk__in=ids, status=CustomizationPreview.DONE).select_related('product')
+        masters = {}
+        for preview in previews:
+            ensure_master(preview)
+            if preview.preview_image:
+                masters[preview.pk] = preview.preview_image.url
+        return masters
+
 
 # =============================================================
 # GESTION DES PAIEMENTS MANUELS
@@ -2058,12 +2172,18 @@ def approve_payment(request, pk):
     """Approuver un paiement manuel"""
     payment = get_object_or_404(ManualPayment, id=pk)
     if request.method == 'POST':
-        payment.status = 'approved'
-        payment.verified_at = timezone.now()
-        payment.save()
-        # Mettre à jour le statut de la commande
-        payment.order.status = 'paid'
-        payment.order.save()
+        try:
+            with transaction.atomic():
+                payment.status = 'approved'
+                payment.verified_at = timezone.now()
+                payment.save()
+                # Mettre à jour le statut de la commande (et sortir les articles du stock)
+                payment.order.status = 'paid'
+                payment.order.save()
+                payment.order.sync_stock()
+        except InsufficientStock as e:
+            messages.error(request, f"Paiement non approuvé : {e}")
+            return redirect('store:admin_weborder_detail', pk=payment.order.id)
         messages.success(request, f"✅ Paiement pour la commande #{payment.order.id} approuvé. Statut → Payée.")
     return redirect('store:admin_weborder_detail', pk=payment.order.id)
 
@@ -2078,9 +2198,12 @@ def reject_payment(request, pk):
         payment.rejection_reason = rejection_reason
         payment.verified_at = timezone.now()
         payment.save()
-        # Remettre la commande en attente de paiement
-        payment.order.status = 'pending_payment'
-        payment.order.save()
+        # Remettre la commande en attente de paiement (articles remis en vente)
+        with transaction.atomic():
+            payment.order.status = 'pending_payment'
+            payment.order.save()
+            payment.order.sync_stock()
+            release_order(payment.order)
         messages.warning(request, f"❌ Paiement pour la commande #{payment.order.id} rejeté.")
     return redirect('store:admin_weborder_detail', pk=payment.order.id)
 
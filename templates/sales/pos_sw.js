@@ -0,0 +1,49 @@
+// Service worker de la caisse : garde une copie de l'écran de caisse et de ses
+// ressources pour pouvoir le recharger sans connexion. Réseau d'abord, cache
+// en secours ; les API et la synchronisation ne sont jamais mises en cache.
+const CACHE_NAME = 'redpos-pos-v1';
+const POS_URL = "{% url 'sales:pos' %}";
+const NEVER_CACHE = ["{% url 'sales:sync' %}", "{% url 'sales:pos_snapshot' %}"];
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE_NAME)
+            .then(cache => cache.add(POS_URL))
+            .catch(() => null)
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys.filter(key => key !== CACHE_NAME).map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+    if (url.origin === self.location.origin && NEVER_CACHE.some(path => url.pathname.startsWith(path))) return;
+
+    const cacheable = request.mode === 'navigate'
+        ? url.pathname === POS_URL
+        : ['style', 'script', 'font', 'image'].includes(request.destination);
+    if (!cacheable) return;
+
+    event.respondWith(
+        fetch(request)
+            .then(response => {
+                // Pas de mise en cache d'une redirection (session expirée) ou d'une erreur
+                if (response.ok || response.type === 'opaque') {
+                    const copy = response.clone();
+                    caches.open(CACHE_NAME).then(cache => cache.put(request, copy));
+                }
+                return response;
+            })
+            .catch(() => caches.match(request).then(cached => cached || Response.error()))
+    );
+});